@@ -0,0 +1,60 @@
+-- Replaces the full search responses stored in result_case.results with hit id and score arrays.
+-- Facets, identical for every case of a run, move to result_collection.stats.
+ALTER TABLE result_collection ADD COLUMN IF NOT EXISTS stats JSONB;
+ALTER TABLE result_case ADD COLUMN IF NOT EXISTS hit_ids TEXT[];
+ALTER TABLE result_case ADD COLUMN IF NOT EXISTS hit_scores REAL[];
+ALTER TABLE result_case ADD COLUMN IF NOT EXISTS hit_count INTEGER;
+ALTER TABLE result_case ADD COLUMN IF NOT EXISTS took REAL;
+ALTER TABLE result_case ADD COLUMN IF NOT EXISTS score_stats JSONB;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'result_case' AND column_name = 'results'
+  ) THEN
+    RETURN;
+  END IF;
+
+  UPDATE result_collection rcol
+  SET stats = jsonb_build_object('facets', facets.by_language)
+  FROM (
+    SELECT result_collection_id, jsonb_object_agg(language, unfiltered) AS by_language
+    FROM (
+      SELECT DISTINCT ON (r.result_collection_id, tc.language)
+        r.result_collection_id, tc.language, r.results -> 'stats' -> 'unfiltered' AS unfiltered
+      FROM result_case r JOIN test_case tc ON tc.id = r.test_case_id
+      WHERE jsonb_typeof(r.results -> 'stats') = 'object' AND r.results -> 'stats' ? 'unfiltered'
+      ORDER BY r.result_collection_id, tc.language, r.id
+    ) first_cases
+    GROUP BY result_collection_id
+  ) facets
+  WHERE rcol.id = facets.result_collection_id AND rcol.stats IS NULL;
+
+  UPDATE result_case
+  SET
+    hit_ids = ARRAY(
+      SELECT hit ->> 'id' FROM jsonb_array_elements(results -> 'results') WITH ORDINALITY AS hits(hit, position)
+      ORDER BY position
+    ),
+    hit_scores = ARRAY(
+      SELECT (hit ->> 'score')::REAL FROM jsonb_array_elements(results -> 'results') WITH ORDINALITY AS hits(hit, position)
+      ORDER BY position
+    ),
+    hit_count = (results ->> 'count')::INTEGER,
+    took = CASE jsonb_typeof(results -> 'time')
+      WHEN 'number' THEN (results ->> 'time')::REAL
+      ELSE (results -> 'time' ->> 'took')::REAL
+    END,
+    score_stats = CASE jsonb_typeof(results -> 'stats')
+      WHEN 'object' THEN jsonb_strip_nulls(jsonb_build_object(
+        'score_stats', results -> 'stats' -> 'score_stats',
+        'score_percentiles', results -> 'stats' -> 'score_percentiles'
+      ))
+      ELSE '{}'::JSONB
+    END
+  WHERE results IS NOT NULL AND jsonb_typeof(results -> 'results') = 'array';
+
+  ALTER TABLE result_case DROP COLUMN results;
+END
+$$;
@@ -0,0 +1,44 @@
+-- Metrics of every result collection, computed once when a run ends.
+-- recall_at_k holds Recall@K for K from 0 to 50, so Recall@K is recall_at_k[K + 1].
+CREATE TABLE IF NOT EXISTS result_metrics (
+  result_collection_id INTEGER PRIMARY KEY REFERENCES result_collection(id) ON DELETE CASCADE,
+  total INTEGER NOT NULL,
+  found INTEGER NOT NULL,
+  mrr DOUBLE PRECISION NOT NULL,
+  mean_rank DOUBLE PRECISION NOT NULL,
+  recall_at_k DOUBLE PRECISION[] NOT NULL,
+  computed_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Existing runs are backfilled from a rank histogram per result collection
+WITH histogram AS (
+  SELECT result_collection_id, rank_of_expected AS rank, COUNT(*) AS cases
+  FROM result_case
+  GROUP BY result_collection_id, rank_of_expected
+),
+totals AS (
+  SELECT
+    result_collection_id,
+    SUM(cases) AS total,
+    COALESCE(SUM(cases) FILTER (WHERE rank > 0), 0) AS found,
+    COALESCE(SUM(cases::DOUBLE PRECISION / rank) FILTER (WHERE rank > 0), 0) AS reciprocal,
+    COALESCE(SUM(cases * rank) FILTER (WHERE rank > 0), 0) AS rank_sum
+  FROM histogram
+  GROUP BY result_collection_id
+),
+curves AS (
+  SELECT t.result_collection_id, array_agg(
+    (SELECT COALESCE(SUM(h.cases), 0) FROM histogram h
+     WHERE h.result_collection_id = t.result_collection_id AND h.rank BETWEEN 1 AND k)::DOUBLE PRECISION / t.total
+    ORDER BY k
+  ) AS recall_at_k
+  FROM totals t CROSS JOIN generate_series(0, 50) AS k
+  GROUP BY t.result_collection_id
+)
+INSERT INTO result_metrics (result_collection_id, total, found, mrr, mean_rank, recall_at_k)
+SELECT
+  t.result_collection_id, t.total, t.found, t.reciprocal / t.total,
+  CASE WHEN t.found > 0 THEN t.rank_sum::DOUBLE PRECISION / t.found ELSE 0 END,
+  c.recall_at_k
+FROM totals t JOIN curves c ON c.result_collection_id = t.result_collection_id
+ON CONFLICT (result_collection_id) DO NOTHING;
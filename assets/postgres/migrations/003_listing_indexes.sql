@@ -0,0 +1,3 @@
+-- Indexes backing the paginated listings: tag filters and result cases of a run in id order
+CREATE INDEX IF NOT EXISTS test_case_tags_idx ON test_case USING GIN (tags);
+CREATE INDEX IF NOT EXISTS result_case_collection_idx ON result_case (result_collection_id, id);
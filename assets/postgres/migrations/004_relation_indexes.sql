@@ -0,0 +1,6 @@
+-- Indexes on the foreign keys used by joins and cascading deletes
+CREATE INDEX IF NOT EXISTS test_collection_membership_collection_idx ON test_collection_membership (test_collection_id);
+CREATE INDEX IF NOT EXISTS result_collection_test_collection_idx ON result_collection (test_collection_id);
+CREATE INDEX IF NOT EXISTS result_case_test_case_idx ON result_case (test_case_id);
+CREATE INDEX IF NOT EXISTS comment_result_case_idx ON comment (result_case_id);
+CREATE INDEX IF NOT EXISTS comment_result_collection_idx ON comment (result_collection_id);
@@ -30,6 +30,7 @@ CREATE TABLE result_collection (
   weights JSONB,
   sources TEXT[],
   books TEXT[],
+  stats JSONB,
   timestamp TIMESTAMPTZ DEFAULT NOW()
 );
 
@@ -38,7 +39,11 @@ CREATE TABLE result_case (
   test_case_id INTEGER REFERENCES test_case(id) ON DELETE CASCADE,
   result_collection_id INTEGER REFERENCES result_collection(id) ON DELETE CASCADE,
   rank_of_expected INTEGER,
-  results JSONB,
+  hit_ids TEXT[],
+  hit_scores REAL[],
+  hit_count INTEGER,
+  took REAL,
+  score_stats JSONB,
   timestamp TIMESTAMPTZ DEFAULT NOW()
 );
 
@@ -49,4 +54,21 @@ CREATE TABLE comment (
   content TEXT NOT NULL,
   author TEXT,
   created_at TIMESTAMPTZ DEFAULT NOW()
-);
\ No newline at end of file
+);
+CREATE TABLE result_metrics (
+  result_collection_id INTEGER PRIMARY KEY REFERENCES result_collection(id) ON DELETE CASCADE,
+  total INTEGER NOT NULL,
+  found INTEGER NOT NULL,
+  mrr DOUBLE PRECISION NOT NULL,
+  mean_rank DOUBLE PRECISION NOT NULL,
+  recall_at_k DOUBLE PRECISION[] NOT NULL,
+  computed_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX test_case_tags_idx ON test_case USING GIN (tags);
+CREATE INDEX result_case_collection_idx ON result_case (result_collection_id, id);
+CREATE INDEX test_collection_membership_collection_idx ON test_collection_membership (test_collection_id);
+CREATE INDEX result_collection_test_collection_idx ON result_collection (test_collection_id);
+CREATE INDEX result_case_test_case_idx ON result_case (test_case_id);
+CREATE INDEX comment_result_case_idx ON comment (result_case_id);
+CREATE INDEX comment_result_collection_idx ON comment (result_collection_id);
@@ -27,10 +27,10 @@ def create_comment_for_case(collection_id: int, case_id: int, comment: CommentCr
     with get_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute("""
-                INSERT INTO comment (result_case_id, content, author)
-                VALUES (%s, %s, %s)
+                INSERT INTO comment (result_collection_id, result_case_id, content, author)
+                VALUES (%s, %s, %s, %s)
                 RETURNING id
-            """, (case_id, comment.content, comment.author))
+            """, (collection_id, case_id, comment.content, comment.author))
             comment_id = cursor.fetchone()[0]
             conn.commit()
             return {"id": comment_id}
@@ -41,7 +41,7 @@ def get_comments_for_collection(collection_id: int):
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("""
-                SELECT * FROM comment WHERE result_collection_id = %s ORDER BY created_at ASC
+                SELECT * FROM comment WHERE result_collection_id = %s AND result_case_id IS NULL ORDER BY created_at ASC
             """, (collection_id,))
             return cursor.fetchall()
 
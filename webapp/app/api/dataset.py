@@ -1,20 +1,27 @@
 from fastapi import APIRouter
 from app.services.dataset_info import list_available_datasets, list_language_datasets
 from app.services import data_indexer
+from app.services.dataset_reader import DATA_DIR
+from app.services.jobs import submit_job
 
 router = APIRouter()
 
 @router.post("/api/data")
-def api_index_all():
-    return data_indexer.index_all()
+def api_index_all(bulk_load: bool = data_indexer.BULK_LOAD_DEFAULT):
+    jobs = {}
+    for language in list_available_datasets():
+        jobs[language] = submit_job("index_language", language, bulk_load=bulk_load).id
+    return {"success": True, "message": "Indexing of every dataset started", "jobs": jobs}
 
 @router.post("/api/data/{language}")
-def api_index_language(language: str):
-    return data_indexer.index_language(language)
+def api_index_language(language: str, bulk_load: bool = data_indexer.BULK_LOAD_DEFAULT):
+    job = submit_job("index_language", language, bulk_load=bulk_load)
+    return {"success": True, "message": f"Indexing of {language} started", "jobId": job.id}
 
 @router.post("/api/data/{language}/{dataset}")
-def api_index_dataset(language: str, dataset: str):
-    return data_indexer.index_dataset(language, dataset)
+def api_index_dataset(language: str, dataset: str, bulk_load: bool = data_indexer.BULK_LOAD_DEFAULT):
+    job = submit_job("index_dataset", language, dataset=dataset, bulk_load=bulk_load)
+    return {"success": True, "message": f"Indexing of {dataset} started", "jobId": job.id}
 
 @router.get("/api/data")
 def get_all_datasets():
@@ -29,15 +36,21 @@ def get_datasets_for_language(language: str):
 
 @router.delete("/api/data")
 def api_delete_all():
-    return data_indexer.delete_all()
+    jobs = {}
+    for lang_dir in DATA_DIR.iterdir():
+        if lang_dir.is_dir():
+            jobs[lang_dir.name] = submit_job("delete_language", lang_dir.name).id
+    return {"success": True, "message": "Deletion of every dataset started", "jobs": jobs}
 
 @router.delete("/api/data/{language}")
 def api_delete_language(language: str):
-    return data_indexer.delete_language(language)
+    job = submit_job("delete_language", language)
+    return {"success": True, "message": f"Deletion of {language} started", "jobId": job.id}
 
 @router.delete("/api/data/{language}/{dataset}")
 def api_delete_dataset(language: str, dataset: str):
-    return data_indexer.delete_dataset(language, dataset)
+    job = submit_job("delete_dataset", language, dataset=dataset)
+    return {"success": True, "message": f"Deletion of {dataset} started", "jobId": job.id}
 
 @router.delete("/api/data/{language}/{dataset}/embedding")
 def api_delete_embedding_cache(language: str, dataset: str):
@@ -1,39 +1,73 @@
-from fastapi import APIRouter
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, Response
+from app.services.frontend_cache import FRONTEND_RELOAD, Asset, get_page, get_static, refresh
 
 router = APIRouter()
 
-@router.get("/", response_class=HTMLResponse)
-async def read_index():
-    with open("frontend/index.html") as f:
-        return HTMLResponse(content=f.read())
-
-@router.get("/test-cases", response_class=HTMLResponse)
-async def read_test():
-    with open("frontend/test.html") as f:
-        return HTMLResponse(content=f.read())
-
-@router.get("/test-collections", response_class=HTMLResponse)
-async def read_test():
-    with open("frontend/test-collections.html") as f:
-        return HTMLResponse(content=f.read())
-
-@router.get("/test-collections/{collection_id}/results", response_class=HTMLResponse)
-async def serve_results_page(collection_id: int):
-    with open("frontend/result-collections.html") as f:
-        return HTMLResponse(content=f.read())
-
-@router.get("/test-collections/{test_collection_id}/results/{result_collection_id}", response_class=HTMLResponse)
-async def serve_results_page(test_collection_id: int, result_collection_id: int):
-    with open("frontend/result-collection.html") as f:
-        return HTMLResponse(content=f.read())
-
-@router.get("/test-collections/{test_collection_id}/results/{result_collection_id}/cases/{case_id}", response_class=HTMLResponse)
-async def serve_results_page(test_collection_id: int, result_collection_id: int, case_id: int):
-    with open("frontend/result-case.html") as f:
-        return HTMLResponse(content=f.read())
-
-@router.get("/admin", response_class=HTMLResponse)
-async def read_index():
-    with open("frontend/admin.html") as f:
-        return HTMLResponse(content=f.read())
\ No newline at end of file
+STATIC_IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+async def refresh_frontend():
+    # Checking for changed files walks the frontend folder, which must not block the event loop
+    if FRONTEND_RELOAD:
+        await run_in_threadpool(refresh)
+
+
+def asset_response(asset: Asset, request: Request, cache_control: str) -> Response:
+    # Served from memory: 304 when the browser copy is current, otherwise the best accepted encoding
+    encoding = asset.select_encoding(request.headers.get("accept-encoding"))
+    headers = {"ETag": asset.etag(encoding), "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if asset.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=asset.encodings[encoding], media_type=asset.media_type, headers=headers)
+
+
+async def page_response(name: str, request: Request) -> Response:
+    await refresh_frontend()
+    page = get_page(name)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return asset_response(page, request, REVALIDATE)
+
+
+@router.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def serve_static(path: str, request: Request):
+    await refresh_frontend()
+    asset = get_static(path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    # Fingerprinted URLs change with the content, so they never need revalidation
+    cache_control = STATIC_IMMUTABLE if request.query_params.get("v") == asset.digest else REVALIDATE
+    return asset_response(asset, request, cache_control)
+
+@router.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def read_index(request: Request):
+    return await page_response("index.html", request)
+
+@router.api_route("/test-cases", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def read_test(request: Request):
+    return await page_response("test.html", request)
+
+@router.api_route("/test-collections", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def read_test_collections(request: Request):
+    return await page_response("test-collections.html", request)
+
+@router.api_route("/test-collections/{collection_id}/results", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def serve_result_collections_page(collection_id: int, request: Request):
+    return await page_response("result-collections.html", request)
+
+@router.api_route("/test-collections/{test_collection_id}/results/{result_collection_id}", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def serve_result_collection_page(test_collection_id: int, result_collection_id: int, request: Request):
+    return await page_response("result-collection.html", request)
+
+@router.api_route("/test-collections/{test_collection_id}/results/{result_collection_id}/cases/{case_id}", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def serve_result_case_page(test_collection_id: int, result_collection_id: int, case_id: int, request: Request):
+    return await page_response("result-case.html", request)
+
+@router.api_route("/admin", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def read_admin(request: Request):
+    return await page_response("admin.html", request)
@@ -1,10 +1,16 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.services.admission import snapshot
 from app.services.elastic import ping_elasticsearch
+from app.services.warmup import is_ready, warmup_state
 
 router = APIRouter()
 
 @router.get("/api/health")
 def health_check():
-    if ping_elasticsearch():
-        return {"status": "ok", "elasticsearch": "connected"}
-    return {"status": "error", "elasticsearch": "unreachable"}
\ No newline at end of file
+    admission = snapshot()
+    if not ping_elasticsearch():
+        return JSONResponse(status_code=503, content={"status": "error", "elasticsearch": "unreachable", "warmup": warmup_state, "admission": admission})
+    if not is_ready():
+        return JSONResponse(status_code=503, content={"status": "warming", "elasticsearch": "connected", "warmup": warmup_state, "admission": admission})
+    return {"status": "ready", "elasticsearch": "connected", "warmup": warmup_state, "admission": admission}
\ No newline at end of file
@@ -1,17 +1,24 @@
 from fastapi import APIRouter, HTTPException
-from app.services.index_manager import SUPPORTED_LANGUAGES, create_index, delete_index, reload_index
+from app.services.index_manager import SUPPORTED_LANGUAGES, create_index, delete_index
+from app.services.jobs import list_jobs
+from app.services.reindexer import start_rebuild
 
 router = APIRouter()
 
 @router.post("/api/indices/{language}/reload")
 def reload_language_index(language: str):
-    return reload_index(language)
+    return start_rebuild(language)
+
+@router.get("/api/indices/{language}/reload")
+def get_reload_status(language: str):
+    rebuilds = list_jobs("rebuild", language)
+    return rebuilds[0].to_dict() if rebuilds else {"status": "idle"}
 
 @router.post("/api/indices/reload")
 def reload_all_indices():
     results = {}
     for lang in SUPPORTED_LANGUAGES:
-        results[lang] = reload_index(lang)
+        results[lang] = start_rebuild(lang)
     return results
 
 @router.post("/api/indices/{language}")
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException
+from typing import Optional
+from app.services import jobs
+
+router = APIRouter(prefix="/api/jobs", tags=["Jobs"])
+
+
+@router.get("/")
+def list_jobs(kind: Optional[str] = None, language: Optional[str] = None):
+    return [job.to_dict() for job in jobs.list_jobs(kind, language)]
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@router.delete("/{job_id}")
+def cancel_job(job_id: str):
+    job = jobs.cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
\ No newline at end of file
@@ -1,31 +1,27 @@
-import os
-import re
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from typing import Optional
+from app.services.log_reader import clear_log, tail_log
+from app.services.pagination import PAGE_DEFAULT_LIMIT, check_limit
 
 router = APIRouter(prefix="/api/logs", tags=["Logs"])
-log_dir = os.path.join(os.getcwd(), 'logs')
-log_file = os.path.join(log_dir, 'webapp.log')
-log_re = re.compile(r"\[(.*)\]\[(.*)\]\[(.*)\] (.*)")
-
-def parseLog(line: str) -> dict:
-    match = log_re.findall(line)
-    if not match:
-        return {}
-    return {
-        "timestamp": match[0][0],
-        "level": match[0][1],
-        "service": match[0][2],
-        "message": match[0][3],
-    }
 
 
 @router.get("/")
-def get_log():
-    with open(log_file, "r", encoding="utf-8") as f:
-        return [parseLog(line) for line in f.readlines()]
+def get_log(
+    limit: int = PAGE_DEFAULT_LIMIT,
+    before: Optional[str] = None,
+    level: Optional[str] = None,
+    service: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    # Read from the end of the log, older pages are requested with ?before=<next>
+    try:
+        return tail_log(check_limit(limit), before, level, service, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.delete("/")
 def delete_log():
-    with open(log_file, "w", encoding="utf-8") as f:
-        pass
\ No newline at end of file
+    clear_log()
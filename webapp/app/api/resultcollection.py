@@ -1,11 +1,13 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
-import io
-import csv
 import logging
-import zipfile
+from typing import Optional
 from psycopg2.extras import RealDictCursor
-from app.services.db import get_connection
+from app.services.db import execute_prepared, get_connection
+from app.services.pagination import PAGE_DEFAULT_LIMIT, check_limit, make_page, select_columns
+from app.services.result_metrics import compute_metrics, fetch_histograms, store_metrics
+from app.services.result_export import iter_result_collection_zip
+from app.services.result_store import expand_result
 
 router = APIRouter(prefix="/api/result-collections", tags=["Result collections"])
 logger = logging.getLogger(__name__)
@@ -23,100 +25,91 @@ def get_result_collection(collection_id):
                 WHERE rc.id = %s
             """, (collection_id,))
             meta = cursor.fetchone()
-
-            # Retrieve cases
-            cases = get_result_cases_for_collection(collection_id)
-
-            # Computes statistics
-            logger.info("Computing statistics")
-            total = len(cases)
-            ranks = [case["rank_of_expected"] for case in cases]
-            found_ranks = [r for r in ranks if r > 0]
-            def recall_at_k(k):
-                return sum(1 for r in found_ranks if r <= k) / total if total > 0 else 0.0
-            def mrr():
-                return sum(1 / r for r in found_ranks) / total if total > 0 else 0.0
-            def mean_rank():
-                return sum(found_ranks) / len(found_ranks) if found_ranks else 0.0
-
-            return {
-                "metadata": meta,
-                "statistics": {
-                    "total": total,
-                    "recallAtK": [recall_at_k(k) for k in range(0, 51)],
-                    "mrr": mrr(),
-                    "meanRank": mean_rank(),
-                },
-                "cases": cases,
-            }
+            if meta is None:
+                raise HTTPException(status_code=404, detail="Result collection not found")
+
+            # Retrieve metrics, computed when the run ended or now for older runs
+            execute_prepared(cursor, "result_metrics_by_collection", (int(collection_id),))
+            metrics = cursor.fetchone()
+
+        # Exact ranks for the box plot, as the recall curve stops at RECALL_MAX_K
+        with conn.cursor() as cursor:
+            histogram = fetch_histograms(cursor, [int(collection_id)])[int(collection_id)]
+            if metrics is None:
+                metrics = compute_metrics(histogram)
+                store_metrics(cursor, {int(collection_id): metrics})
+
+    # Retrieve the first page of cases, the following ones are listed through /cases
+    cases = get_result_cases_for_collection(int(collection_id))
+
+    return {
+        "metadata": meta,
+        "statistics": {
+            "total": metrics["total"],
+            "found": metrics["found"],
+            "recallAtK": metrics["recall_at_k"],
+            "mrr": metrics["mrr"],
+            "meanRank": metrics["mean_rank"],
+            "rankHistogram": sorted([rank, count] for rank, count in histogram.items() if rank > 0),
+        },
+        "cases": cases["items"],
+        "casesNext": cases["next"],
+    }
 
 
 @router.get("/{collection_id}/csv")
-def get_result_collection_as_csv(collection_id):
-    memory_zip = io.BytesIO()
-
-    with get_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("""
-                SELECT tc.id, tc.source, tc.content, tc.target, rc.results
-                FROM result_case rc JOIN test_case tc ON rc.test_case_id = tc.id
-                WHERE rc.result_collection_id = %s
-            """, (collection_id,))
-            test_cases = cursor.fetchall()
-
-    with zipfile.ZipFile(memory_zip, "w", zipfile.ZIP_DEFLATED) as zf:
-        for index, test_case in enumerate(test_cases):
-            data = []
-            max_variant = 0
-            for idx, result in enumerate(test_case["results"]["results"]):
-                entry = {
-                    "source": test_case["source"],
-                    "query": test_case["content"],
-                    "target": test_case["target"],
-                    "position": idx + 1,
-                    "found": test_case["target"] == result["id"],
-                    "id": result["id"],
-                    "content": result["content"],
-                }
-                for v_idx, variant in enumerate(result.get("variant", [])):
-                    entry[f"variant_{v_idx + 1}_source"] = variant["source"]
-                    entry[f"variant_{v_idx + 1}_content"] = variant["content"]
-                    if v_idx + 1 > max_variant:
-                        max_variant = v_idx + 1
-                data.append(entry)
-
-            fieldnames = ["source", "query", "target", "position", "found", "id", "content"]
-            for i in range(1, max_variant + 1):
-                fieldnames.append(f"variant_{i}_source")
-                fieldnames.append(f"variant_{i}_content")
-
-            csv_buffer = io.StringIO()
-            writer = csv.DictWriter(csv_buffer, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(data)
-            csv_bytes = csv_buffer.getvalue().encode("utf-8")
-            zf.writestr(f"test_case_{test_case['id']}.csv", csv_bytes)
-
-    memory_zip.seek(0)
+def get_result_collection_as_csv(collection_id: int):
+    logger.info(f"Exporting result collection {collection_id}")
     return StreamingResponse(
-        memory_zip,
+        iter_result_collection_zip(collection_id),
         media_type="application/zip",
         headers={"Content-Disposition": f"attachment; filename=collection_{collection_id}.zip"}
     )
 
 
+RESULT_CASE_COLUMNS = {
+    "id": "rc.id",
+    "test_case_id": "rc.test_case_id",
+    "source": "tc.source",
+    "content": "tc.content",
+    "context": "tc.context",
+    "language": "tc.language",
+    "target": "tc.target",
+    "rank_of_expected": "rc.rank_of_expected",
+}
+RESULT_CASE_LIST_FIELDS = ["test_case_id", "source", "content", "language", "target", "rank_of_expected"]
+
+
 @router.get("/{collection_id}/cases")
-def get_result_cases_for_collection(collection_id):
+def get_result_cases_for_collection(
+    collection_id: int,
+    after: Optional[int] = None,
+    limit: int = PAGE_DEFAULT_LIMIT,
+    total: bool = False,
+    fields: Optional[str] = None,
+):
     logger.info(f"Retrieving result cases for collection {collection_id}")
+    try:
+        columns = select_columns(fields, RESULT_CASE_COLUMNS, RESULT_CASE_LIST_FIELDS)
+        limit = check_limit(limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("""
-                SELECT rc.id, rc.test_case_id, tc.source, tc.content, tc.language, tc.target, rc.rank_of_expected
+            # Keyset pagination on the (result_collection_id, id) index
+            cursor.execute(f"""
+                SELECT {", ".join(columns)}
                 FROM test_case tc JOIN result_case rc ON tc.id = rc.test_case_id
-                WHERE rc.result_collection_id = %s
+                WHERE rc.result_collection_id = %s AND (%s::integer IS NULL OR rc.id > %s)
                 ORDER BY rc.id
-            """, (collection_id,))
-            return cursor.fetchall()
+                LIMIT %s
+            """, (collection_id, after, after, limit + 1))
+            rows = cursor.fetchall()
+            count = None
+            if total:
+                cursor.execute("SELECT COUNT(*) AS count FROM result_case WHERE result_collection_id = %s", (collection_id,))
+                count = cursor.fetchone()["count"]
+    return make_page(rows, limit, count)
 
 
 @router.get("/{collection_id}/cases/{case_id}")
@@ -125,8 +118,18 @@ def get_result_case(collection_id: int, case_id: int):
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("""
-                SELECT tc.source, tc.content, tc.context, tc.language, tc.target, rc.rank_of_expected, rc.results, rc.timestamp
-                FROM test_case tc JOIN result_case rc ON tc.id = rc.test_case_id
-                WHERE rc.id = %s
-            """, (case_id,))
-            return cursor.fetchone()
+                SELECT tc.source, tc.content, tc.context, tc.language, tc.target, rc.rank_of_expected,
+                    rc.hit_ids, rc.hit_scores, rc.hit_count, rc.took, rc.score_stats, rc.timestamp,
+                    rcol.stats -> 'facets' -> tc.language AS facets
+                FROM test_case tc
+                JOIN result_case rc ON tc.id = rc.test_case_id
+                JOIN result_collection rcol ON rcol.id = rc.result_collection_id
+                WHERE rc.id = %s AND rc.result_collection_id = %s
+            """, (case_id, collection_id))
+            row = cursor.fetchone()
+    if row is None:
+        return None
+    # Hits are stored as ids and scores, their text is resolved from the index when the case is opened
+    case = {name: row[name] for name in ("source", "content", "context", "language", "target", "rank_of_expected", "timestamp")}
+    case["results"] = expand_result(row["language"], row, row["facets"])
+    return case
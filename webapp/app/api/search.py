@@ -1,7 +1,10 @@
+import time
 from fastapi import APIRouter, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 from pydantic import BaseModel
-from app.services.search_engine import search
+from app.services.search_engine import search, multi_search, format_server_timing
 
 class SearchRequest(BaseModel):
     query: str
@@ -30,11 +33,31 @@ class SearchRequest(BaseModel):
     # Score stats
     score_stats: bool = False
 
+    # Forward Elasticsearch profile output
+    profile: bool = False
+
+
+class MultiSearchRequest(SearchRequest):
+    languages: List[str]
+
+    # Add a ranking merged across languages
+    merge: bool = False
+
+
+def timed_response(result: dict) -> JSONResponse:
+    # Serialization happens after the body is built, so it is only reported in the header
+    start = time.perf_counter()
+    response = JSONResponse(content=jsonable_encoder(result))
+    timings = dict(result["time"])
+    timings["serialize"] = (time.perf_counter() - start) * 1000
+    response.headers["Server-Timing"] = format_server_timing(timings)
+    return response
+
 
 router = APIRouter()
 @router.post("/api/search/{language}")
 def search_endpoint(language: str, body: SearchRequest):
-    return search(
+    result = search(
         language=language,
         query_text=body.query,
         text_weight=body.text_weight,
@@ -48,5 +71,30 @@ def search_endpoint(language: str, body: SearchRequest):
         books=body.books,
         sources=body.sources,
         size=body.size,
-        score_stats=body.score_stats
-    )
\ No newline at end of file
+        score_stats=body.score_stats,
+        profile=body.profile,
+    )
+    return timed_response(result)
+
+
+@router.post("/api/search")
+def multi_search_endpoint(body: MultiSearchRequest):
+    result = multi_search(
+        languages=body.languages,
+        query_text=body.query,
+        text_weight=body.text_weight,
+        shingle_weight=body.shingle_weight,
+        trigram_weight=body.trigram_weight,
+        variant_text_weight=body.variant_text_weight,
+        variant_shingle_weight=body.variant_shingle_weight,
+        variant_trigram_weight=body.variant_trigram_weight,
+        semantic_weight=body.semantic_weight,
+        variant_semantic_weight=body.variant_semantic_weight,
+        books=body.books,
+        sources=body.sources,
+        size=body.size,
+        score_stats=body.score_stats,
+        merge=body.merge,
+        profile=body.profile,
+    )
+    return timed_response(result)
\ No newline at end of file
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from typing import List, Optional
+from psycopg2.extras import RealDictCursor
 from app.models.testcase import TestCase, TestCaseWithID
-from app.services.db import get_connection
+from app.services.db import get_connection, run_query_async
+from app.services.pagination import PAGE_DEFAULT_LIMIT, check_limit, make_page, select_columns
 
 router = APIRouter()
 
@@ -25,31 +27,54 @@ def create_test_case(test_case: TestCase):
     return TestCaseWithID(id=new_id, **test_case.dict())
 
 
-@router.get("/api/test-cases", response_model=List[TestCaseWithID])
-def list_test_cases(tag: Optional[str] = None):
+TEST_CASE_COLUMNS = {name: name for name in ("id", "source", "content", "context", "language", "target", "tags")}
+TEST_CASE_LIST_FIELDS = ["source", "content", "language", "target", "tags"]
+
+
+@router.get("/api/test-cases")
+def list_test_cases(
+    tag: Optional[List[str]] = Query(None),
+    collection: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = PAGE_DEFAULT_LIMIT,
+    total: bool = False,
+    fields: Optional[str] = None,
+):
+    # Keyset pagination from the newest test case: ?after= takes the "next" id of the previous page
+    try:
+        columns = select_columns(fields, TEST_CASE_COLUMNS, TEST_CASE_LIST_FIELDS)
+        limit = check_limit(limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    conditions = []
+    params = []
+    if tag:
+        # Test cases with any of the tags, served by the GIN index on tags
+        conditions.append("tags && %s::text[]")
+        params.append(tag)
+    if collection is not None:
+        conditions.append("id IN (SELECT test_case_id FROM test_collection_membership WHERE test_collection_id = %s)")
+        params.append(collection)
+    where = " AND ".join(conditions) or "TRUE"
     with get_connection() as conn:
-        with conn.cursor() as cur:
-            if tag:
-                cur.execute("""
-                    SELECT * FROM test_case
-                    WHERE %s = ANY (tags)
-                    ORDER BY id DESC
-                """, (tag,))
-            else:
-                cur.execute("SELECT * FROM test_case ORDER BY id DESC")
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"""
+                SELECT {", ".join(columns)} FROM test_case
+                WHERE {where} AND (%s::integer IS NULL OR id < %s)
+                ORDER BY id DESC
+                LIMIT %s
+            """, (*params, after, after, limit + 1))
             rows = cur.fetchall()
-    return [TestCaseWithID(
-        id=row[0], source=row[1], content=row[2],
-        context=row[3], language=row[4], target=row[5], tags=row[6]
-    ) for row in rows]
+            count = None
+            if total:
+                cur.execute(f"SELECT COUNT(*) AS count FROM test_case WHERE {where}", params)
+                count = cur.fetchone()["count"]
+    return make_page(rows, limit, count)
 
 
 @router.get("/api/test-cases/{test_case_id}", response_model=TestCaseWithID)
-def get_test_case(test_case_id: int):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, source, content, context, language, target, tags FROM test_case WHERE id = %s", (test_case_id,))
-            row = cur.fetchone()
+async def get_test_case(test_case_id: int):
+    row = await run_query_async("test_case_by_id", (test_case_id,), fetch="one", prepared=True)
     if not row:
         raise HTTPException(status_code=404, detail="Test case not found")
     return TestCaseWithID(
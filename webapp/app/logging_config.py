@@ -1,24 +1,85 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+
+LOG_DIR = os.getenv("LOG_DIR", os.path.join(os.getcwd(), 'logs'))
+LOG_FILE = os.path.join(LOG_DIR, 'webapp.log')
+LOG_PER_PROCESS = os.getenv("LOG_PER_PROCESS", "false").lower() == "true"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line, with the same fields as the text format
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": self.formatTime(record, LOG_DATE_FORMAT),
+            "level": record.levelname,
+            "service": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["message"] += "\n" + self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def process_log_file() -> str:
+    # Rotation is not coordinated between processes, so each worker can write and rotate its own file
+    if LOG_PER_PROCESS:
+        return os.path.join(LOG_DIR, f"webapp.{os.getpid()}.log")
+    return LOG_FILE
+
+
+def create_file_handler() -> logging.Handler:
+    path = process_log_file()
+    if LOG_ROTATION == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    else:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            '[%(asctime)s][%(levelname)s][%(name)s] %(message)s',
+            datefmt=LOG_DATE_FORMAT
+        ))
+    return handler
+
 
 def setup_logging():
-    level = logging.INFO
-    log_dir = os.path.join(os.getcwd(), 'logs')
-    log_file = os.path.join(log_dir, 'webapp.log')
-
-    # File handler for logging to a file
-    file_handler = logging.FileHandler(log_file)
-    file_handler.setFormatter(logging.Formatter(
-        '[%(asctime)s][%(levelname)s][%(name)s] %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    ))
-
-    # Set up root logger with both handlers
+    global listener
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+    # Request threads only enqueue records, a background thread formats and writes them
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, create_file_handler(), respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_logging)
+
     root = logging.getLogger()
-    root.setLevel(level)
-    root.handlers = [file_handler]
+    root.setLevel(LOG_LEVEL)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
 
     # Silence invasive log
     logging.getLogger("elasticsearch").setLevel(logging.WARNING)
     logging.getLogger("elastic_transport").setLevel(logging.WARNING)
-    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
\ No newline at end of file
+    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
+
+
+def stop_logging():
+    # Flushes the records still queued
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
@@ -1,13 +1,19 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from app.api import health, log, languages, indexing, dataset, search, frontend, testcase, testcollection, resultcollection, comment
+import threading
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.api import health, log, languages, indexing, dataset, search, frontend, testcase, testcollection, resultcollection, comment, metrics, jobs
 from app.logging_config import setup_logging
+from app.services.warmup import run_warmup
+from app.services.jobs import resume_jobs
+from app.services.db import open_pool, close_pool
+from app.services.migrations import apply_migrations
+from app.services.frontend_cache import load_frontend
+from app.services.admission import Overloaded
 
 setup_logging()
 
 app = FastAPI(title="Ancient Text Search Engine")
 
-app.mount("/static", StaticFiles(directory="frontend"), name="static")
 app.include_router(health.router)
 app.include_router(log.router)
 app.include_router(languages.router)
@@ -18,4 +24,40 @@ app.include_router(frontend.router)
 app.include_router(testcase.router)
 app.include_router(testcollection.router)
 app.include_router(resultcollection.router)
-app.include_router(comment.router)
\ No newline at end of file
+app.include_router(comment.router)
+app.include_router(metrics.router)
+app.include_router(jobs.router)
+
+
+@app.exception_handler(Overloaded)
+async def reject_overloaded(request: Request, exc: Overloaded):
+    # Shed load quickly instead of letting requests queue behind the model without bound
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+
+@app.on_event("startup")
+def open_database_pool():
+    # Migrations run first, so pooled connections prepare their statements against the current schema
+    apply_migrations()
+    open_pool()
+
+
+@app.on_event("startup")
+def load_frontend_files():
+    load_frontend()
+
+
+@app.on_event("startup")
+def start_warmup():
+    # Run in the background so the server accepts health probes while warming up
+    threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
+
+
+@app.on_event("startup")
+def resume_interrupted_jobs():
+    resume_jobs()
+
+
+@app.on_event("shutdown")
+def close_database_pool():
+    close_pool()
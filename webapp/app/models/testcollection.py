@@ -13,4 +13,10 @@ class TestCollectionWithID(TestCollection):
 
 class TestCollectionMembership(BaseModel):
     test_case_id: int
-    test_collection_id: int
\ No newline at end of file
+    test_collection_id: int
+class WeightSweep(BaseModel):
+    configurations: Optional[List[Dict[str, float]]] = None
+    grid: Optional[Dict[str, List[float]]] = None
+    pool_size: Optional[int] = None
+    ks: Optional[List[int]] = None
+    refresh: bool = False
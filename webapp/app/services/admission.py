@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from app.services import metrics
+from app.services.index_manager import SUPPORTED_LANGUAGES
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MODEL_CONCURRENCY = int(os.getenv("ADMISSION_MODEL_CONCURRENCY", "4"))
+ADMISSION_ELASTICSEARCH_CONCURRENCY = int(os.getenv("ADMISSION_ELASTICSEARCH_CONCURRENCY", "8"))
+ADMISSION_QUEUE_DEPTH = int(os.getenv("ADMISSION_QUEUE_DEPTH", "16"))
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", "2"))
+ADMISSION_BATCH_TIMEOUT = float(os.getenv("ADMISSION_BATCH_TIMEOUT", "0"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1}
+CAPACITIES = {"model": ADMISSION_MODEL_CONCURRENCY, "elasticsearch": ADMISSION_ELASTICSEARCH_CONCURRENCY}
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    def __init__(self, resource: str, language: str, reason: str):
+        super().__init__(f"Too many {resource} requests for {language}: {reason}")
+        self.retry_after = ADMISSION_RETRY_AFTER
+
+
+class Waiter:
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.event = threading.Event()
+        self.granted = False
+
+
+class Limiter:
+    # A freed slot goes to the waiting call of highest priority, then to the oldest one
+    def __init__(self, resource: str, language: str, capacity: int):
+        self.resource = resource
+        self.language = language
+        self.capacity = capacity
+        self.active = 0
+        self.waiting = []
+        self.queued = {priority: 0 for priority in PRIORITIES}
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+
+    def update_metrics(self):
+        metrics.admission_active.set(self.active, resource=self.resource, language=self.language)
+        for priority, count in self.queued.items():
+            metrics.admission_queued.set(count, resource=self.resource, language=self.language, priority=priority)
+
+    def reject(self, priority: str, reason: str):
+        metrics.admission_rejections.inc(resource=self.resource, language=self.language, priority=priority, reason=reason)
+        logger.warning(f"Rejected {priority} {self.resource} request for {self.language}: {reason}")
+        raise Overloaded(self.resource, self.language, reason)
+
+    def acquire(self, priority: str):
+        with self.lock:
+            if self.active < self.capacity and not self.waiting:
+                self.active += 1
+                self.update_metrics()
+                return
+            # Batch work waits for its turn, only interactive requests are shed when the queue is full
+            if priority == INTERACTIVE and self.queued[INTERACTIVE] >= ADMISSION_QUEUE_DEPTH:
+                self.reject(priority, "queue full")
+            waiter = Waiter(priority)
+            entry = (PRIORITIES[priority], next(self.sequence), waiter)
+            heapq.heappush(self.waiting, entry)
+            self.queued[priority] += 1
+            self.update_metrics()
+        timeout = ADMISSION_TIMEOUT if priority == INTERACTIVE else ADMISSION_BATCH_TIMEOUT
+        if waiter.event.wait(timeout or None):
+            return
+        with self.lock:
+            if waiter.granted:
+                return
+            self.waiting.remove(entry)
+            heapq.heapify(self.waiting)
+            self.queued[priority] -= 1
+            self.update_metrics()
+            self.reject(priority, "wait timeout")
+
+    def release(self):
+        with self.lock:
+            if self.waiting:
+                # The slot is handed over, so the active count does not change
+                _, _, waiter = heapq.heappop(self.waiting)
+                self.queued[waiter.priority] -= 1
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self.active -= 1
+            self.update_metrics()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"active": self.active, "capacity": self.capacity, "queued": dict(self.queued)}
+
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+
+def get_limiter(resource: str, language: str) -> Limiter:
+    # Unsupported languages share one limiter, so arbitrary names cannot create new ones
+    language = language if language in SUPPORTED_LANGUAGES else "other"
+    with limiters_lock:
+        if (resource, language) not in limiters:
+            limiters[(resource, language)] = Limiter(resource, language, CAPACITIES[resource])
+        return limiters[(resource, language)]
+
+
+@contextmanager
+def admit(resource: str, languages, priority: str = INTERACTIVE):
+    if not ADMISSION_ENABLED:
+        yield
+        return
+    names = [languages] if isinstance(languages, str) else languages
+    with ExitStack() as stack:
+        # Always acquired in the same order, so calls over several languages cannot deadlock
+        for limiter in sorted({get_limiter(resource, language) for language in names}, key=lambda limiter: limiter.language):
+            limiter.acquire(priority)
+            stack.callback(limiter.release)
+        yield
+
+
+def snapshot() -> dict:
+    for resource in CAPACITIES:
+        for language in SUPPORTED_LANGUAGES:
+            get_limiter(resource, language)
+    with limiters_lock:
+        current = sorted(limiters.items(), key=lambda item: item[0])
+    state = {"enabled": ADMISSION_ENABLED}
+    for (resource, language), limiter in current:
+        state.setdefault(resource, {})[language] = limiter.snapshot()
+    return state
@@ -0,0 +1,203 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from elasticsearch import Elasticsearch
+from psycopg2.extras import Json
+from typing import Optional
+import itertools
+import logging
+import os
+import time
+from app.services.db import execute_prepared_batch, get_connection
+from app.services.embedder import query_embeddings
+from app.services.jobs import Job, register_handler, submit_job
+from app.services.migrations import ensure_result_case_partition
+from app.services import admission, index_manager, metrics
+from app.services.result_metrics import update_metrics
+from app.services.result_store import compact_result
+from app.services.search_engine import compute_search_body, empty_result, get_language_facets, normalize_query, parse_response, resolve_index
+
+RUN_CHUNK_SIZE = int(os.getenv("RUN_CHUNK_SIZE", "50"))
+RUN_CONCURRENCY = int(os.getenv("RUN_CONCURRENCY", "4"))
+RUN_RESULT_SIZE = 50
+
+logger = logging.getLogger(__name__)
+es = Elasticsearch(os.getenv("ELASTIC_URL", "http://localhost:9200"))
+
+
+def weight_arguments(weights: dict) -> dict:
+    return {
+        "text_weight": weights.get("text", 0.0),
+        "shingle_weight": weights.get("shingle", 0.0),
+        "trigram_weight": weights.get("trigram", 0.0),
+        "variant_text_weight": weights.get("variantText", 0.0),
+        "variant_shingle_weight": weights.get("variantShingle", 0.0),
+        "variant_trigram_weight": weights.get("variantTrigram", 0.0),
+        "semantic_weight": weights.get("semantic", 0.0),
+        "variant_semantic_weight": weights.get("variantSemantic", 0.0),
+    }
+
+
+def create_result_collection(collection_id: int) -> Optional[int]:
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT weights, sources, books FROM test_collection WHERE id = %s", (collection_id,))
+            collection = cursor.fetchone()
+            if not collection:
+                return None
+            weights, sources, books = collection
+            cursor.execute("""
+                INSERT INTO result_collection (test_collection_id, weights, sources, books)
+                VALUES (%s, %s, %s, %s) RETURNING id
+            """, (collection_id, Json(weights), sources, books))
+            result_collection_id = cursor.fetchone()[0]
+    ensure_result_case_partition(result_collection_id)
+    return result_collection_id
+
+
+def fetch_pending_cases(collection_id: int, result_collection_id: int):
+    # Cases already stored by an interrupted run are skipped
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT weights, sources, books FROM result_collection WHERE id = %s", (result_collection_id,))
+            configuration = cursor.fetchone()
+            cursor.execute("""
+                SELECT tc.id, tc.content, tc.language, tc.target FROM test_case tc
+                JOIN test_collection_membership tcm ON tc.id = tcm.test_case_id
+                WHERE tcm.test_collection_id = %s
+                AND NOT EXISTS (
+                    SELECT 1 FROM result_case r WHERE r.test_case_id = tc.id AND r.result_collection_id = %s
+                )
+                ORDER BY tc.language, tc.id
+            """, (collection_id, result_collection_id))
+            return configuration, cursor.fetchall()
+
+
+def compute_rank(result: dict, target: str) -> int:
+    for position, hit in enumerate(result["results"]):
+        if hit["id"] == target:
+            return position + 1
+    return -1
+
+
+def search_chunk(language: str, cases: list, embeddings: list, weights: dict, sources, books) -> list:
+    index, language_sources, selected = resolve_index(language, sources)
+    header = {"index": index, "ignore_unavailable": selected}
+    routing = index_manager.compute_routing(books)
+    if routing:
+        header["routing"] = routing
+    searches = []
+    for case, embedding in zip(cases, embeddings):
+        searches.append(header)
+        # Facets over the whole index are not shown for result cases, so the global aggregation is skipped
+        searches.append(compute_search_body(
+            normalize_query(case[1]), embedding, **weight_arguments(weights),
+            books=books, sources=language_sources, size=RUN_RESULT_SIZE, score_stats=True, unfiltered=False,
+        ))
+    try:
+        with admission.admit("elasticsearch", language, admission.BATCH), metrics.elasticsearch_duration.time(operation="msearch"):
+            responses = es.msearch(searches=searches)["responses"]
+    except Exception as e:
+        logger.error(f"Multi-search for {len(cases)} {language} test cases failed: {e}")
+        responses = [{"error": str(e)}] * len(cases)
+
+    results = []
+    for case, response in zip(cases, responses):
+        if "error" in response:
+            logger.error(f"Test case {case[0]} failed: {response['error']}")
+            metrics.search_requests.inc(language=language, outcome="error")
+            results.append(empty_result({}))
+        else:
+            metrics.search_requests.inc(language=language, outcome="ok")
+            results.append(parse_response(response, {}))
+    return results
+
+
+def store_chunk(result_collection_id: int, cases: list, results: list):
+    rows = []
+    for case, result in zip(cases, results):
+        compact = compact_result(result)
+        rows.append((
+            case[0], result_collection_id, compute_rank(result, case[3]),
+            compact["hit_ids"], compact["hit_scores"], compact["hit_count"], compact["took"], Json(compact["score_stats"]),
+        ))
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            execute_prepared_batch(cursor, "insert_result_case", rows)
+
+
+def store_facets(result_collection_id: int, languages: set):
+    # Facets are the same for every case of a language, so they are stored once per result collection
+    facets = {}
+    for language in languages:
+        try:
+            facets[language] = get_language_facets(language)
+        except Exception as e:
+            logger.warning(f"Could not retrieve facets of {language}: {e}")
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "UPDATE result_collection SET stats = %s WHERE id = %s AND stats IS NULL",
+                (Json({"facets": facets}), result_collection_id),
+            )
+
+
+def process_chunk(result_collection_id: int, language: str, cases: list, embeddings: list, weights: dict, sources, books) -> int:
+    results = search_chunk(language, cases, embeddings, weights, sources, books)
+    store_chunk(result_collection_id, cases, results)
+    return len(cases)
+
+
+def run_collection(collection_id: int, result_collection_id: int, job: Optional[Job] = None) -> dict:
+    configuration, cases = fetch_pending_cases(collection_id, result_collection_id)
+    if configuration is None:
+        raise ValueError(f"Result collection {result_collection_id} not found")
+    weights, sources, books = configuration
+    weights = weights or {}
+    logger.info(f"Running {len(cases)} test cases of collection {collection_id} into result collection {result_collection_id}")
+    if job is not None:
+        job.advance(total=len(cases))
+    start = time.perf_counter()
+    done = 0
+    store_facets(result_collection_id, {case[2] for case in cases})
+
+    def collect(future) -> int:
+        stored = future.result()
+        if job is not None:
+            job.advance(searched=stored)
+        return stored
+
+    # Queries are embedded in batches on this thread while earlier chunks are searched and stored,
+    # and at most two chunks per thread are in flight
+    with ThreadPoolExecutor(max_workers=RUN_CONCURRENCY, thread_name_prefix="run") as executor:
+        pending = deque()
+        for language, language_cases in itertools.groupby(cases, key=lambda case: case[2]):
+            language_cases = list(language_cases)
+            for offset in range(0, len(language_cases), RUN_CHUNK_SIZE):
+                if job is not None:
+                    job.check_cancelled()
+                chunk = language_cases[offset:offset + RUN_CHUNK_SIZE]
+                embeddings = query_embeddings(language, [normalize_query(case[1]) for case in chunk])
+                if job is not None:
+                    job.advance(embedded=len(chunk))
+                pending.append(executor.submit(process_chunk, result_collection_id, language, chunk, embeddings, weights, sources, books))
+                while len(pending) >= RUN_CONCURRENCY * 2:
+                    done += collect(pending.popleft())
+        while pending:
+            done += collect(pending.popleft())
+
+    update_metrics(result_collection_id)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Ran {done} test cases of collection {collection_id} in {elapsed:.1f}s")
+    return {"resultCollectionId": result_collection_id, "cases": done, "seconds": elapsed}
+
+
+def start_run(collection_id: int) -> Optional[dict]:
+    result_collection_id = create_result_collection(collection_id)
+    if result_collection_id is None:
+        return None
+    job = submit_job("run_collection", collection_id=collection_id, result_collection_id=result_collection_id)
+    return {"resultConnectionId": result_collection_id, "jobId": job.id}
+
+
+# Every stored chunk is committed, so an interrupted run resumes with the missing cases
+register_handler("run_collection", lambda job: run_collection(job.params["collection_id"], job.params["result_collection_id"], job))
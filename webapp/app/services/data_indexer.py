@@ -1,100 +1,394 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from elasticsearch import Elasticsearch, helpers
 from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+import itertools
 import json
 import logging
 import os
-from app.services.embedder import index_embedding
+import time
+from app.services.dataset_reader import DATA_DIR, DatasetFormatError, find_dataset_path, iter_documents, list_dataset_paths
+from app.services.embedder import index_embeddings
+from app.services import index_manager
+from app.services.index_manager import bulk_load as bulk_load_mode
+from app.services.jobs import Job, register_handler
+from app.services import metrics
 
-DATA_DIR = Path("assets/datasets")
 CACHE_DIR = Path("cache/embedded_documents")
+BULK_LOAD_DEFAULT = os.getenv("BULK_LOAD_DEFAULT", "true").lower() == "true"
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BULK_MAX_CHUNK_BYTES = int(os.getenv("BULK_MAX_CHUNK_BYTES", str(10 * 1024 * 1024)))
+BULK_THREADS = int(os.getenv("BULK_THREADS", "2"))
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "5"))
+BULK_INITIAL_BACKOFF = float(os.getenv("BULK_INITIAL_BACKOFF", "2"))
+BULK_MAX_BACKOFF = float(os.getenv("BULK_MAX_BACKOFF", "60"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+MAX_REPORTED_ERRORS = 100
 
 logger = logging.getLogger(__name__)
 es = Elasticsearch(os.getenv("ELASTIC_URL", "http://localhost:9200"))
 
 
-def get_embedded_documents(language: str, dataset_name: str, dataset: list[dict]) -> dict:
-    cache_language_path = CACHE_DIR / language
-    path = cache_language_path / f"{dataset_name}.json"
-    os.makedirs(cache_language_path, exist_ok=True)
+def embedding_store_path(language: str, dataset_name: str) -> Path:
+    return CACHE_DIR / language / f"{dataset_name}.jsonl"
+
+
+def attach_embeddings(document: dict, entry: dict) -> dict:
+    document["embedding"] = entry["embedding"]
+    for variant, embedding in zip(document.get("variant", []), entry["variant"]):
+        variant["embedding"] = embedding
+    return document
+
+
+def compute_embeddings(language: str, documents: list[dict]) -> list[dict]:
+    # Contents and variants of a whole batch go through the model in a single call
+    texts = []
+    for document in documents:
+        texts.append(document["content"])
+        texts.extend(variant["content"] for variant in document.get("variant", []))
+    embeddings = iter(index_embeddings(language, texts)) if texts else iter([])
+    entries = []
+    for document in documents:
+        entries.append({
+            "id": document["id"],
+            "embedding": next(embeddings),
+            "variant": [next(embeddings) for _ in document.get("variant", [])],
+        })
+    return entries
+
+
+def embed_documents(language: str, documents: Iterable[dict], store, job: Optional[Job] = None) -> Iterator[dict]:
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= EMBEDDING_BATCH_SIZE:
+            yield from embed_batch(language, batch, store, job)
+            batch = []
+    if batch:
+        yield from embed_batch(language, batch, store, job)
+
+
+def embed_batch(language: str, batch: list[dict], store, job: Optional[Job] = None) -> Iterator[dict]:
+    entries = compute_embeddings(language, batch)
+    if job is not None:
+        job.advance(embedded=len(batch))
+    for document, entry in zip(batch, entries):
+        store.write(json.dumps(entry) + "\n")
+        yield attach_embeddings(document, entry)
+
+
+def read_embedding_store(path: Path, documents: Iterator[dict], job: Optional[Job] = None) -> Iterator[dict]:
+    # Vectors are read line by line, in the same order as the dataset, until the store
+    # ends or stops matching; the store is then truncated to its last matching line
+    offset = 0
+    with open(path, "rb") as store:
+        for document in documents:
+            line = store.readline()
+            entry = json.loads(line) if line.endswith(b"\n") else None
+            if entry is None or entry["id"] != document["id"]:
+                documents.send_back = document
+                break
+            offset += len(line)
+            if job is not None:
+                job.advance(embedded=1)
+            yield attach_embeddings(document, entry)
+    os.truncate(path, offset)
+
+
+class PushbackIterator:
+    def __init__(self, iterable: Iterable):
+        self.iterator = iter(iterable)
+        self.send_back = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.send_back is not None:
+            item, self.send_back = self.send_back, None
+            return item
+        return next(self.iterator)
+
+
+def iter_embedded_documents(language: str, dataset_name: str, documents: Iterable[dict], skip: int = 0, job: Optional[Job] = None) -> Iterator[dict]:
+    path = embedding_store_path(language, dataset_name)
+    partial_path = path.with_suffix(".jsonl.partial")
+    os.makedirs(path.parent, exist_ok=True)
     logger.info(f"Retrieving embedded dataset for {dataset_name}")
+    documents = PushbackIterator(documents)
+
+    def embedded():
+        if path.exists():
+            logger.info(f"Embedding store found in {path}: reading it")
+            metrics.embedding_cache.inc(language=language, result="hit")
+            yield from read_embedding_store(path, documents, job)
+            if documents.send_back is None:
+                return
+            logger.warning(f"Embedding store {path} does not match the dataset: computing embeddings")
+            path.replace(partial_path)
+        else:
+            logger.info(f"Embedding store not found in {path}: computing embeddings")
+            metrics.embedding_cache.inc(language=language, result="miss")
+            # A partial store left by an interrupted run is reused up to its last complete line
+            if partial_path.exists():
+                yield from read_embedding_store(partial_path, documents, job)
 
-    # Read and return embedded dataset if it already exists
-    if path.exists():
-        logger.info(f"Embbeded dataset found in {path}: returning it")
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    
-    # Compute, store and return embedded dataset if it does not exist
-    logger.info(f"Embedded dataset not found in {path}: computing embeddings")
-    for document in dataset:
-        document["embedding"] = index_embedding(language, document["content"])
-        if "variant" in document:
-            for variant in document["variant"]:
-                variant["embedding"] = index_embedding(language, document["content"])
-    logger.info(f"Writing embedded dataset to {path}")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(dataset, f, ensure_ascii=False)
-    
-    return dataset
+        # Vectors are appended to the partial store, which becomes valid only once complete
+        with open(partial_path, "a", encoding="utf-8") as store:
+            yield from embed_documents(language, documents, store, job)
+        partial_path.replace(path)
+        logger.info(f"Embedding store written to {path}")
+
+    # Skipped documents are still read, so the store stays aligned with the dataset
+    for position, document in enumerate(embedded()):
+        if position >= skip:
+            yield document
 
 
 def delete_embedded_documents(language: str, dataset: str):
-    path = CACHE_DIR / language / f"{dataset}.json"
+    path = embedding_store_path(language, dataset)
     logger.info(f"Clearing embedding cache at {path}")
     path.unlink(missing_ok=True)
+    path.with_suffix(".jsonl.partial").unlink(missing_ok=True)
+    # Stores written before the streaming format
+    path.with_suffix(".json").unlink(missing_ok=True)
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def send_chunk(chunk: list[dict]) -> list[tuple[bool, dict]]:
+    # streaming_bulk retries 429 rejections with exponential backoff and splits chunks by byte size
+    with metrics.elasticsearch_duration.time(operation="bulk"):
+        return list(helpers.streaming_bulk(
+            es, chunk,
+            chunk_size=len(chunk),
+            max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+            max_retries=BULK_MAX_RETRIES,
+            initial_backoff=BULK_INITIAL_BACKOFF,
+            max_backoff=BULK_MAX_BACKOFF,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ))
 
 
-def index_dataset(language: str, dataset: str) -> dict:
-    path = DATA_DIR / language / f"{dataset}.json"
+def bulk_action(index: str, document: dict) -> dict:
+    action = {"_index": index, "_id": document["id"], "_source": document}
+    if index_manager.is_routing_enabled():
+        action["_routing"] = index_manager.routing_value(document["book"])
+    return action
+
+
+def send_documents(
+    language: str,
+    index: str,
+    documents: Iterable[dict],
+    job: Optional[Job] = None,
+    checkpoint: Optional[str] = None,
+    skip: int = 0,
+) -> dict:
+    actions = (bulk_action(index, doc) for doc in documents)
+    indexed = 0
+    failed = 0
+    errors = []
+    start = time.perf_counter()
+    # Documents indexed before an interruption, which the resumed run does not send again
+    indexed_before = job.checkpoint.get(f"{checkpoint}:indexed", skip) if job is not None and skip else 0
+
+    def collect(results):
+        nonlocal indexed, failed
+        chunk_indexed = 0
+        for ok, item in results:
+            if ok:
+                chunk_indexed += 1
+                continue
+            failed += 1
+            info = next(iter(item.values()))
+            logger.error(f"Could not index document {info.get('_id')}: {info.get('error')}")
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"id": info.get("_id"), "status": info.get("status"), "error": info.get("error")})
+        indexed += chunk_indexed
+        if job is not None:
+            job.advance(indexed=chunk_indexed, failed=len(results) - chunk_indexed)
+            # Chunks are collected in order, so every document before this point is committed
+            job.commit(checkpoint, skip + indexed + failed, {f"{checkpoint}:indexed": indexed_before + indexed})
+
+    # At most two chunks per thread are in flight, which bounds memory regardless of dataset size
+    with ThreadPoolExecutor(max_workers=BULK_THREADS, thread_name_prefix="bulk") as executor:
+        pending = deque()
+        for chunk in chunked(actions, BULK_CHUNK_SIZE):
+            if job is not None:
+                job.check_cancelled()
+            pending.append(executor.submit(send_chunk, chunk))
+            while len(pending) >= BULK_THREADS * 2:
+                collect(pending.popleft().result())
+        while pending:
+            collect(pending.popleft().result())
+
+    elapsed = time.perf_counter() - start
+    metrics.bulk_documents.inc(indexed, language=language, outcome="indexed")
+    metrics.bulk_documents.inc(failed, language=language, outcome="error")
+    metrics.bulk_duration.observe(elapsed, language=language)
+    metrics.bulk_throughput.set(indexed / elapsed if elapsed > 0 else 0, language=language)
+    return {"indexed": indexed, "failed": failed, "errors": errors}
+
+
+def track_bytes(job: Optional[Job]) -> Optional[Callable[[int], None]]:
+    if job is None:
+        return None
+    last = 0
+    def on_progress(position: int):
+        nonlocal last
+        job.advance(bytes_done=position - last)
+        last = position
+    return on_progress
+
+
+def index_dataset(
+    language: str,
+    dataset: str,
+    bulk_load: bool = False,
+    index: Optional[str] = None,
+    job: Optional[Job] = None,
+) -> dict:
+    path = find_dataset_path(language, dataset)
     logger.info(f"Indexing {dataset}")
-    index = language
+    index = index or language
 
-    if not path.exists():
+    if path is None:
         logger.warning(f"Dataset {dataset} does not exist")
         return {"success": False, "message": f"{dataset} not found for {language}"}
 
-    with path.open(encoding="utf-8") as f:
-        docs = json.load(f)
-    embedded_docs = get_embedded_documents(language, dataset, docs)
+    if index_manager.is_dataset_layout() and index == language:
+        return replace_dataset_index(language, dataset, bulk_load, job)
+
+    if bulk_load:
+        with bulk_load_mode(index):
+            return index_dataset(language, dataset, index=index, job=job)
 
+    # A resumed job skips the documents committed before the interruption
+    skip = 0
+    if job is not None:
+        skip = job.checkpoint.get(dataset, 0)
+        if skip is True:
+            logger.info(f"Dataset {dataset} already indexed by job {job.id}")
+            return {"success": True, "message": f"{dataset} already indexed"}
+        if not job.progress["bytes_total"]:
+            job.progress["bytes_total"] = path.stat().st_size
+        if skip:
+            logger.info(f"Resuming {dataset} after {skip} committed documents")
+
+    # Parsing, embedding and sending overlap: documents flow through one at a time
     logger.info("Sending embedded documents")
-    actions = [{"_index": index, "_id": doc["id"], "_source": doc} for doc in embedded_docs]
+    invalid = []
+    try:
+        documents = iter_documents(path, invalid, track_bytes(job))
+        embedded_documents = iter_embedded_documents(language, dataset, documents, skip, job)
+        report = send_documents(language, index, embedded_documents, job, dataset, skip)
+    except DatasetFormatError as e:
+        logger.error(f"Dataset {dataset} is malformed: {e}")
+        return {"success": False, "message": f"Dataset {dataset} is malformed: {e}"}
+
+    if job is not None:
+        job.commit(dataset, True)
+    report["invalid"] = len(invalid)
+    report["errors"] = (invalid + report["errors"])[:MAX_REPORTED_ERRORS]
+    logger.info(f"Dataset {dataset} indexed: {report['indexed']} documents indexed, {report['failed']} failed, {report['invalid']} invalid")
+    return {
+        "success": report["failed"] == 0 and report["invalid"] == 0,
+        "message": f"Indexed {report['indexed']} docs from {dataset}, {report['failed']} failed, {report['invalid']} invalid",
+        **report,
+    }
+
+
+def replace_dataset_index(language: str, dataset: str, bulk_load: bool = False, job: Optional[Job] = None) -> dict:
+    # The dataset is filled into a fresh version and swapped in, so searches never see a partial dataset
+    base = index_manager.dataset_index_name(language, dataset)
+    new_index = job.checkpoint.get(f"{dataset}:index") if job is not None else None
+    if job is not None and job.checkpoint.get(dataset) is True:
+        # A job interrupted between indexing and swapping only needs the swap
+        if new_index not in index_manager.get_alias_indices(base) and es.indices.exists(index=new_index):
+            index_manager.swap_dataset_alias(language, base, new_index)
+            index_manager.delete_old_versions(base, 0)
+        return {"success": True, "message": f"{dataset} already indexed"}
+    if new_index is None or not es.indices.exists(index=new_index):
+        versions = index_manager.list_versions(base)
+        new_index = index_manager.version_name(base, versions[-1] + 1 if versions else 1)
+        index_manager.create_physical_index(language, new_index)
+        if job is not None:
+            job.checkpoint.pop(dataset, None)
+            job.checkpoint.pop(f"{dataset}:indexed", None)
+            job.commit(f"{dataset}:index", new_index)
+
     try:
-        helpers.bulk(es, actions)
-    except helpers.BulkIndexError as e:
-        for error in e.errors:
-            logger.error(error)
+        result = index_dataset(language, dataset, bulk_load, index=new_index, job=job)
+    except Exception:
+        if job is None or not job.cancel_event.is_set():
+            es.indices.delete(index=new_index, ignore_unavailable=True)
+        raise
 
-    logger.info(f"Dataset {dataset} indexed")
-    return {"success": True, "message": f"Indexed {len(embedded_docs)} docs from {dataset}"}
+    es.indices.refresh(index=new_index)
+    count = es.count(index=new_index)["count"]
+    # A resumed job only sent the documents after its checkpoint, the index holds all of them
+    expected = job.checkpoint.get(f"{dataset}:indexed", result.get("indexed")) if job is not None else result.get("indexed")
+    if count == 0 or count != expected:
+        logger.error(f"Index {new_index} has {count} documents instead of {expected}")
+        es.indices.delete(index=new_index, ignore_unavailable=True)
+        return {**result, "success": False, "message": f"Index {new_index} has {count} documents instead of {expected}"}
 
+    index_manager.swap_dataset_alias(language, base, new_index)
+    index_manager.delete_old_versions(base, 0)
+    return {**result, "index": new_index}
 
-def index_language(language: str) -> dict:
+
+def index_language(
+    language: str,
+    bulk_load: bool = False,
+    index: Optional[str] = None,
+    job: Optional[Job] = None,
+) -> dict:
     logger.info(f"Indexing every dataset for language {language}")
     dataset_dir = DATA_DIR / language
     if not dataset_dir.exists():
         return {"success": False, "message": f"No data for {language}"}
 
+    # Settings are suspended once for the whole language, not once per dataset,
+    # unless every dataset is loaded into its own fresh index
+    per_dataset = index_manager.is_dataset_layout() and index is None
+    if bulk_load and not per_dataset and list_dataset_paths(language):
+        with bulk_load_mode(index or language):
+            return index_language(language, index=index, job=job)
+
+    paths = list_dataset_paths(language)
+    if job is not None:
+        job.progress["bytes_total"] = sum(f.stat().st_size for f in paths if job.checkpoint.get(f.stem) is not True)
     results = {}
-    for f in dataset_dir.glob("*.json"):
+    for f in paths:
         dataset = f.stem
-        results[dataset] = index_dataset(language, dataset)
+        results[dataset] = index_dataset(language, dataset, bulk_load and per_dataset, index=index, job=job)
     return results
 
 
-def index_all() -> dict:
+def index_all(bulk_load: bool = False) -> dict:
     logger.info(f"Indexing every dataset")
     results = {}
     for lang_dir in DATA_DIR.iterdir():
         if lang_dir.is_dir():
             lang = lang_dir.name
-            results[lang] = index_language(lang)
+            results[lang] = index_language(lang, bulk_load)
     return results
 
 
 def delete_dataset(language: str, dataset: str) -> dict:
     logger.info(f"Removing {dataset}")
     index = language
+    if index_manager.is_dataset_layout():
+        removed = index_manager.delete_dataset_index(language, dataset)
+        return {"success": True, "message": f"Deleted {dataset} from {index}", "removed": removed}
     query = {"query": {"match": {"source": dataset}}}
     es.delete_by_query(index=index, body=query)
     return {"success": True, "message": f"Deleted {dataset} from {index}"}
@@ -103,6 +397,8 @@ def delete_dataset(language: str, dataset: str) -> dict:
 def delete_language(language: str) -> dict:
     logger.info(f"Removing every dataset for language {language}")
     index = language
+    if index_manager.is_dataset_layout():
+        return index_manager.delete_index(language)
     query = {"query": {"match_all": {}}}
     try:
         es.delete_by_query(index=index, body=query)
@@ -119,4 +415,10 @@ def delete_all() -> dict:
         if lang_dir.is_dir():
             lang = lang_dir.name
             results[lang] = delete_language(lang)
-    return results
\ No newline at end of file
+    return results
+
+
+register_handler("index_dataset", lambda job: index_dataset(job.language, job.params["dataset"], job.params["bulk_load"], job=job))
+register_handler("index_language", lambda job: index_language(job.language, job.params["bulk_load"], job=job))
+register_handler("delete_dataset", lambda job: delete_dataset(job.language, job.params["dataset"]))
+register_handler("delete_language", lambda job: delete_language(job.language))
\ No newline at end of file
@@ -1,19 +1,14 @@
-from pathlib import Path
 from typing import Dict, List
-
-DATA_DIR = Path("assets/datasets")
+from app.services.dataset_reader import DATA_DIR, list_dataset_paths
 
 def list_available_datasets() -> Dict[str, List[str]]:
     result = {}
     for lang_dir in DATA_DIR.iterdir():
         if lang_dir.is_dir():
-            datasets = [f.stem for f in lang_dir.glob("*.json")]
+            datasets = [f.stem for f in list_dataset_paths(lang_dir.name)]
             if datasets:
                 result[lang_dir.name] = datasets
     return result
 
 def list_language_datasets(language: str) -> List[str]:
-    lang_path = DATA_DIR / language
-    if not lang_path.exists() or not lang_path.is_dir():
-        return []
-    return [f.stem for f in lang_path.glob("*.json")]
\ No newline at end of file
+    return [f.stem for f in list_dataset_paths(language)]
\ No newline at end of file
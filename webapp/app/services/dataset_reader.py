@@ -0,0 +1,134 @@
+import json
+import logging
+from pathlib import Path
+from typing import Callable, Iterator, Optional, TextIO
+
+DATA_DIR = Path("assets/datasets")
+DATASET_SUFFIXES = (".json", ".jsonl")
+REQUIRED_FIELDS = ("id", "type", "source", "book", "chapter", "verse", "content", "variant")
+READ_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetFormatError(ValueError):
+    pass
+
+
+def find_dataset_path(language: str, dataset: str) -> Optional[Path]:
+    for suffix in DATASET_SUFFIXES:
+        path = DATA_DIR / language / f"{dataset}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def list_dataset_paths(language: str) -> list[Path]:
+    lang_path = DATA_DIR / language
+    if not lang_path.is_dir():
+        return []
+    return sorted(path for path in lang_path.iterdir() if path.suffix in DATASET_SUFFIXES)
+
+
+def validate_document(document) -> Optional[str]:
+    if not isinstance(document, dict):
+        return "document is not an object"
+    missing = [field for field in REQUIRED_FIELDS if field not in document]
+    if missing:
+        return f"missing fields {', '.join(missing)}"
+    if not isinstance(document["content"], str):
+        return "content is not a string"
+    if not isinstance(document["variant"], list):
+        return "variant is not a list"
+    for variant in document["variant"]:
+        if not isinstance(variant, dict) or not isinstance(variant.get("content"), str) or "source" not in variant:
+            return "variant without source or content"
+    return None
+
+
+def iter_json_lines(file: TextIO) -> Iterator:
+    for line_number, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise DatasetFormatError(f"Invalid JSON on line {line_number}: {e}")
+
+
+def iter_json_array(file: TextIO) -> Iterator:
+    # Items are decoded one at a time from a sliding buffer, so parsing starts
+    # right away and memory is bounded by the size of the largest item
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def read_more(size=READ_SIZE) -> bool:
+        nonlocal buffer, position, eof
+        chunk = file.read(size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    def next_char() -> str:
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                raise DatasetFormatError("Unexpected end of file")
+
+    if next_char() != "[":
+        raise DatasetFormatError("Dataset is not a JSON array")
+    position += 1
+    if next_char() == "]":
+        return
+
+    while True:
+        next_char()
+        size = READ_SIZE
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError as e:
+                if eof or not read_more(size):
+                    raise DatasetFormatError(f"Invalid JSON: {e}")
+                size *= 2
+        position = end
+        yield item
+
+        separator = next_char()
+        position += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise DatasetFormatError(f"Unexpected character '{separator}' between documents")
+
+
+def iter_documents(
+    path: Path,
+    errors: Optional[list] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> Iterator[dict]:
+    # Invalid documents are skipped and reported in errors, on_progress receives the bytes read so far
+    with path.open(encoding="utf-8") as f:
+        items = iter_json_lines(f) if path.suffix == ".jsonl" else iter_json_array(f)
+        for position, document in enumerate(items):
+            if on_progress is not None:
+                on_progress(f.buffer.tell())
+            error = validate_document(document)
+            if error:
+                document_id = document.get("id") if isinstance(document, dict) else None
+                logger.warning(f"Skipping document {document_id or position} of {path.name}: {error}")
+                if errors is not None:
+                    errors.append({"id": document_id, "position": position, "error": error})
+                continue
+            yield document
@@ -1,11 +1,288 @@
+import asyncio
+import logging
 import psycopg2
+import psycopg2.extensions
 import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_batch
+from app.services import metrics
 
-def get_connection():
+POSTGRES_POOL_MIN = int(os.getenv("POSTGRES_POOL_MIN", "1"))
+POSTGRES_POOL_MAX = int(os.getenv("POSTGRES_POOL_MAX", "10"))
+POSTGRES_POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", "30"))
+POSTGRES_HEALTH_CHECK_INTERVAL = float(os.getenv("POSTGRES_HEALTH_CHECK_INTERVAL", "30"))
+POSTGRES_STATEMENT_TIMEOUT = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT", "60000"))
+
+statement_re = re.compile(r"^\s*(\w+)(?:.*?\b(?:FROM|INTO)|)\s+(\w+)", re.IGNORECASE | re.DOTALL)
+timed_cursor_classes = {}
+
+# Hot statements, prepared once per pooled connection and run with EXECUTE
+PREPARED_STATEMENTS = {
+    "test_case_by_id": "SELECT id, source, content, context, language, target, tags FROM test_case WHERE id = %s",
+    "insert_result_case": """
+        INSERT INTO result_case (test_case_id, result_collection_id, rank_of_expected, hit_ids, hit_scores, hit_count, took, score_stats)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """,
+    "result_metrics_by_collection": "SELECT total, found, mrr, mean_rank, recall_at_k FROM result_metrics WHERE result_collection_id = %s",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def statement_label(query) -> str:
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", errors="replace")
+    match = statement_re.match(str(query))
+    if not match:
+        return "other"
+    return f"{match.group(1).lower()}_{match.group(2).lower()}"
+
+
+def timed_cursor_class(cursor_class):
+    # Cursor subclasses are built once per cursor factory (plain, RealDictCursor, ...)
+    if cursor_class not in timed_cursor_classes:
+        class TimedCursor(cursor_class):
+            def execute(self, query, vars=None):
+                start = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    metrics.postgres_duration.observe(time.perf_counter() - start, statement=statement_label(query))
+        timed_cursor_classes[cursor_class] = TimedCursor
+    return timed_cursor_classes[cursor_class]
+
+
+class TimedConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = timed_cursor_class(cursor_class)
+        return super().cursor(*args, **kwargs)
+
+
+class PooledConnection(TimedConnection):
+    # close() and the end of a `with` block give the connection back to the pool instead of closing it
+    pool = None
+    checked_out = False
+    prepared = frozenset()
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        elif self.checked_out:
+            self.pool.release(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.pool is None:
+            return super().__exit__(exc_type, exc_value, traceback)
+        if not self.checked_out:
+            return False
+        try:
+            return super().__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.close()
+
+
+def open_connection(statement_timeout: int = POSTGRES_STATEMENT_TIMEOUT) -> PooledConnection:
+    # Outside of the pool, close() really closes the connection
+    options = f"-c statement_timeout={statement_timeout}" if statement_timeout else None
     return psycopg2.connect(
         dbname=os.getenv("POSTGRES_DB", "search-engine"),
         user=os.getenv("POSTGRES_USER", "user"),
         password=os.getenv("POSTGRES_PASSWORD", "password"),
         host=os.getenv("POSTGRES_HOST", "localhost"),
-        port=os.getenv("POSTGRES_PORT", 5432)
-    )
\ No newline at end of file
+        port=os.getenv("POSTGRES_PORT", 5432),
+        options=options,
+        connection_factory=PooledConnection,
+    )
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, minconn: int, maxconn: int, timeout: float):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.idle = deque()
+        self.size = 0
+        self.condition = threading.Condition()
+
+    def connect(self) -> PooledConnection:
+        conn = open_connection()
+        prepare_statements(conn)
+        conn.pool = self
+        return conn
+
+    def discard(self, conn: PooledConnection):
+        conn.pool = None
+        conn.checked_out = False
+        if not conn.closed:
+            conn.close()
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+        self.update_metrics()
+
+    def is_healthy(self, conn: PooledConnection, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < POSTGRES_HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            with psycopg2.extensions.connection.cursor(conn) as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Discarding broken Postgres connection: {e}")
+            return False
+
+    def acquire(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self.condition:
+                while not self.idle and self.size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No Postgres connection available after {self.timeout}s")
+                    self.condition.wait(remaining)
+                if self.idle:
+                    conn, idle_since = self.idle.pop()
+                else:
+                    self.size += 1
+            if conn is None:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    with self.condition:
+                        self.size -= 1
+                        self.condition.notify()
+                    raise
+                conn.checked_out = True
+                self.update_metrics()
+                return conn
+            # Health checks run outside the lock, broken connections are replaced transparently
+            if self.is_healthy(conn, idle_since):
+                conn.checked_out = True
+                self.update_metrics()
+                return conn
+            self.discard(conn)
+
+    def release(self, conn: PooledConnection):
+        conn.checked_out = False
+        try:
+            if not conn.closed and conn.status != psycopg2.extensions.STATUS_READY:
+                conn.rollback()
+        except psycopg2.Error:
+            pass
+        if conn.closed:
+            self.discard(conn)
+            return
+        with self.condition:
+            self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+        self.update_metrics()
+
+    def fill(self):
+        connections = [self.acquire() for _ in range(self.minconn)]
+        for conn in connections:
+            conn.close()
+
+    def close_all(self):
+        with self.condition:
+            idle, self.idle = list(self.idle), deque()
+        for conn, _ in idle:
+            self.discard(conn)
+
+    def update_metrics(self):
+        with self.condition:
+            idle = len(self.idle)
+            size = self.size
+        metrics.postgres_connections.set(idle, state="idle")
+        metrics.postgres_connections.set(size - idle, state="in_use")
+
+
+def to_server_placeholders(query: str) -> str:
+    parts = query.split("%s")
+    return "".join(part + (f"${index + 1}" if index < len(parts) - 1 else "") for index, part in enumerate(parts))
+
+
+def prepare_statements(conn):
+    # Prepared outside of any transaction, so a later rollback cannot drop them
+    prepared = set()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for name, query in PREPARED_STATEMENTS.items():
+                try:
+                    cursor.execute(f"PREPARE {name} AS {to_server_placeholders(query)}")
+                    prepared.add(name)
+                except psycopg2.Error as e:
+                    logger.warning(f"Could not prepare statement {name}: {e}")
+    finally:
+        conn.autocommit = False
+    conn.prepared = frozenset(prepared)
+
+
+def execute_prepared(cursor, name: str, params: tuple):
+    # Falls back to the plain statement on connections where it could not be prepared
+    if name in cursor.connection.prepared:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cursor.execute(PREPARED_STATEMENTS[name], params)
+
+
+def execute_prepared_batch(cursor, name: str, rows: list, page_size: int = 100):
+    if not rows:
+        return
+    if name in cursor.connection.prepared:
+        execute_batch(cursor, f"EXECUTE {name} ({', '.join(['%s'] * len(rows[0]))})", rows, page_size=page_size)
+    else:
+        execute_batch(cursor, PREPARED_STATEMENTS[name], rows, page_size=page_size)
+
+
+pool = ConnectionPool(POSTGRES_POOL_MIN, POSTGRES_POOL_MAX, POSTGRES_POOL_TIMEOUT)
+# Async endpoints run their queries here, so a blocking driver never stalls the event loop
+async_executor = ThreadPoolExecutor(max_workers=POSTGRES_POOL_MAX, thread_name_prefix="postgres")
+
+
+def get_connection() -> PooledConnection:
+    return pool.acquire()
+
+
+def open_pool():
+    try:
+        pool.fill()
+        logger.info(f"Postgres pool ready with {POSTGRES_POOL_MIN} to {POSTGRES_POOL_MAX} connections")
+    except Exception as e:
+        logger.warning(f"Could not open Postgres connections: {e}")
+
+
+def close_pool():
+    pool.close_all()
+
+
+def run_query(query: str, params: tuple = (), fetch: str = "all", cursor_factory=None, prepared: bool = False):
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=cursor_factory) as cursor:
+            if prepared:
+                execute_prepared(cursor, query, params)
+            else:
+                cursor.execute(query, params)
+            if fetch == "one":
+                return cursor.fetchone()
+            if fetch == "all":
+                return cursor.fetchall()
+            return cursor.rowcount
+
+
+async def run_query_async(query: str, params: tuple = (), fetch: str = "all", cursor_factory=None, prepared: bool = False):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(async_executor, lambda: run_query(query, params, fetch, cursor_factory, prepared))
@@ -1,37 +1,83 @@
 import logging
+import threading
 from sentence_transformers import SentenceTransformer
 from app.services.retriever import SentenceTransformerAdapter
+from app.services import admission, embedding_client, metrics
 
 logger = logging.getLogger(__name__)
+# Encoders are loaded on first use; benchmarks can set "encoder" to a local model beforehand
 embedding_models = {
     "greek": {
-        "encoder": SentenceTransformer('bowphs/SPhilBerta'),
+        "load": lambda: SentenceTransformer('bowphs/SPhilBerta'),
+        "encoder": None,
         "index_prefix": "",
         "index_suffix": "",
         "query_prefix": "",
         "query_suffix": "",
     },
     "latin": {
-        "encoder": SentenceTransformerAdapter('itserr/LaBERTa-W_VULG-S_VL-Synt', 'cuda'),
+        "load": lambda: SentenceTransformerAdapter('itserr/LaBERTa-W_VULG-S_VL-Synt', 'cuda'),
+        "encoder": None,
         "index_prefix": "",
         "index_suffix": "",
         "query_prefix": "",
         "query_suffix": "",
     }
 }
+load_lock = threading.Lock()
 
-def index_embedding(language, text):
+def get_encoder(language):
+    model = embedding_models[language]
+    if model["encoder"] is None:
+        with load_lock:
+            if model["encoder"] is None:
+                logger.info(f"Loading embedding model for {language}")
+                model["encoder"] = model["load"]()
+    return model["encoder"]
+
+# Single texts come from searches and are admitted ahead of the batches of runs, sweeps and indexing
+def encode(language, texts, kind, priority):
+    metrics.embedding_inflight.inc(language=language)
+    try:
+        with admission.admit("model", language, priority), metrics.embedding_duration.time(language=language, kind=kind):
+            # With an embedding server, the models are loaded once for all workers, in its process
+            if embedding_client.is_enabled():
+                embeddings = embedding_client.embed(language, kind, texts)
+            else:
+                embeddings = get_encoder(language).encode(texts)
+    finally:
+        metrics.embedding_inflight.dec(language=language)
+    metrics.embedding_batch_size.observe(1 if isinstance(texts, str) else len(texts), language=language, kind=kind)
+    return embeddings.tolist()
+
+def index_embedding(language, text, priority=admission.INTERACTIVE):
     if language not in embedding_models:
         logger.warning(f"No embedding model for language {language}")
         return []
     model = embedding_models[language]
     text = model["index_prefix"] + text + model["index_suffix"]
-    return model["encoder"].encode(text).tolist()
+    return encode(language, text, "index", priority)
 
-def query_embedding(language, text):
+def query_embedding(language, text, priority=admission.INTERACTIVE):
     if language not in embedding_models:
         logger.warning(f"No embedding model for language {language}")
         return []
     model = embedding_models[language]
     text = model["query_prefix"] + text + model["query_suffix"]
-    return model["encoder"].encode(text).tolist()
\ No newline at end of file
+    return encode(language, text, "query", priority)
+
+def index_embeddings(language, texts):
+    if language not in embedding_models:
+        logger.warning(f"No embedding model for language {language}")
+        return [[] for _ in texts]
+    model = embedding_models[language]
+    texts = [model["index_prefix"] + text + model["index_suffix"] for text in texts]
+    return encode(language, texts, "index", admission.BATCH)
+
+def query_embeddings(language, texts):
+    if language not in embedding_models:
+        logger.warning(f"No embedding model for language {language}")
+        return [[] for _ in texts]
+    model = embedding_models[language]
+    texts = [model["query_prefix"] + text + model["query_suffix"] for text in texts]
+    return encode(language, texts, "query", admission.BATCH)
\ No newline at end of file
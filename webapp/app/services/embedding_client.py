@@ -0,0 +1,92 @@
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import numpy as np
+
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET", "")
+EMBEDDING_SERVER_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "60"))
+EMBEDDING_SERVER_CONNECT_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_CONNECT_TIMEOUT", "30"))
+
+# Frames are two big-endian lengths, a JSON header and a binary payload (float32 embeddings)
+FRAME = struct.Struct("!II")
+
+connections = threading.local()
+
+
+def send_message(sock: socket.socket, header: dict, payload: bytes = b""):
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(FRAME.pack(len(data), len(payload)) + data + payload)
+
+
+def receive_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding server connection closed")
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def receive_message(sock: socket.socket) -> tuple[dict, bytes]:
+    header_size, payload_size = FRAME.unpack(receive_exactly(sock, FRAME.size))
+    header = json.loads(receive_exactly(sock, header_size))
+    return header, receive_exactly(sock, payload_size) if payload_size else b""
+
+
+def is_enabled() -> bool:
+    return bool(EMBEDDING_SERVER_SOCKET)
+
+
+def connect(path: str = EMBEDDING_SERVER_SOCKET, wait: float = EMBEDDING_SERVER_CONNECT_TIMEOUT) -> socket.socket:
+    # The server may still be loading its models when the workers start
+    deadline = time.monotonic() + wait
+    delay = 0.1
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            sock.settimeout(EMBEDDING_SERVER_TIMEOUT)
+            return sock
+        except OSError:
+            sock.close()
+            if time.monotonic() + delay > deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+
+def request(header: dict) -> tuple[dict, bytes]:
+    # One connection per thread, replaced once if the server was restarted in between
+    for attempt in range(2):
+        sock = getattr(connections, "socket", None)
+        if sock is None:
+            sock = connections.socket = connect()
+        try:
+            send_message(sock, header)
+            return receive_message(sock)
+        except socket.timeout:
+            sock.close()
+            connections.socket = None
+            raise
+        except OSError:
+            sock.close()
+            connections.socket = None
+            if attempt:
+                raise
+    raise ConnectionError("Embedding server unreachable")
+
+
+def embed(language: str, kind: str, texts) -> np.ndarray:
+    single = isinstance(texts, str)
+    batch = [texts] if single else list(texts)
+    if not batch:
+        return np.empty((0, 0), dtype=np.float32)
+    header, payload = request({"language": language, "kind": kind, "texts": batch})
+    if "error" in header:
+        raise RuntimeError(f"Embedding server failed: {header['error']}")
+    embeddings = np.frombuffer(payload, dtype=np.float32).reshape(header["shape"])
+    return embeddings[0] if single else embeddings
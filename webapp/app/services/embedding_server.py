@@ -0,0 +1,148 @@
+"""Embedding models shared by all web workers of a host.
+
+Run next to the web application, which then sends its embedding calls over the Unix
+socket set in EMBEDDING_SERVER_SOCKET instead of loading its own copy of the models:
+
+    EMBEDDING_SERVER_SOCKET=/tmp/embedding.sock python -m app.services.embedding_server
+"""
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+import numpy as np
+from app.logging_config import setup_logging
+from app.services.embedder import embedding_models, get_encoder
+from app.services.embedding_client import EMBEDDING_SERVER_SOCKET, connect, receive_message, send_message
+
+EMBEDDING_SERVER_MAX_BATCH = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "64"))
+EMBEDDING_SERVER_MAX_WAIT_MS = float(os.getenv("EMBEDDING_SERVER_MAX_WAIT_MS", "5"))
+EMBEDDING_SERVER_PRELOAD = os.getenv("EMBEDDING_SERVER_PRELOAD", "true").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+
+class Pending:
+    def __init__(self, texts: list):
+        self.texts = texts
+        self.done = threading.Event()
+        self.embeddings = None
+        self.error = None
+
+
+class Batcher:
+    # Requests of every worker for the same model and kind are encoded together
+    def __init__(self, language: str, kind: str):
+        self.language = language
+        self.kind = kind
+        self.queue = queue.Queue()
+        threading.Thread(target=self.run, name=f"batcher-{language}-{kind}", daemon=True).start()
+
+    def submit(self, texts: list) -> np.ndarray:
+        pending = Pending(texts)
+        self.queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.embeddings
+
+    def collect(self) -> list[Pending]:
+        # Waits at most EMBEDDING_SERVER_MAX_WAIT_MS after the first request for others to join
+        batch = [self.queue.get()]
+        count = len(batch[0].texts)
+        deadline = time.monotonic() + EMBEDDING_SERVER_MAX_WAIT_MS / 1000
+        while count < EMBEDDING_SERVER_MAX_BATCH:
+            try:
+                pending = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            batch.append(pending)
+            count += len(pending.texts)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            texts = [text for pending in batch for text in pending.texts]
+            try:
+                embeddings = np.asarray(get_encoder(self.language).encode(texts), dtype=np.float32)
+                offset = 0
+                for pending in batch:
+                    pending.embeddings = embeddings[offset:offset + len(pending.texts)]
+                    offset += len(pending.texts)
+                logger.debug(f"Encoded {len(texts)} {self.language} {self.kind} texts from {len(batch)} requests")
+            except Exception as e:
+                logger.error(f"Encoding {len(texts)} {self.language} {self.kind} texts failed: {e}")
+                for pending in batch:
+                    pending.error = e
+            for pending in batch:
+                pending.done.set()
+
+
+batchers = {}
+batchers_lock = threading.Lock()
+
+
+def get_batcher(language: str, kind: str) -> Batcher:
+    with batchers_lock:
+        if (language, kind) not in batchers:
+            batchers[(language, kind)] = Batcher(language, kind)
+        return batchers[(language, kind)]
+
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    # A connection stays open for all requests of a worker thread
+    def handle(self):
+        while True:
+            try:
+                header, _ = receive_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            language = header.get("language")
+            if language not in embedding_models:
+                send_message(self.request, {"error": f"No embedding model for language {language}"})
+                continue
+            try:
+                embeddings = get_batcher(language, header.get("kind", "query")).submit(header.get("texts", []))
+            except Exception as e:
+                send_message(self.request, {"error": str(e)})
+                continue
+            send_message(self.request, {"shape": list(embeddings.shape)}, embeddings.tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def preload():
+    for language in embedding_models:
+        start = time.perf_counter()
+        get_encoder(language).encode(["warmup"])
+        logger.info(f"Loaded embedding model for {language} in {time.perf_counter() - start:.2f}s")
+
+
+def serve(path: str = EMBEDDING_SERVER_SOCKET):
+    if not path:
+        raise SystemExit("EMBEDDING_SERVER_SOCKET is not set")
+    if os.path.exists(path):
+        try:
+            connect(path, wait=0).close()
+            raise SystemExit(f"An embedding server is already listening on {path}")
+        except OSError:
+            # Left behind by a server that did not shut down cleanly
+            os.unlink(path)
+    if EMBEDDING_SERVER_PRELOAD:
+        preload()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with EmbeddingServer(path, EmbeddingRequestHandler) as server:
+        logger.info(f"Embedding server listening on {path}")
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    serve()
@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import threading
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FRONTEND_DIR = os.getenv("FRONTEND_DIR", "frontend")
+FRONTEND_RELOAD = os.getenv("FRONTEND_RELOAD", "false").lower() == "true"
+FRONTEND_COMPRESS_MIN_SIZE = int(os.getenv("FRONTEND_COMPRESS_MIN_SIZE", "512"))
+
+static_re = re.compile(r"""(["'])/static/([^"'?#]+)\1""")
+compressible_re = re.compile(r"^(text/|application/(javascript|json|xml)|image/svg)")
+
+logger = logging.getLogger(__name__)
+
+
+class Asset:
+    # A file held in memory with its compressed encodings, computed once
+    def __init__(self, content: bytes, media_type: str):
+        self.media_type = media_type
+        self.digest = hashlib.sha256(content).hexdigest()[:16]
+        self.encodings = {"identity": content}
+        if len(content) >= FRONTEND_COMPRESS_MIN_SIZE and compressible_re.match(media_type):
+            self.encodings["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.encodings["br"] = brotli.compress(content, quality=11)
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        # Any encoding of the same content is a match
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*":
+                return True
+            tag = tag[2:] if tag.startswith("W/") else tag
+            if tag.strip('"').split("-")[0] == self.digest:
+                return True
+        return False
+
+    def select_encoding(self, accept_encoding: Optional[str]) -> str:
+        accepted = {
+            part.split(";")[0].strip().lower()
+            for part in (accept_encoding or "").split(",")
+            if not part.strip().endswith(("q=0", "q=0.0"))
+        }
+        for encoding in ("br", "gzip"):
+            if encoding in self.encodings and encoding in accepted:
+                return encoding
+        return "identity"
+
+
+static_assets: dict[str, Asset] = {}
+pages: dict[str, Asset] = {}
+mtimes: dict[str, float] = {}
+lock = threading.Lock()
+
+
+def media_type(path: str) -> str:
+    guessed, _ = mimetypes.guess_type(path)
+    if guessed and (guessed.startswith("text/") or guessed == "application/javascript"):
+        return f"{guessed}; charset=utf-8"
+    return guessed or "application/octet-stream"
+
+
+def scan() -> dict[str, float]:
+    files = {}
+    for directory, _, names in os.walk(FRONTEND_DIR):
+        for name in names:
+            path = os.path.join(directory, name)
+            files[os.path.relpath(path, FRONTEND_DIR).replace(os.sep, "/")] = os.path.getmtime(path)
+    return files
+
+
+def fingerprint(html: str) -> str:
+    # Static URLs carry the hash of their content, so browsers can cache them forever
+    def replace(match):
+        asset = static_assets.get(match.group(2))
+        if asset is None:
+            return match.group(0)
+        return f"{match.group(1)}/static/{match.group(2)}?v={asset.digest}{match.group(1)}"
+    return static_re.sub(replace, html)
+
+
+def load_frontend():
+    # New dicts are built aside and swapped in, so requests during a reload never see them partly filled
+    global static_assets, pages, mtimes
+    with lock:
+        files = scan()
+        assets = {}
+        for path in files:
+            with open(os.path.join(FRONTEND_DIR, path), "rb") as f:
+                assets[path] = Asset(f.read(), media_type(path))
+        static_assets = assets
+        new_pages = {}
+        for path, asset in assets.items():
+            if path.endswith(".html") and "/" not in path:
+                html = fingerprint(asset.encodings["identity"].decode("utf-8"))
+                new_pages[path] = Asset(html.encode("utf-8"), asset.media_type)
+        pages = new_pages
+        mtimes = files
+    logger.info(f"Loaded {len(assets)} frontend files, {len(new_pages)} pages, brotli {'enabled' if brotli else 'unavailable'}")
+
+
+def refresh():
+    # In reload mode, a change to any file reloads the whole frontend, so page fingerprints stay current
+    if FRONTEND_RELOAD and scan() != mtimes:
+        load_frontend()
+
+
+def get_page(name: str) -> Optional[Asset]:
+    return pages.get(name)
+
+
+def get_static(path: str) -> Optional[Asset]:
+    return static_assets.get(path)
@@ -1,13 +1,104 @@
 import os
+import re
 import logging
 import json
+from contextlib import contextmanager
+from typing import Optional
 from elasticsearch import Elasticsearch
 
 SUPPORTED_LANGUAGES = ["greek", "latin"] #, "arabic"]
+INDEX_SHARDS = os.getenv("INDEX_SHARDS")
+INDEX_REPLICAS = os.getenv("INDEX_REPLICAS")
+BULK_LOAD_MERGE_SEGMENTS = int(os.getenv("BULK_LOAD_MERGE_SEGMENTS", "1"))
+INDEX_LAYOUT = os.getenv("INDEX_LAYOUT", "language")
+ROUTING_MODE = os.getenv("ROUTING_MODE", "none")
+ROUTING_GROUPS_FILE = os.getenv("ROUTING_GROUPS_FILE", "assets/elasticsearch/routing-groups.json")
+invalid_index_chars_re = re.compile(r'[\\/*?"<>|\s,#:]+')
 
 logger = logging.getLogger(__name__)
 es = Elasticsearch(os.getenv("ELASTIC_URL", "http://localhost:9200"))
 
+def is_dataset_layout() -> bool:
+    return INDEX_LAYOUT == "dataset"
+
+
+def dataset_index_name(language: str, dataset: str) -> str:
+    # Each dataset has its own alias, and its physical indices also belong to the language alias
+    return f"{language}__{invalid_index_chars_re.sub('-', dataset.lower())}"
+
+
+def list_dataset_indices(language: str) -> list[str]:
+    response = es.indices.get(index=f"{language}__*", ignore_unavailable=True, allow_no_indices=True)
+    return sorted(response.keys())
+
+
+def load_routing_groups() -> dict:
+    # The file maps a group name to its books, e.g. {"pentateuch": ["genesis", "exodus"]}
+    if ROUTING_MODE != "book_group" or not os.path.exists(ROUTING_GROUPS_FILE):
+        return {}
+    with open(ROUTING_GROUPS_FILE, "r", encoding="UTF-8") as f:
+        groups = json.load(f)
+    return {book: group for group, books in groups.items() for book in books}
+
+
+routing_groups = load_routing_groups()
+
+
+def is_routing_enabled() -> bool:
+    return ROUTING_MODE in ("book", "book_group")
+
+
+def routing_value(book: str) -> str:
+    # Books outside every group are routed on their own
+    return routing_groups.get(book, book)
+
+
+def compute_routing(books: Optional[list[str]]) -> Optional[str]:
+    if not is_routing_enabled() or not books:
+        return None
+    return ",".join(sorted({routing_value(book) for book in books}))
+
+
+def version_name(base: str, version: int) -> str:
+    return f"{base}_v{version}"
+
+
+def list_versions(base: str) -> list[int]:
+    # Physical indices are named <base>_v<version> and sit behind the <base> alias
+    response = es.indices.get(index=f"{base}_v*", ignore_unavailable=True, allow_no_indices=True)
+    versions = []
+    for name in response:
+        suffix = name[len(base) + 2:]
+        if suffix.isdigit():
+            versions.append(int(suffix))
+    return sorted(versions)
+
+
+def get_alias_indices(alias: str) -> list[str]:
+    if not es.indices.exists_alias(name=alias):
+        return []
+    return list(es.indices.get_alias(name=alias).keys())
+
+
+def is_legacy_index(name: str) -> bool:
+    # Indices created before versioning use the alias name as a concrete index
+    return es.indices.exists(index=name) and not es.indices.exists_alias(name=name)
+
+
+def create_physical_index(language: str, index_name: str):
+    with open("assets/elasticsearch/mappings.json", "r", encoding="UTF-8") as f:
+        mappings = json.load(f)
+    with open(f"assets/elasticsearch/settings-{language.lower()}.json", "r", encoding="UTF-8") as f:
+        settings = json.load(f)
+    if INDEX_SHARDS:
+        settings.setdefault("index", {})["number_of_shards"] = int(INDEX_SHARDS)
+    if INDEX_REPLICAS:
+        settings.setdefault("index", {})["number_of_replicas"] = int(INDEX_REPLICAS)
+    if is_routing_enabled():
+        mappings["_routing"] = {"required": True}
+    es.indices.create(index=index_name, mappings=mappings, settings=settings)
+
+
 def create_index(language: str) -> dict:
     index_name = f"{language}"
     logger.info(f"Creating index for {language}")
@@ -16,33 +107,124 @@ def create_index(language: str) -> dict:
         logger.info(f"Language {language} is not supported")
         return {"success": False, "error": f"Unsupported language '{language}'"}
 
+    if is_dataset_layout():
+        logger.info(f"Indices for {language} are created when datasets are indexed")
+        return {"success": True, "message": f"Datasets are indexed in per-dataset indices behind '{index_name}'."}
+
     if es.indices.exists(index=index_name):
         logger.info(f"Index for {language} already exisys")
         return {"success": True, "message": f"Index '{index_name}' already exists."}
 
-    with open("assets/elasticsearch/mappings.json", "r", encoding="UTF-8") as f:
-        mappings = json.load(f)
-    with open(f"assets/elasticsearch/settings-{language.lower()}.json", "r", encoding="UTF-8") as f:
-        settings = json.load(f)
-    es.indices.create(index=index_name, mappings=mappings, settings=settings)
-    logger.info(f"Index for {language} created")
+    versions = list_versions(index_name)
+    physical_name = version_name(index_name, versions[-1] + 1 if versions else 1)
+    create_physical_index(language, physical_name)
+    es.indices.put_alias(index=physical_name, name=index_name, is_write_index=True)
+    logger.info(f"Index for {language} created as {physical_name}")
     return {"success": True, "message": f"Index '{index_name}' created."}
 
 
 def delete_index(language: str) -> dict:
     index_name = f"{language}"
     logger.info(f"Deleting index for {language}")
+    if is_dataset_layout():
+        for physical_name in list_dataset_indices(language):
+            es.indices.delete(index=physical_name)
+        logger.info(f"Dataset indices for {language} deleted")
+        return {"success": True, "message": f"Dataset indices behind '{index_name}' deleted."}
     if not es.indices.exists(index=index_name):
         logger.info(f"Index for {language} does not exist")
         return {"success": False, "message": f"Index '{index_name}' does not exist."}
-    es.indices.delete(index=index_name)
+    if is_legacy_index(index_name):
+        es.indices.delete(index=index_name)
+    else:
+        for version in list_versions(index_name):
+            es.indices.delete(index=version_name(index_name, version))
     logger.info(f"Index for {language} deleted")
     return {"success": True, "message": f"Index '{index_name}' deleted."}
 
 
-def reload_index(language: str) -> dict:
-    logger.info(f"Reloading index for {language}")
-    delete_result = delete_index(language)
-    if not delete_result["success"] and "does not exist" not in delete_result["message"]:
-        return delete_result
-    return create_index(language)
\ No newline at end of file
+def swap_alias(alias: str, new_index: str):
+    # A single update_aliases call is atomic: searches see either the old or the new index
+    actions = []
+    if is_legacy_index(alias):
+        actions.append({"remove_index": {"index": alias}})
+    else:
+        for old_index in get_alias_indices(alias):
+            actions.append({"remove": {"index": old_index, "alias": alias}})
+    actions.append({"add": {"index": new_index, "alias": alias, "is_write_index": True}})
+    es.indices.update_aliases(actions=actions)
+    logger.info(f"Alias {alias} now points to {new_index}")
+
+
+def swap_dataset_alias(language: str, base: str, new_index: str):
+    # Old versions leave both the dataset and the language alias in the same atomic call
+    actions = []
+    for old_index in get_alias_indices(base):
+        actions.append({"remove": {"index": old_index, "alias": base, "must_exist": False}})
+        actions.append({"remove": {"index": old_index, "alias": language, "must_exist": False}})
+    actions.append({"add": {"index": new_index, "alias": base, "is_write_index": True}})
+    actions.append({"add": {"index": new_index, "alias": language}})
+    es.indices.update_aliases(actions=actions)
+    logger.info(f"Aliases {base} and {language} now point to {new_index}")
+
+
+def delete_dataset_index(language: str, dataset: str) -> list[str]:
+    base = dataset_index_name(language, dataset)
+    removed = [version_name(base, version) for version in list_versions(base)]
+    for index_name in removed:
+        es.indices.delete(index=index_name)
+    return removed
+
+
+def delete_old_versions(base: str, keep: int) -> list[str]:
+    current = set(get_alias_indices(base))
+    old = [version_name(base, v) for v in list_versions(base) if version_name(base, v) not in current]
+    removed = old[:max(len(old) - keep, 0)]
+    for index_name in removed:
+        logger.info(f"Deleting old index version {index_name}")
+        es.indices.delete(index=index_name)
+    return removed
+
+
+def begin_bulk_load(index: str) -> dict:
+    logger.info(f"Suspending refresh and replicas on {index} for bulk load")
+    response = es.indices.get_settings(index=index, flat_settings=True)
+    current = next(iter(response.values()))["settings"]
+    previous = {
+        "index.refresh_interval": current.get("index.refresh_interval"),
+        "index.number_of_replicas": current.get("index.number_of_replicas"),
+    }
+    # An interrupted bulk load leaves the suspended values behind: restore defaults instead
+    if previous["index.refresh_interval"] == "-1":
+        previous = {
+            "index.refresh_interval": None,
+            "index.number_of_replicas": int(INDEX_REPLICAS) if INDEX_REPLICAS else None,
+        }
+    es.indices.put_settings(index=index, settings={
+        "index.refresh_interval": "-1",
+        "index.number_of_replicas": 0,
+    })
+    return previous
+
+
+def end_bulk_load(index: str, previous: dict):
+    # A None refresh interval resets the setting to the Elasticsearch default
+    logger.info(f"Restoring settings on {index} after bulk load")
+    es.indices.put_settings(index=index, settings=previous)
+    es.indices.refresh(index=index)
+    logger.info(f"Force merging {index} to {BULK_LOAD_MERGE_SEGMENTS} segments")
+    es.indices.forcemerge(index=index, max_num_segments=BULK_LOAD_MERGE_SEGMENTS)
+    logger.info(f"Bulk load on {index} completed")
+
+
+@contextmanager
+def bulk_load(index: str):
+    if not es.indices.exists(index=index):
+        logger.warning(f"Index {index} does not exist: skipping bulk load settings")
+        yield
+        return
+    previous = begin_bulk_load(index)
+    try:
+        yield
+    finally:
+        end_bulk_load(index, previous)
\ No newline at end of file
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+JOBS_DIR = Path("cache/jobs")
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS", "2"))
+JOBS_PER_LANGUAGE = int(os.getenv("JOBS_PER_LANGUAGE", "1"))
+JOBS_KEEP_FINISHED = int(os.getenv("JOBS_KEEP_FINISHED", "100"))
+ACTIVE_STATUSES = ("queued", "running")
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(max_workers=JOBS_MAX_WORKERS, thread_name_prefix="job")
+running_per_language = {}
+pending_per_language = {}
+scheduler_lock = threading.Lock()
+handlers = {}
+jobs = {}
+jobs_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, language: Optional[str], params: dict, id: Optional[str] = None):
+        self.id = id or uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.language = language
+        self.params = params
+        self.status = "queued"
+        self.message = ""
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = {"embedded": 0, "indexed": 0, "failed": 0, "searched": 0, "total": 0, "bytes_done": 0, "bytes_total": 0}
+        self.checkpoint = {}
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def advance(self, **counters):
+        with self.lock:
+            for name, value in counters.items():
+                self.progress[name] = self.progress.get(name, 0) + value
+
+    def commit(self, key: str, value, related: Optional[dict] = None):
+        # Checkpoints are persisted so an interrupted job resumes from its last committed chunk
+        with self.lock:
+            self.checkpoint[key] = value
+            self.checkpoint.update(related or {})
+        self.save()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} cancelled")
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            progress = dict(self.progress)
+            checkpoint = dict(self.checkpoint)
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+        processed = progress["indexed"] + progress["searched"]
+        throughput = processed / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.status == "running" and progress["bytes_done"] and progress["bytes_total"]:
+            remaining = progress["bytes_total"] - progress["bytes_done"]
+            eta = elapsed * remaining / progress["bytes_done"]
+        elif self.status == "running" and progress["searched"] and progress["total"]:
+            eta = elapsed * (progress["total"] - progress["searched"]) / progress["searched"]
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "language": self.language,
+            "params": self.params,
+            "status": self.status,
+            "message": self.message,
+            "result": self.result,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": progress,
+            "throughput": throughput,
+            "eta": eta,
+            "checkpoint": checkpoint,
+        }
+
+    def save(self):
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        path = JOBS_DIR / f"{self.id}.json"
+        temporary_path = path.with_suffix(".json.tmp")
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, default=str)
+        temporary_path.replace(path)
+
+    @classmethod
+    def load(cls, data: dict) -> "Job":
+        job = cls(data["kind"], data["language"], data["params"], id=data["id"])
+        job.status = data["status"]
+        job.message = data["message"]
+        job.result = data["result"]
+        job.created = data["created"]
+        job.started = data["started"]
+        job.finished = data["finished"]
+        job.progress.update(data["progress"])
+        job.checkpoint = data["checkpoint"]
+        return job
+
+
+def register_handler(kind: str, handler: Callable[[Job], dict], resumable: bool = True):
+    handlers[kind] = (handler, resumable)
+
+
+def schedule(job: Job):
+    # Jobs wait in a queue per language, so executor threads only run jobs that hold a language slot
+    with scheduler_lock:
+        if running_per_language.get(job.language, 0) < JOBS_PER_LANGUAGE:
+            running_per_language[job.language] = running_per_language.get(job.language, 0) + 1
+        else:
+            pending_per_language.setdefault(job.language, deque()).append(job)
+            return
+    executor.submit(run_job, job)
+
+
+def release_slot(language: Optional[str]):
+    # The slot is handed over to the next queued job of the language, if any
+    with scheduler_lock:
+        pending = pending_per_language.get(language)
+        if pending:
+            next_job = pending.popleft()
+        else:
+            running_per_language[language] -= 1
+            return
+    executor.submit(run_job, next_job)
+
+
+def prune_jobs():
+    # Only the most recent finished jobs are kept in memory and on disk
+    with jobs_lock:
+        finished = sorted((job for job in jobs.values() if job.status not in ACTIVE_STATUSES), key=lambda job: job.finished or job.created, reverse=True)
+        evicted = finished[JOBS_KEEP_FINISHED:]
+        for job in evicted:
+            del jobs[job.id]
+    for job in evicted:
+        (JOBS_DIR / f"{job.id}.json").unlink(missing_ok=True)
+
+
+def run_job(job: Job):
+    handler, _ = handlers[job.kind]
+    try:
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            job.finished = time.time()
+            job.save()
+            return
+        logger.info(f"Starting job {job.id} ({job.kind} {job.language or ''})")
+        job.status = "running"
+        job.started = job.started or time.time()
+        job.save()
+        try:
+            job.result = handler(job)
+            job.status = "done"
+            logger.info(f"Job {job.id} completed")
+        except JobCancelled:
+            job.status = "cancelled"
+            logger.info(f"Job {job.id} cancelled")
+        except Exception as e:
+            job.status = "failed"
+            job.message = str(e)
+            logger.error(f"Job {job.id} failed: {e}")
+        job.finished = time.time()
+        job.save()
+    finally:
+        release_slot(job.language)
+        prune_jobs()
+
+
+def submit_job(kind: str, language: Optional[str] = None, **params) -> Job:
+    job = Job(kind, language, params)
+    with jobs_lock:
+        jobs[job.id] = job
+    job.save()
+    schedule(job)
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    return jobs.get(job_id)
+
+
+def list_jobs(kind: Optional[str] = None, language: Optional[str] = None) -> list[Job]:
+    with jobs_lock:
+        selected = [job for job in jobs.values() if (kind is None or job.kind == kind) and (language is None or job.language == language)]
+    return sorted(selected, key=lambda job: job.created, reverse=True)
+
+
+def cancel_job(job_id: str) -> Optional[Job]:
+    job = jobs.get(job_id)
+    if job is not None and job.status in ACTIVE_STATUSES:
+        logger.info(f"Cancelling job {job_id}")
+        job.cancel_event.set()
+        job.message = "Cancellation requested"
+    return job
+
+
+def resume_jobs():
+    if not JOBS_DIR.exists():
+        return
+    for path in JOBS_DIR.glob("*.json"):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                job = Job.load(json.load(f))
+        except Exception as e:
+            logger.warning(f"Could not load job from {path}: {e}")
+            continue
+        with jobs_lock:
+            jobs[job.id] = job
+        if job.status not in ACTIVE_STATUSES:
+            continue
+        if job.kind not in handlers or not handlers[job.kind][1]:
+            job.status = "failed"
+            job.message = "Interrupted by a restart"
+            job.save()
+            continue
+        # Counters restart from the checkpoint, which is where the job resumes
+        logger.info(f"Resuming job {job.id} ({job.kind} {job.language or ''})")
+        job.status = "queued"
+        job.progress.update({"embedded": 0, "indexed": 0, "failed": 0, "searched": 0, "total": 0, "bytes_done": 0})
+        schedule(job)
+    prune_jobs()
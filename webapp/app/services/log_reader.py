@@ -0,0 +1,191 @@
+import glob
+import heapq
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Iterator, Optional
+from app.logging_config import LOG_DATE_FORMAT, LOG_FILE
+
+LOG_READ_CHUNK = 64 * 1024
+
+log_re = re.compile(r"^\[(.*?)\]\[(.*?)\]\[(.*?)\] (.*)$", re.DOTALL)
+
+
+def log_chains() -> list[list[str]]:
+    # One chain per log writer (webapp.log or webapp.<pid>.log): current file first, then the rotated ones from the most recent
+    directory, name = os.path.split(LOG_FILE)
+    stem, suffix = os.path.splitext(name)
+    current_re = re.compile(rf"^{re.escape(stem)}(\.\d+)?{re.escape(suffix)}$")
+    chains = []
+    for current in sorted(glob.glob(os.path.join(glob.escape(directory), glob.escape(stem) + "*" + suffix))):
+        if not current_re.match(os.path.basename(current)):
+            continue
+        rotated = []
+        for path in glob.glob(glob.escape(current) + ".*"):
+            try:
+                rotated.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        chains.append([current] + [path for _, path in sorted(rotated, reverse=True)])
+    return chains
+
+
+def read_lines_backwards(path: str, end: int) -> Iterator[tuple[int, bytes]]:
+    # Yields the lines before the end offset from the last one, with the offset where each starts
+    with open(path, "rb") as f:
+        position = end
+        remainder = b""
+        while position > 0:
+            size = min(LOG_READ_CHUNK, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + remainder).split(b"\n")
+            remainder = lines[0]
+            starts = []
+            offset = position + len(remainder) + 1
+            for line in lines[1:]:
+                starts.append(offset)
+                offset += len(line) + 1
+            for start, line in zip(reversed(starts), reversed(lines[1:])):
+                if line:
+                    yield start, line
+        if remainder:
+            yield 0, remainder
+
+
+def parse_line(line: str) -> Optional[dict]:
+    if line.startswith("{"):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        return entry if isinstance(entry, dict) and "level" in entry else None
+    match = log_re.match(line)
+    if not match:
+        return None
+    return {
+        "timestamp": match.group(1),
+        "level": match.group(2),
+        "service": match.group(3),
+        "message": match.group(4),
+    }
+
+
+def read_entries_backwards(path: str, end: int) -> Iterator[tuple[int, dict]]:
+    # Lines that are not entries, such as tracebacks, belong to the entry above them
+    continuation = []
+    for offset, raw in read_lines_backwards(path, end):
+        line = raw.decode("utf-8", errors="replace").rstrip("\r")
+        entry = parse_line(line)
+        if entry is None:
+            continuation.append(line)
+            continue
+        if continuation:
+            entry["message"] = "\n".join([entry["message"]] + continuation[::-1])
+            continuation = []
+        yield offset, entry
+
+
+def normalize_time(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).strftime(LOG_DATE_FORMAT)
+    except ValueError:
+        raise ValueError(f"Invalid time {value}, expected YYYY-MM-DD HH:MM:SS")
+
+
+def parse_cursor(cursor: str, chains: list[list[str]]) -> dict[int, tuple[int, int]]:
+    # One name:offset position per chain; chains started after the cursor only hold newer entries
+    locations = {os.path.basename(path): (chain_index, index) for chain_index, chain in enumerate(chains) for index, path in enumerate(chain)}
+    positions = {}
+    for part in cursor.split(","):
+        name, _, offset = part.rpartition(":")
+        if name not in locations or not offset.isdigit():
+            raise ValueError("Invalid cursor, the log may have been rotated or cleared")
+        chain_index, index = locations[name]
+        positions[chain_index] = (index, int(offset))
+    return positions
+
+
+def read_chain(chain: list[str], first: int, end: Optional[int], since: Optional[str]) -> Iterator[tuple[str, int, dict]]:
+    for index in range(first, len(chain)):
+        path = chain[index]
+        try:
+            if index > first and since and datetime.fromtimestamp(os.path.getmtime(path)).strftime(LOG_DATE_FORMAT) < since:
+                return
+            if end is None or index > first:
+                end = os.path.getsize(path)
+            for offset, entry in read_entries_backwards(path, end):
+                yield path, offset, entry
+        except FileNotFoundError:
+            # Rotated away while reading
+            continue
+
+
+def tail_log(
+    limit: int,
+    before: Optional[str] = None,
+    level: Optional[str] = None,
+    service: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> dict:
+    # Newest entries first; "next" is the cursor of the page of older entries
+    min_level = 0
+    if level:
+        min_level = logging.getLevelName(level.upper())
+        if not isinstance(min_level, int):
+            raise ValueError(f"Unknown level {level}")
+    since, until = normalize_time(since), normalize_time(until)
+    chains = log_chains()
+    if before:
+        starts = parse_cursor(before, chains)
+    else:
+        starts = {}
+        for chain_index, chain in enumerate(chains):
+            try:
+                starts[chain_index] = (0, os.path.getsize(chain[0]))
+            except FileNotFoundError:
+                starts[chain_index] = (0, 0)
+    positions = {chain_index: f"{os.path.basename(chains[chain_index][first])}:{end}" for chain_index, (first, end) in starts.items()}
+
+    # The files of every process are merged from the newest entry
+    def tagged(chain_index: int) -> Iterator[tuple[int, str, int, dict]]:
+        first, end = starts[chain_index]
+        for path, offset, entry in read_chain(chains[chain_index], first, end, since):
+            yield chain_index, path, offset, entry
+
+    items = []
+    merged = heapq.merge(*(tagged(chain_index) for chain_index in starts), key=lambda item: str(item[3].get("timestamp", "")), reverse=True)
+    for chain_index, path, offset, entry in merged:
+        positions[chain_index] = f"{os.path.basename(path)}:{offset}"
+        timestamp = str(entry.get("timestamp", ""))
+        if since and timestamp < since:
+            # Entries are in time order, all the following ones are older
+            return {"items": items, "next": None}
+        if until and timestamp > until:
+            continue
+        entry_level = logging.getLevelName(str(entry.get("level", "")).upper())
+        if isinstance(entry_level, int) and entry_level < min_level:
+            continue
+        if service and not str(entry.get("service", "")).startswith(service):
+            continue
+        items.append(entry)
+        if len(items) == limit:
+            return {"items": items, "next": ",".join(positions.values())}
+    return {"items": items, "next": None}
+
+
+def clear_log():
+    for current, *rotated in log_chains():
+        # The file stays open in its log writer, so it is truncated rather than removed
+        with open(current, "w", encoding="utf-8"):
+            pass
+        for path in rotated:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,130 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+registry = []
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        registry.append(self)
+
+    def key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            values = dict(self.values)
+        lines.extend(self.render_values(values))
+        return "\n".join(lines)
+
+    def render_values(self, values):
+        return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in values.items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self.lock:
+            values = {key: (list(state[0]), state[1], state[2]) for key, state in self.values.items()}
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(self.labels, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return "\n".join(lines)
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+search_requests = Counter("search_requests_total", "Search requests by language and outcome", ("language", "outcome"))
+search_duration = Histogram("search_duration_seconds", "End-to-end search duration", ("language",))
+embedding_batch_size = Histogram("embedding_batch_size", "Number of texts per embedding call", ("language", "kind"), buckets=SIZE_BUCKETS)
+embedding_duration = Histogram("embedding_duration_seconds", "Embedding call duration", ("language", "kind"))
+embedding_inflight = Gauge("embedding_inflight", "Embedding calls currently running or waiting for the model", ("language",))
+embedding_cache = Counter("embedding_cache_total", "Embedded dataset cache lookups by result", ("language", "result"))
+elasticsearch_duration = Histogram("elasticsearch_request_duration_seconds", "Elasticsearch request duration", ("operation",))
+bulk_documents = Counter("bulk_documents_total", "Documents sent through bulk indexing by outcome", ("language", "outcome"))
+bulk_duration = Histogram("bulk_duration_seconds", "Duration of a bulk indexing run", ("language",), buckets=(1, 5, 10, 30, 60, 300, 600, 1800, 3600))
+bulk_throughput = Gauge("bulk_documents_per_second", "Throughput of the last bulk indexing run", ("language",))
+postgres_duration = Histogram("postgres_query_duration_seconds", "Postgres statement duration", ("statement",))
+postgres_connections = Gauge("postgres_pool_connections", "Pooled Postgres connections by state", ("state",))
+admission_active = Gauge("admission_active", "Admitted model and Elasticsearch calls currently running", ("resource", "language"))
+admission_queued = Gauge("admission_queued", "Model and Elasticsearch calls waiting for admission", ("resource", "language", "priority"))
+admission_rejections = Counter("admission_rejections_total", "Calls rejected by admission control", ("resource", "language", "priority", "reason"))
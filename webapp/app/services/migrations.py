@@ -0,0 +1,148 @@
+import glob
+import logging
+import os
+import re
+import time
+import psycopg2
+from app.services.db import get_connection, open_connection
+
+MIGRATIONS_ENABLED = os.getenv("MIGRATIONS_ENABLED", "true").lower() == "true"
+MIGRATIONS_DIR = os.getenv("MIGRATIONS_DIR", "assets/postgres/migrations")
+RESULT_CASE_PARTITIONING = os.getenv("RESULT_CASE_PARTITIONING", "none")
+RESULT_CASE_PARTITION_SIZE = int(os.getenv("RESULT_CASE_PARTITION_SIZE", "100"))
+
+# Advisory lock key, so only one worker applies migrations when several start together
+MIGRATION_LOCK = 4044
+migration_re = re.compile(r"^(\d+)_\w+\.sql$")
+
+logger = logging.getLogger(__name__)
+
+PARTITION_RESULT_CASE = """
+    ALTER TABLE result_case RENAME TO result_case_unpartitioned;
+    ALTER TABLE result_case_unpartitioned RENAME CONSTRAINT result_case_pkey TO result_case_unpartitioned_pkey;
+    CREATE TABLE result_case (
+      id INTEGER NOT NULL DEFAULT nextval('result_case_id_seq'),
+      test_case_id INTEGER REFERENCES test_case(id) ON DELETE CASCADE,
+      result_collection_id INTEGER NOT NULL REFERENCES result_collection(id) ON DELETE CASCADE,
+      rank_of_expected INTEGER,
+      hit_ids TEXT[],
+      hit_scores REAL[],
+      hit_count INTEGER,
+      took REAL,
+      score_stats JSONB,
+      timestamp TIMESTAMPTZ DEFAULT NOW(),
+      PRIMARY KEY (result_collection_id, id)
+    ) PARTITION BY RANGE (result_collection_id);
+    ALTER SEQUENCE result_case_id_seq OWNED BY result_case.id;
+"""
+
+# Comments on a case reference it through (result_collection_id, id), the key of the partitioned table
+MOVE_RESULT_CASES = """
+    INSERT INTO result_case (id, test_case_id, result_collection_id, rank_of_expected, hit_ids, hit_scores, hit_count, took, score_stats, timestamp)
+    SELECT id, test_case_id, result_collection_id, rank_of_expected, hit_ids, hit_scores, hit_count, took, score_stats, timestamp
+    FROM result_case_unpartitioned
+    WHERE result_collection_id IS NOT NULL;
+
+    UPDATE comment c SET result_collection_id = r.result_collection_id
+    FROM result_case r
+    WHERE c.result_case_id = r.id AND c.result_collection_id IS NULL;
+    ALTER TABLE comment DROP CONSTRAINT IF EXISTS comment_result_case_id_fkey;
+    ALTER TABLE comment ADD CONSTRAINT comment_result_case_id_fkey
+      FOREIGN KEY (result_collection_id, result_case_id) REFERENCES result_case (result_collection_id, id) ON DELETE CASCADE;
+
+    DROP TABLE result_case_unpartitioned;
+    CREATE INDEX result_case_test_case_idx ON result_case (test_case_id);
+"""
+
+
+def list_migrations() -> list[tuple[int, str]]:
+    migrations = []
+    for path in glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql")):
+        match = migration_re.match(os.path.basename(path))
+        if match:
+            migrations.append((int(match.group(1)), path))
+    return sorted(migrations)
+
+
+def partition_bounds(result_collection_id: int) -> tuple[str, int, int]:
+    start = result_collection_id // RESULT_CASE_PARTITION_SIZE * RESULT_CASE_PARTITION_SIZE
+    return f"result_case_p{start}", start, start + RESULT_CASE_PARTITION_SIZE
+
+
+def create_partition(cursor, result_collection_id: int):
+    name, start, end = partition_bounds(result_collection_id)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF result_case FOR VALUES FROM ({start}) TO ({end})")
+
+
+def is_partitioned(cursor) -> bool:
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'result_case'::regclass")
+    return cursor.fetchone()[0] == "p"
+
+
+def partition_result_case(cursor):
+    # Rebuilds result_case as a table partitioned by ranges of result collections, in one transaction
+    if is_partitioned(cursor):
+        return
+    logger.info(f"Partitioning result_case by blocks of {RESULT_CASE_PARTITION_SIZE} result collections")
+    cursor.execute(PARTITION_RESULT_CASE)
+    cursor.execute("SELECT id FROM result_collection")
+    starts = {partition_bounds(row[0])[1] for row in cursor.fetchall()}
+    for start in sorted(starts):
+        create_partition(cursor, start)
+    cursor.execute(MOVE_RESULT_CASES)
+
+
+def ensure_result_case_partition(result_collection_id: int):
+    # New result collections get their partition before any of their cases is stored
+    if RESULT_CASE_PARTITIONING != "collection":
+        return
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                create_partition(cursor, result_collection_id)
+    except psycopg2.Error as e:
+        logger.warning(f"Could not create the result case partition of result collection {result_collection_id}: {e}")
+
+
+def apply_migrations():
+    # Applies the migrations not yet recorded in schema_migrations, each in its own transaction
+    if not MIGRATIONS_ENABLED:
+        return
+    try:
+        conn = open_connection(statement_timeout=0)
+    except psycopg2.Error as e:
+        # Serving on a schema of unknown version would fail later on every result endpoint
+        logger.error(f"Could not connect to Postgres to apply migrations: {e}")
+        raise
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK,))
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                  version INTEGER PRIMARY KEY,
+                  name TEXT NOT NULL,
+                  applied_at TIMESTAMPTZ DEFAULT NOW()
+                )
+            """)
+            conn.commit()
+            cursor.execute("SELECT version FROM schema_migrations")
+            applied = {row[0] for row in cursor.fetchall()}
+            for version, path in list_migrations():
+                if version in applied:
+                    continue
+                name = os.path.basename(path)
+                start = time.perf_counter()
+                with open(path, encoding="utf-8") as f:
+                    cursor.execute(f.read())
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+                logger.info(f"Applied migration {name} in {time.perf_counter() - start:.1f}s")
+            if RESULT_CASE_PARTITIONING == "collection":
+                partition_result_case(cursor)
+                conn.commit()
+    except (psycopg2.Error, OSError) as e:
+        conn.rollback()
+        logger.error(f"Migration failed, the schema is out of date: {e}")
+        raise
+    finally:
+        conn.close()
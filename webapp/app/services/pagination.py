@@ -0,0 +1,30 @@
+import os
+from typing import Optional
+
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "100"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+
+
+def select_columns(fields: Optional[str], columns: dict, default: list[str]) -> list[str]:
+    # columns maps the field names accepted in ?fields= to their SQL expressions, the id is always returned
+    names = [name.strip() for name in fields.split(",") if name.strip()] if fields else default
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ValueError(f"Unknown fields {', '.join(unknown)}, expected some of {', '.join(columns)}")
+    names = ["id"] + [name for name in names if name != "id"]
+    return [f"{columns[name]} AS {name}" for name in names]
+
+
+def check_limit(limit: int) -> int:
+    if limit < 1 or limit > PAGE_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {PAGE_MAX_LIMIT}")
+    return limit
+
+
+def make_page(rows: list, limit: int, total: Optional[int] = None) -> dict:
+    # One row more than the limit is fetched to know whether another page follows
+    items = rows[:limit]
+    page = {"items": items, "next": items[-1]["id"] if len(rows) > limit else None}
+    if total is not None:
+        page["total"] = total
+    return page
@@ -0,0 +1,74 @@
+import logging
+import os
+from typing import Optional
+from elasticsearch import Elasticsearch
+from app.services import admission, data_indexer, index_manager, jobs
+from app.services.search_engine import search
+from app.services.warmup import get_sample_queries
+
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "1"))
+SMOKE_QUERIES = int(os.getenv("REINDEX_SMOKE_QUERIES", "10"))
+
+logger = logging.getLogger(__name__)
+es = Elasticsearch(os.getenv("ELASTIC_URL", "http://localhost:9200"))
+
+
+def validate_index(language: str, index: str, expected: int) -> tuple[bool, str]:
+    es.indices.refresh(index=index)
+    count = es.count(index=index)["count"]
+    if count == 0 or count != expected:
+        return False, f"Document count {count} does not match the {expected} indexed documents"
+    for query in get_sample_queries(language, SMOKE_QUERIES):
+        result = search(language, query, index=index, size=10, priority=admission.BATCH)
+        if not result["count"]:
+            return False, f"Smoke query '{query}' returned no results"
+    return True, f"{count} documents validated"
+
+
+def rebuild(language: str, job: Optional[jobs.Job] = None) -> dict:
+    alias = language
+    if index_manager.is_dataset_layout():
+        # Every dataset is validated and swapped into the alias on its own
+        logger.info(f"Rebuilding every dataset index behind {alias}")
+        results = data_indexer.index_language(language, bulk_load=True, job=job)
+        return {"success": all(result.get("success") for result in results.values() if isinstance(result, dict)), "datasets": results}
+
+    versions = index_manager.list_versions(alias)
+    new_index = index_manager.version_name(alias, versions[-1] + 1 if versions else 1)
+    logger.info(f"Rebuilding {alias} into {new_index}")
+    index_manager.create_physical_index(language, new_index)
+
+    try:
+        # Embeddings are served from the embedding cache, so only Elasticsearch work is repeated
+        results = data_indexer.index_language(language, bulk_load=True, index=new_index, job=job)
+        expected = sum(result.get("indexed", 0) for result in results.values() if isinstance(result, dict))
+        valid, message = validate_index(language, new_index, expected)
+    except jobs.JobCancelled:
+        es.indices.delete(index=new_index, ignore_unavailable=True)
+        raise
+    except Exception as e:
+        valid, message = False, str(e)
+
+    if not valid:
+        logger.error(f"Rebuild of {alias} failed: {message}")
+        es.indices.delete(index=new_index, ignore_unavailable=True)
+        raise RuntimeError(message)
+
+    index_manager.swap_alias(alias, new_index)
+    removed = index_manager.delete_old_versions(alias, INDEX_KEEP_VERSIONS)
+    message = f"{message}, '{alias}' now points to '{new_index}'"
+    logger.info(f"Rebuild of {alias} completed: {message}")
+    return {"success": True, "message": message, "index": new_index, "removed": removed}
+
+
+def start_rebuild(language: str) -> dict:
+    if language not in index_manager.SUPPORTED_LANGUAGES:
+        return {"success": False, "error": f"Unsupported language '{language}'"}
+    if any(job.status in jobs.ACTIVE_STATUSES for job in jobs.list_jobs("rebuild", language)):
+        return {"success": False, "message": f"A rebuild of '{language}' is already running."}
+    job = jobs.submit_job("rebuild", language)
+    return {"success": True, "message": f"Rebuild of '{language}' started.", "jobId": job.id}
+
+
+# A half-filled version cannot be trusted after a restart, so rebuilds start over instead of resuming
+jobs.register_handler("rebuild", lambda job: rebuild(job.language, job), resumable=False)
\ No newline at end of file
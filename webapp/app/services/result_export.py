@@ -0,0 +1,105 @@
+import csv
+import io
+import logging
+import os
+import zipfile
+from typing import Iterator
+from psycopg2.extras import RealDictCursor
+from app.services.db import get_connection
+from app.services.result_store import fetch_documents
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "20"))
+BASE_FIELDS = ["source", "query", "target", "position", "found", "id", "content"]
+
+logger = logging.getLogger(__name__)
+
+
+class ZipStream(io.RawIOBase):
+    # Unseekable sink for ZipFile: written bytes are buffered until the response drains them
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def case_rows(case: dict, documents: dict) -> tuple[list, list]:
+    rows = []
+    max_variant = 0
+    for position, hit_id in enumerate(case["hit_ids"] or []):
+        document = documents.get(hit_id) or {"id": hit_id, "content": None}
+        row = {
+            "source": case["source"],
+            "query": case["content"],
+            "target": case["target"],
+            "position": position + 1,
+            "found": case["target"] == hit_id,
+            "id": hit_id,
+            "content": document["content"],
+        }
+        for index, variant in enumerate(document.get("variant", []), start=1):
+            row[f"variant_{index}_source"] = variant["source"]
+            row[f"variant_{index}_content"] = variant["content"]
+            max_variant = max(max_variant, index)
+        rows.append(row)
+    fieldnames = list(BASE_FIELDS)
+    for index in range(1, max_variant + 1):
+        fieldnames += [f"variant_{index}_source", f"variant_{index}_content"]
+    return fieldnames, rows
+
+
+def write_case(archive: zipfile.ZipFile, case: dict, documents: dict):
+    fieldnames, rows = case_rows(case, documents)
+    with archive.open(f"test_case_{case['id']}.csv", "w") as entry:
+        with io.TextIOWrapper(entry, encoding="utf-8", newline="") as text:
+            writer = csv.DictWriter(text, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def fetch_batch_documents(cases: list) -> dict:
+    # One ids query per language and batch instead of one per case
+    ids = {}
+    for case in cases:
+        ids.setdefault(case["language"], []).extend(case["hit_ids"] or [])
+    documents = {}
+    for language, language_ids in ids.items():
+        documents[language] = fetch_documents(language, language_ids)
+    return documents
+
+
+def iter_result_collection_zip(collection_id: int) -> Iterator[bytes]:
+    # Cases are read in batches through a server-side cursor and every CSV is compressed into the
+    # archive and sent as soon as it is written, so memory does not depend on the size of the export
+    stream = ZipStream()
+    conn = get_connection()
+    try:
+        with conn.cursor(name=f"export_{collection_id}", cursor_factory=RealDictCursor) as cursor:
+            cursor.itersize = EXPORT_BATCH_SIZE
+            cursor.execute("""
+                SELECT tc.id, tc.source, tc.content, tc.target, tc.language, rc.hit_ids
+                FROM result_case rc JOIN test_case tc ON rc.test_case_id = tc.id
+                WHERE rc.result_collection_id = %s
+                ORDER BY rc.id
+            """, (collection_id,))
+            with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+                while True:
+                    cases = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                    if not cases:
+                        break
+                    documents = fetch_batch_documents(cases)
+                    for case in cases:
+                        write_case(archive, case, documents.get(case["language"], {}))
+                        yield stream.drain()
+            yield stream.drain()
+    finally:
+        conn.close()
@@ -0,0 +1,75 @@
+import logging
+import numpy as np
+from psycopg2.extras import execute_values
+from app.services.db import get_connection
+
+RECALL_MAX_K = 50
+
+logger = logging.getLogger(__name__)
+
+
+def compute_metrics(histogram: dict) -> dict:
+    # histogram maps rank_of_expected (-1 when missed) to its number of cases
+    counts = np.zeros(RECALL_MAX_K + 1, dtype=np.int64)
+    ranks = np.array([rank for rank in histogram if rank > 0], dtype=np.int64)
+    found_counts = np.array([histogram[rank] for rank in ranks], dtype=np.int64)
+    total = int(sum(histogram.values()))
+    found = int(found_counts.sum())
+    within = ranks <= RECALL_MAX_K
+    np.add.at(counts, ranks[within], found_counts[within])
+    return {
+        "total": total,
+        "found": found,
+        "mrr": float((found_counts / ranks).sum() / total) if total else 0.0,
+        "mean_rank": float((found_counts * ranks).sum() / found) if found else 0.0,
+        "recall_at_k": (np.cumsum(counts) / total).tolist() if total else [0.0] * (RECALL_MAX_K + 1),
+    }
+
+
+def fetch_histograms(cursor, result_collection_ids: list[int]) -> dict:
+    # Rows are unpacked as tuples, so a plain cursor is used even when the caller's returns dicts
+    histograms = {result_collection_id: {} for result_collection_id in result_collection_ids}
+    with cursor.connection.cursor() as plain:
+        plain.execute("""
+            SELECT result_collection_id, rank_of_expected, COUNT(*)
+            FROM result_case
+            WHERE result_collection_id = ANY(%s)
+            GROUP BY result_collection_id, rank_of_expected
+        """, (list(result_collection_ids),))
+        for result_collection_id, rank, count in plain.fetchall():
+            histograms[result_collection_id][rank if rank is not None else -1] = count
+    return histograms
+
+
+def store_metrics(cursor, metrics: dict):
+    # Upserted, so metrics computed while a run was still going are replaced when it ends
+    execute_values(cursor, """
+        INSERT INTO result_metrics (result_collection_id, total, found, mrr, mean_rank, recall_at_k)
+        VALUES %s
+        ON CONFLICT (result_collection_id) DO UPDATE SET
+            total = EXCLUDED.total, found = EXCLUDED.found, mrr = EXCLUDED.mrr,
+            mean_rank = EXCLUDED.mean_rank, recall_at_k = EXCLUDED.recall_at_k, computed_at = NOW()
+    """, [
+        (result_collection_id, m["total"], m["found"], m["mrr"], m["mean_rank"], m["recall_at_k"])
+        for result_collection_id, m in metrics.items()
+    ])
+
+
+def compute_and_store(cursor, result_collection_ids: list[int]) -> dict:
+    # One grouped query for every requested run, whatever their number
+    if not result_collection_ids:
+        return {}
+    metrics = {
+        result_collection_id: compute_metrics(histogram)
+        for result_collection_id, histogram in fetch_histograms(cursor, result_collection_ids).items()
+    }
+    store_metrics(cursor, metrics)
+    return metrics
+
+
+def update_metrics(result_collection_id: int) -> dict:
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            metrics = compute_and_store(cursor, [result_collection_id])[result_collection_id]
+    logger.info(f"Result collection {result_collection_id}: MRR {metrics['mrr']:.3f}, {metrics['found']}/{metrics['total']} found")
+    return metrics
@@ -0,0 +1,62 @@
+import logging
+import os
+from typing import Optional
+from elasticsearch import Elasticsearch
+from app.services import metrics
+from app.services.search_engine import parse_result
+
+logger = logging.getLogger(__name__)
+es = Elasticsearch(os.getenv("ELASTIC_URL", "http://localhost:9200"))
+
+
+def compact_result(result: dict) -> dict:
+    # Only what cannot be recomputed is stored: hits as ordered id and score arrays, counts and score statistics
+    stats = result.get("stats") or {}
+    return {
+        "hit_ids": [hit["id"] for hit in result["results"]],
+        "hit_scores": [hit["score"] for hit in result["results"]],
+        "hit_count": result["count"],
+        "took": result["time"].get("took"),
+        "score_stats": {name: stats[name] for name in ("score_stats", "score_percentiles") if name in stats},
+    }
+
+
+def fetch_documents(language: str, ids: list[str]) -> dict:
+    # Document ids are also the Elasticsearch ids, and an ids query works across every index behind the alias
+    if not ids:
+        return {}
+    try:
+        with metrics.elasticsearch_duration.time(operation="documents"):
+            response = es.search(
+                index=language,
+                query={"ids": {"values": list(set(ids))}},
+                size=len(set(ids)),
+                source_excludes=["embedding", "variant.embedding"],
+            )
+    except Exception as e:
+        logger.error(f"Could not fetch {len(ids)} documents from {language}: {e}")
+        return {}
+    return {hit["_source"]["id"]: parse_result(hit) for hit in response["hits"]["hits"]}
+
+
+def expand_hits(hit_ids: list[str], hit_scores: list[float], documents: dict) -> list[dict]:
+    # Documents removed from the index since the run are returned with their id and score only
+    hits = []
+    for hit_id, score in zip(hit_ids or [], hit_scores or []):
+        hit = dict(documents.get(hit_id) or {"id": hit_id, "content": None, "variant": []})
+        hit["score"] = score
+        hits.append(hit)
+    return hits
+
+
+def expand_result(language: str, row: dict, facets: Optional[dict] = None) -> dict:
+    # Rebuilds the search response format from a compact result case
+    stats = dict(row.get("score_stats") or {})
+    if facets:
+        stats["unfiltered"] = facets
+    return {
+        "time": {"took": row.get("took")},
+        "count": row.get("hit_count") or 0,
+        "results": expand_hits(row.get("hit_ids"), row.get("hit_scores"), fetch_documents(language, row.get("hit_ids") or [])),
+        "stats": stats,
+    }
@@ -12,7 +12,8 @@ class SentenceTransformerAdapter:
         self.tokenizer = self.model.tokenizer
 
     def encode(self, texts, normalize=True):
-        if isinstance(texts, str):
+        single = isinstance(texts, str)
+        if single:
             texts = [texts]
         inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors='pt', max_length=512)
         inputs = {k: v.to(self.device) for k, v in inputs.items()}
@@ -20,4 +21,5 @@ class SentenceTransformerAdapter:
             embeddings = self.model.get_embeddings(**inputs)
         if normalize:
             embeddings = F.normalize(embeddings, p=2, dim=-1)
-        return embeddings.cpu().numpy()[0]
\ No newline at end of file
+        embeddings = embeddings.float().cpu().numpy()
+        return embeddings[0] if single else embeddings
\ No newline at end of file
@@ -1,11 +1,19 @@
 from typing import List, Optional
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from elasticsearch import Elasticsearch
 import os
 from app.services.embedder import query_embedding
+from app.services import admission, index_manager, metrics
 
 logger = logging.getLogger(__name__)
 es = Elasticsearch(os.getenv("ELASTIC_URL", "http://localhost:9200"))
+FACETS_TTL = float(os.getenv("FACETS_TTL", "300"))
+facets_cache = {}
+fanout_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SEARCH_FANOUT_WORKERS", "4")), thread_name_prefix="fanout")
+SEMANTIC_K = 11
+SEMANTIC_NUM_CANDIDATES = 10000
 
 def compute_filters(
     books: Optional[List[str]] = None,
@@ -84,7 +92,7 @@ def compute_semantic_query(
         filters: List,
         semantic_weight: float,
         variant_semantic_weight: float,
-        k: int = 11,
+        k: int = SEMANTIC_K,
 ):
     semantic_query = []
     if semantic_weight > 0:
@@ -92,7 +100,7 @@ def compute_semantic_query(
             "field": "embedding",
             "query_vector": embedding,
             "k": k,
-            "num_candidates": 10000,
+            "num_candidates": SEMANTIC_NUM_CANDIDATES,
             "boost": semantic_weight,
             "filter": filters
         })
@@ -101,16 +109,17 @@ def compute_semantic_query(
             "field": "variant.embedding",
             "query_vector": embedding,
             "k": k,
-            "num_candidates": 10000,
+            "num_candidates": SEMANTIC_NUM_CANDIDATES,
             "boost": variant_semantic_weight,
             "filter": filters
         })
     return semantic_query
 
 
-def compute_aggs(score_stats):
-    aggs = {
-        "unfiltered": {
+def compute_aggs(score_stats, unfiltered=True):
+    aggs = {}
+    if unfiltered:
+        aggs["unfiltered"] = {
             "global": {},
             "aggs": {
                 "by_source": {
@@ -134,8 +143,7 @@ def compute_aggs(score_stats):
                     }
                 }
             }
-        },
-    }
+        }
     if score_stats:
         aggs["score_stats"] = {
             "extended_stats": {
@@ -168,9 +176,32 @@ def parse_result(hit):
     }
 
 
-def search(
-    language: str,
+def normalize_query(query_text: str) -> str:
+    return " ".join(query_text.split())
+
+
+def format_server_timing(timings: dict) -> str:
+    return ", ".join(f"{stage};dur={duration:.2f}" for stage, duration in timings.items())
+
+
+class StageTimer:
+    def __init__(self):
+        self.timings = {}
+        self.start = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.timings[stage] = (now - self.start) * 1000
+        self.start = now
+
+    def finish(self) -> dict:
+        self.timings["total"] = sum(duration for stage, duration in self.timings.items() if stage != "took")
+        return self.timings
+
+
+def compute_search_body(
     query_text: str,
+    embedding: List,
     text_weight: float = 0.0,
     shingle_weight: float = 0.0,
     trigram_weight: float = 0.0,
@@ -183,10 +214,9 @@ def search(
     sources: Optional[List[str]] = None,
     size: int = 50,
     score_stats: bool = False,
+    profile: bool = False,
+    unfiltered: bool = True,
 ):
-    index = language
-    logger.info(f"Incoming query for '{query_text}' on '{language}'")
-    embedding = query_embedding(language, query_text)
     filters = compute_filters(books, sources)
     syntactic_query = compute_language_query(
         query_text, filters,
@@ -194,30 +224,208 @@ def search(
         variant_text_weight, variant_shingle_weight, variant_trigram_weight
     )
     semantic_query = compute_semantic_query(embedding, filters, semantic_weight, variant_semantic_weight)
-    aggs = compute_aggs(score_stats)
+    return {
+        "query": syntactic_query,
+        "knn": semantic_query,
+        "aggs": compute_aggs(score_stats, unfiltered),
+        "track_total_hits": True,
+        "size": size,
+        "profile": profile,
+    }
+
+
+def parse_response(response, timings: dict, profile: bool = False) -> dict:
+    timings["took"] = float(response["took"])
+    result = {
+        "time": timings,
+        "count": response["hits"]["total"]["value"],
+        "results": [parse_result(hit) for hit in response["hits"]["hits"]],
+        "stats": response.get("aggregations", {})
+    }
+    if profile:
+        result["profile"] = response.get("profile")
+    return result
+
+
+def empty_result(timings: dict) -> dict:
+    return {
+        "time": timings,
+        "count": 0,
+        "results": [],
+        "stats": []
+    }
+
+
+def resolve_index(language: str, sources: Optional[List[str]]):
+    # With per-dataset indices, the sources filter becomes a selection of indices
+    if index_manager.is_dataset_layout() and sources:
+        indices = ",".join(index_manager.dataset_index_name(language, source) for source in sources)
+        return indices, None, True
+    return language, sources, False
+
+
+def get_language_facets(language: str) -> dict:
+    # Facets over the whole language cannot come from a search restricted to some indices
+    cached = facets_cache.get(language)
+    if cached and time.monotonic() - cached[0] < FACETS_TTL:
+        return cached[1]
+    with metrics.elasticsearch_duration.time(operation="facets"):
+        response = es.search(index=language, size=0, aggs=compute_aggs(False))
+    facets = response["aggregations"]["unfiltered"]
+    facets_cache[language] = (time.monotonic(), facets)
+    return facets
+
+
+def search(
+    language: str,
+    query_text: str,
+    text_weight: float = 0.0,
+    shingle_weight: float = 0.0,
+    trigram_weight: float = 0.0,
+    variant_text_weight: float = 0.0,
+    variant_shingle_weight: float = 0.0,
+    variant_trigram_weight: float = 0.0,
+    semantic_weight: float = 1.0,
+    variant_semantic_weight: float = 0.5,
+    books: Optional[List[str]] = None,
+    sources: Optional[List[str]] = None,
+    size: int = 50,
+    score_stats: bool = False,
+    profile: bool = False,
+    index: Optional[str] = None,
+    priority: str = admission.INTERACTIVE,
+):
+    selected = False
+    if index is None:
+        index, sources, selected = resolve_index(language, sources)
+    timer = StageTimer()
+    query_text = normalize_query(query_text)
+    timer.lap("normalize")
+    logger.info(f"Incoming query for '{query_text}' on '{language}'")
+    embedding = query_embedding(language, query_text, priority)
+    timer.lap("embed")
+    body = compute_search_body(
+        query_text, embedding,
+        text_weight, shingle_weight, trigram_weight,
+        variant_text_weight, variant_shingle_weight, variant_trigram_weight,
+        semantic_weight, variant_semantic_weight,
+        books, sources, size, score_stats, profile, not selected,
+    )
+    timer.lap("build")
 
     try:
-        response = es.search(
-            index=index,
-            query=syntactic_query,
-            knn=semantic_query,
-            aggs=aggs,
-            track_total_hits=True,
-            size=size,
-        )
-        result =  {
-            "time": response["took"],
-            "count": response["hits"]["total"]["value"],
-            "results": [parse_result(hit) for hit in response["hits"]["hits"]],
-            "stats": response["aggregations"]
-        }
+        with admission.admit("elasticsearch", language, priority), metrics.elasticsearch_duration.time(operation="search"):
+            response = es.search(
+                index=index,
+                ignore_unavailable=selected,
+                routing=index_manager.compute_routing(books),
+                **body,
+            )
+        timer.lap("es")
+        result = parse_response(response, timer.timings, profile)
+        if selected:
+            result["stats"]["unfiltered"] = get_language_facets(language)
+        timer.lap("parse")
+        metrics.search_requests.inc(language=language, outcome="ok")
+    except admission.Overloaded:
+        raise
     except Exception as e:
         logger.error(str(e))
-        result =  {
-            "time": 0,
-            "count": 0,
-            "results": [],
-            "stats": []
-        }
-    
+        metrics.search_requests.inc(language=language, outcome="error")
+        result = empty_result(timer.timings)
+
+    timer.finish()
+    metrics.search_duration.observe(result["time"]["total"] / 1000, language=language)
+    return result
+
+
+def merge_results(results: dict, size: int) -> list:
+    # Scores are not comparable across indices, so min-max normalize them per language first
+    merged = []
+    for language, result in results.items():
+        scores = [hit["score"] for hit in result["results"]]
+        if not scores:
+            continue
+        low, high = min(scores), max(scores)
+        for hit in result["results"]:
+            normalized = (hit["score"] - low) / (high - low) if high > low else 1.0
+            merged.append({**hit, "language": language, "normalized_score": normalized})
+    merged.sort(key=lambda hit: hit["normalized_score"], reverse=True)
+    return merged[:size]
+
+
+def multi_search(
+    languages: List[str],
+    query_text: str,
+    text_weight: float = 0.0,
+    shingle_weight: float = 0.0,
+    trigram_weight: float = 0.0,
+    variant_text_weight: float = 0.0,
+    variant_shingle_weight: float = 0.0,
+    variant_trigram_weight: float = 0.0,
+    semantic_weight: float = 1.0,
+    variant_semantic_weight: float = 0.5,
+    books: Optional[List[str]] = None,
+    sources: Optional[List[str]] = None,
+    size: int = 50,
+    score_stats: bool = False,
+    merge: bool = False,
+    profile: bool = False,
+):
+    languages = list(dict.fromkeys(languages))
+    timer = StageTimer()
+    query_text = normalize_query(query_text)
+    timer.lap("normalize")
+    logger.info(f"Incoming query for '{query_text}' on {languages}")
+
+    # Each language has its own model, so embeddings are computed concurrently
+    embeddings = list(fanout_executor.map(lambda language: query_embedding(language, query_text), languages))
+    timer.lap("embed")
+    searches = []
+    selections = []
+    for language, embedding in zip(languages, embeddings):
+        index, language_sources, selected = resolve_index(language, sources)
+        selections.append(selected)
+        header = {"index": index, "ignore_unavailable": selected}
+        routing = index_manager.compute_routing(books)
+        if routing:
+            header["routing"] = routing
+        searches.append(header)
+        searches.append(compute_search_body(
+            query_text, embedding,
+            text_weight, shingle_weight, trigram_weight,
+            variant_text_weight, variant_shingle_weight, variant_trigram_weight,
+            semantic_weight, variant_semantic_weight,
+            books, language_sources, size, score_stats, profile, not selected,
+        ))
+    timer.lap("build")
+
+    try:
+        with admission.admit("elasticsearch", languages), metrics.elasticsearch_duration.time(operation="msearch"):
+            responses = es.msearch(searches=searches)["responses"]
+    except admission.Overloaded:
+        raise
+    except Exception as e:
+        logger.error(str(e))
+        responses = [{"error": str(e)}] * len(languages)
+    timer.lap("es")
+
+    results = {}
+    for language, response, selected in zip(languages, responses, selections):
+        if "error" in response:
+            logger.error(f"Search on {language} failed: {response['error']}")
+            metrics.search_requests.inc(language=language, outcome="error")
+            results[language] = empty_result({})
+        else:
+            metrics.search_requests.inc(language=language, outcome="ok")
+            results[language] = parse_response(response, {}, profile)
+            if selected:
+                results[language]["stats"]["unfiltered"] = get_language_facets(language)
+    result = {"time": timer.timings, "languages": results}
+    if merge:
+        result["merged"] = merge_results(results, size)
+    timer.lap("parse")
+    timer.finish()
+    for language in languages:
+        metrics.search_duration.observe(timer.timings["total"] / 1000, language=language)
     return result
\ No newline at end of file
@@ -0,0 +1,97 @@
+import logging
+import os
+import time
+from app.services import admission
+from app.services.db import get_connection
+from app.services.embedder import embedding_models, index_embeddings, query_embedding
+from app.services.index_manager import SUPPORTED_LANGUAGES
+from app.services.search_engine import search
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_BATCH_SIZES = [int(size) for size in os.getenv("WARMUP_BATCH_SIZES", "1,8,32").split(",") if size]
+WARMUP_QUERIES = int(os.getenv("WARMUP_QUERIES", "20"))
+WARMUP_DUMMY_TEXT = "warmup " * 32
+
+logger = logging.getLogger(__name__)
+warmup_state = {
+    "status": "pending" if WARMUP_ENABLED else "done",
+    "languages": {},
+    "duration": 0.0,
+}
+
+
+def is_ready() -> bool:
+    return warmup_state["status"] == "done"
+
+
+def warmup_models(language: str):
+    # Single-text path used by search() and batched path used by indexing
+    query_embedding(language, WARMUP_DUMMY_TEXT, admission.BATCH)
+    for batch_size in WARMUP_BATCH_SIZES:
+        index_embeddings(language, [WARMUP_DUMMY_TEXT] * batch_size)
+
+
+def get_sample_queries(language: str, limit: int) -> list[str]:
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT content FROM test_case
+                    WHERE language = %s
+                    ORDER BY id DESC
+                    LIMIT %s
+                """, (language, limit))
+                return [row[0] for row in cursor.fetchall()]
+    except Exception as e:
+        logger.warning(f"Could not fetch sample queries for {language}: {e}")
+        return []
+
+
+def warmup_index(language: str) -> tuple[int, int]:
+    # Default weights exercise every clause, the kNN graphs and the facet aggregations.
+    # Replayed as batch work, so real searches go first and warmup is never shed
+    queries = get_sample_queries(language, WARMUP_QUERIES) or [WARMUP_DUMMY_TEXT]
+    failed = 0
+    for query in queries:
+        result = search(
+            language, query,
+            text_weight=0.1, shingle_weight=0.1, trigram_weight=0.1,
+            variant_text_weight=0.25, variant_shingle_weight=0.25, variant_trigram_weight=0.25,
+            semantic_weight=0.9, variant_semantic_weight=0.45,
+            score_stats=True, priority=admission.BATCH,
+        )
+        # search() returns an empty result when Elasticsearch fails, without an "es" timing
+        if "es" not in result["time"]:
+            failed += 1
+    return len(queries) - failed, failed
+
+
+def run_warmup():
+    if not WARMUP_ENABLED:
+        logger.info("Warmup disabled")
+        return
+    logger.info("Starting warmup")
+    warmup_state["status"] = "running"
+    start = time.perf_counter()
+    for language in SUPPORTED_LANGUAGES:
+        if language not in embedding_models:
+            continue
+        language_start = time.perf_counter()
+        try:
+            warmup_models(language)
+            queries, failed = warmup_index(language)
+            warmup_state["languages"][language] = {
+                "queries": queries,
+                "failed": failed,
+                "duration": time.perf_counter() - language_start,
+            }
+            if failed:
+                logger.warning(f"Warmup for {language} completed with {queries} queries, {failed} failed")
+            else:
+                logger.info(f"Warmup for {language} completed with {queries} queries")
+        except Exception as e:
+            logger.error(f"Warmup for {language} failed: {e}")
+            warmup_state["languages"][language] = {"error": str(e)}
+    warmup_state["duration"] = time.perf_counter() - start
+    warmup_state["status"] = "done"
+    logger.info(f"Warmup completed in {warmup_state['duration']:.2f}s")
\ No newline at end of file
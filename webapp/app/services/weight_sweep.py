@@ -0,0 +1,278 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from elasticsearch import Elasticsearch
+from pathlib import Path
+from typing import Optional
+import hashlib
+import itertools
+import json
+import logging
+import os
+import time
+import numpy as np
+from app.services.collection_runner import RUN_CHUNK_SIZE, RUN_CONCURRENCY, RUN_RESULT_SIZE
+from app.services.db import get_connection
+from app.services.embedder import query_embeddings
+from app.services.jobs import Job, register_handler, submit_job
+from app.services import admission, index_manager, metrics
+from app.services.search_engine import SEMANTIC_K, SEMANTIC_NUM_CANDIDATES, compute_filters, normalize_query, resolve_index
+
+SWEEP_CACHE_DIR = Path("cache/sweeps")
+SWEEP_POOL_SIZE = int(os.getenv("SWEEP_POOL_SIZE", "200"))
+SWEEP_MAX_CONFIGURATIONS = int(os.getenv("SWEEP_MAX_CONFIGURATIONS", "10000"))
+SWEEP_CONFIGURATION_BLOCK = 256
+SWEEP_RECALL_KS = [1, 5, 10, 20, 50]
+
+# Clause order of the score matrices: three content fields, three variant fields and two kNN fields
+WEIGHT_NAMES = ["text", "shingle", "trigram", "variantText", "variantShingle", "variantTrigram", "semantic", "variantSemantic"]
+CLAUSE_FIELDS = [
+    "content.text", "content.shingle", "content.trigram",
+    "variant.content.text", "variant.content.shingle", "variant.content.trigram",
+    "embedding", "variant.embedding",
+]
+
+logger = logging.getLogger(__name__)
+es = Elasticsearch(os.getenv("ELASTIC_URL", "http://localhost:9200"))
+
+
+def compute_clause_searches(query_text: str, embedding: list, filters: list, pool_size: int) -> list[dict]:
+    # Each clause is searched on its own with unit weight, so its raw score can be re-weighted locally
+    searches = []
+    for field in CLAUSE_FIELDS:
+        if field.endswith("embedding"):
+            searches.append({
+                "knn": {
+                    "field": field,
+                    "query_vector": embedding,
+                    "k": SEMANTIC_K,
+                    "num_candidates": SEMANTIC_NUM_CANDIDATES,
+                    "filter": filters,
+                },
+                "size": SEMANTIC_K,
+                "_source": ["id"],
+            })
+            continue
+        clause = {"match": {field: query_text}}
+        if field.startswith("variant."):
+            clause = {"nested": {"path": "variant", "query": clause, "score_mode": "max"}}
+        searches.append({
+            "query": {"bool": {"must": [clause], "filter": filters}},
+            "size": pool_size,
+            "_source": ["id"],
+        })
+    return searches
+
+
+def fetch_cases(collection_id: int):
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT weights, sources, books FROM test_collection WHERE id = %s", (collection_id,))
+            collection = cursor.fetchone()
+            cursor.execute("""
+                SELECT tc.id, tc.content, tc.language, tc.target FROM test_case tc
+                JOIN test_collection_membership tcm ON tc.id = tcm.test_case_id
+                WHERE tcm.test_collection_id = %s
+                ORDER BY tc.language, tc.id
+            """, (collection_id,))
+            return collection, cursor.fetchall()
+
+
+def fetch_chunk_pools(language: str, cases: list, embeddings: list, sources, books, pool_size: int) -> list[tuple]:
+    index, language_sources, selected = resolve_index(language, sources)
+    filters = compute_filters(books, language_sources)
+    header = {"index": index, "ignore_unavailable": selected}
+    routing = index_manager.compute_routing(books)
+    if routing:
+        header["routing"] = routing
+    searches = []
+    for case, embedding in zip(cases, embeddings):
+        for body in compute_clause_searches(normalize_query(case[1]), embedding, filters, pool_size):
+            searches.append(header)
+            searches.append(body)
+    with admission.admit("elasticsearch", language, admission.BATCH), metrics.elasticsearch_duration.time(operation="msearch"):
+        responses = es.msearch(searches=searches)["responses"]
+
+    pools = []
+    for position, case in enumerate(cases):
+        rows = {}
+        scores = []
+        for clause, response in enumerate(responses[position * len(CLAUSE_FIELDS):(position + 1) * len(CLAUSE_FIELDS)]):
+            if "error" in response:
+                logger.error(f"Clause {WEIGHT_NAMES[clause]} of test case {case[0]} failed: {response['error']}")
+                continue
+            for hit in response["hits"]["hits"]:
+                row = rows.setdefault(hit["_source"]["id"], len(rows))
+                if row == len(scores):
+                    scores.append([0.0] * len(CLAUSE_FIELDS))
+                scores[row][clause] = hit["_score"]
+        pools.append((np.array(scores, dtype=np.float32).reshape(-1, len(CLAUSE_FIELDS)), rows.get(case[3], -1)))
+    return pools
+
+
+def pool_cache_path(collection_id: int, cases: list, sources, books, pool_size: int) -> Path:
+    signature = json.dumps([[list(case) for case in cases], sources, books, pool_size])
+    digest = hashlib.sha1(signature.encode("utf-8")).hexdigest()[:16]
+    return SWEEP_CACHE_DIR / f"collection_{collection_id}_{digest}.npz"
+
+
+def save_pools(path: Path, pools: list[tuple]):
+    os.makedirs(path.parent, exist_ok=True)
+    offsets = np.cumsum([0] + [len(scores) for scores, _ in pools])
+    scores = np.concatenate([scores for scores, _ in pools]) if pools else np.zeros((0, len(CLAUSE_FIELDS)), dtype=np.float32)
+    targets = np.array([target for _, target in pools], dtype=np.int64)
+    temporary_path = path.with_suffix(".tmp.npz")
+    np.savez_compressed(temporary_path, scores=scores, offsets=offsets, targets=targets)
+    temporary_path.replace(path)
+
+
+def load_pools(path: Path) -> list[tuple]:
+    with np.load(path) as data:
+        scores, offsets, targets = data["scores"], data["offsets"], data["targets"]
+    return [(scores[offsets[i]:offsets[i + 1]], int(target)) for i, target in enumerate(targets)]
+
+
+def collect_pools(sources, books, cases: list, pool_size: int, job: Optional[Job] = None) -> list[tuple]:
+    pools = []
+
+    def collect(future):
+        chunk_pools = future.result()
+        pools.extend(chunk_pools)
+        if job is not None:
+            job.advance(searched=len(chunk_pools))
+
+    # Same pipeline as collection runs: batched embeddings on this thread, bounded msearch chunks in flight
+    with ThreadPoolExecutor(max_workers=RUN_CONCURRENCY, thread_name_prefix="sweep") as executor:
+        pending = deque()
+        for language, language_cases in itertools.groupby(cases, key=lambda case: case[2]):
+            language_cases = list(language_cases)
+            for offset in range(0, len(language_cases), RUN_CHUNK_SIZE):
+                if job is not None:
+                    job.check_cancelled()
+                chunk = language_cases[offset:offset + RUN_CHUNK_SIZE]
+                embeddings = query_embeddings(language, [normalize_query(case[1]) for case in chunk])
+                if job is not None:
+                    job.advance(embedded=len(chunk))
+                pending.append(executor.submit(fetch_chunk_pools, language, chunk, embeddings, sources, books, pool_size))
+                while len(pending) >= RUN_CONCURRENCY * 2:
+                    collect(pending.popleft())
+        while pending:
+            collect(pending.popleft())
+    return pools
+
+
+def expand_configurations(base: dict, configurations: Optional[list[dict]], grid: Optional[dict[str, list[float]]]) -> list[dict]:
+    # Weights missing from a configuration or from the grid keep the value of the test collection
+    requested = set(grid or {}).union(*(configuration.keys() for configuration in configurations or []))
+    unknown = requested - set(WEIGHT_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown weights {', '.join(sorted(unknown))}")
+    base = {name: value for name, value in base.items() if name in WEIGHT_NAMES}
+    expanded = [{**base, **configuration} for configuration in configurations or []]
+    if grid:
+        names = [name for name in WEIGHT_NAMES if name in grid]
+        for values in itertools.product(*(grid[name] for name in names)):
+            expanded.append({**base, **dict(zip(names, values))})
+            if len(expanded) > SWEEP_MAX_CONFIGURATIONS:
+                break
+    if not expanded:
+        expanded = [dict(base)]
+    if len(expanded) > SWEEP_MAX_CONFIGURATIONS:
+        raise ValueError(f"Sweeps are limited to {SWEEP_MAX_CONFIGURATIONS} configurations")
+    return [{name: float(configuration.get(name, 0.0)) for name in WEIGHT_NAMES} for configuration in expanded]
+
+
+def rank_targets(scores: np.ndarray, target: int, weights: np.ndarray, size: int) -> np.ndarray:
+    # Mirrors the search query: multi_match keeps the best weighted field of content and of variants,
+    # the two groups and the kNN clauses are summed. Returns the rank of the target per configuration, -1 if missed
+    if target < 0:
+        return np.full(len(weights), -1)
+    content = (scores[None, :, 0:3] * weights[:, None, 0:3]).max(axis=2)
+    variant = (scores[None, :, 3:6] * weights[:, None, 3:6]).max(axis=2)
+    semantic = weights[:, 6:8] @ scores[:, 6:8].T
+    combined = content + variant + semantic
+    target_scores = combined[:, target]
+    ranks = (combined > target_scores[:, None]).sum(axis=1) + 1
+    return np.where((target_scores > 0) & (ranks <= size), ranks, -1)
+
+
+def evaluate(pools: list[tuple], configurations: list[dict], ks: list[int], size: int = RUN_RESULT_SIZE) -> list[dict]:
+    weights = np.array([[configuration[name] for name in WEIGHT_NAMES] for configuration in configurations], dtype=np.float32)
+    ks = np.array(ks)
+    total = len(pools)
+    reports = []
+    for start in range(0, len(weights), SWEEP_CONFIGURATION_BLOCK):
+        block = weights[start:start + SWEEP_CONFIGURATION_BLOCK]
+        ranks = np.stack([rank_targets(scores, target, block, size) for scores, target in pools], axis=1) if pools else np.full((len(block), 0), -1)
+        found = ranks > 0
+        reciprocal = np.where(found, 1.0 / np.where(found, ranks, 1), 0.0)
+        recall = (found[:, :, None] & (ranks[:, :, None] <= ks[None, None, :])).sum(axis=1)
+        found_count = found.sum(axis=1)
+        rank_sum = np.where(found, ranks, 0).sum(axis=1)
+        for offset, configuration in enumerate(configurations[start:start + SWEEP_CONFIGURATION_BLOCK]):
+            reports.append({
+                "weights": configuration,
+                "mrr": float(reciprocal[offset].sum() / total) if total else 0.0,
+                "recallAtK": {str(k): float(recall[offset, i] / total) if total else 0.0 for i, k in enumerate(ks)},
+                "meanRank": float(rank_sum[offset] / found_count[offset]) if found_count[offset] else 0.0,
+                "found": int(found_count[offset]),
+            })
+    return reports
+
+
+def sweep_collection(
+    collection_id: int,
+    configurations: Optional[list[dict]] = None,
+    grid: Optional[dict[str, list[float]]] = None,
+    pool_size: int = SWEEP_POOL_SIZE,
+    ks: Optional[list[int]] = None,
+    refresh: bool = False,
+    job: Optional[Job] = None,
+) -> dict:
+    collection, cases = fetch_cases(collection_id)
+    if collection is None:
+        raise ValueError(f"Test collection {collection_id} not found")
+    weights, sources, books = collection
+    configurations = expand_configurations(weights or {}, configurations, grid)
+    ks = ks or SWEEP_RECALL_KS
+    if job is not None:
+        job.advance(total=len(cases))
+
+    start = time.perf_counter()
+    path = pool_cache_path(collection_id, cases, sources, books, pool_size)
+    if path.exists() and not refresh:
+        logger.info(f"Loading candidate pools of collection {collection_id} from {path}")
+        pools = load_pools(path)
+        if job is not None:
+            job.advance(searched=len(pools))
+    else:
+        logger.info(f"Retrieving candidate pools of {len(cases)} test cases of collection {collection_id}")
+        pools = collect_pools(sources, books, cases, pool_size, job)
+        save_pools(path, pools)
+    retrieval = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reports = evaluate(pools, configurations, ks)
+    reports.sort(key=lambda report: (report["mrr"], report["recallAtK"][str(ks[-1])]), reverse=True)
+    evaluation = time.perf_counter() - start
+    logger.info(f"Evaluated {len(configurations)} configurations on collection {collection_id} in {evaluation:.1f}s")
+    return {
+        "total": len(cases),
+        "poolSize": pool_size,
+        "seconds": {"retrieval": retrieval, "evaluation": evaluation},
+        "best": reports[0],
+        "configurations": reports,
+    }
+
+
+def start_sweep(collection_id: int, **params) -> Optional[dict]:
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM test_collection WHERE id = %s", (collection_id,))
+            if cursor.fetchone() is None:
+                return None
+    job = submit_job("sweep_collection", collection_id=collection_id, **params)
+    return {"jobId": job.id}
+
+
+# Candidate pools are cached once retrieved, so a restarted sweep only repeats the missing work
+register_handler("sweep_collection", lambda job: sweep_collection(**job.params, job=job))
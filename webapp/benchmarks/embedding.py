@@ -0,0 +1,281 @@
+"""Throughput, latency and memory of the embedding code paths.
+
+Sweeps batch size, sequence length, pooling strategy, thread count, dtype and backend
+over three levels: SentenceTransformerAdapter.encode (tokenization, model and
+normalization), RetrieverModel.get_embeddings on tokenized batches, and
+pool_bert_output on a fixed encoder output. The tiny RetrieverModel of
+benchmarks.tiny_model is used by default, or a retriever model from a local folder or
+the Hugging Face cache (set HF_HUB_OFFLINE=1 to avoid downloads). Run from the webapp
+folder:
+
+    python -m benchmarks.embedding --batch-sizes 1,8,32 --seq-lengths 16,128 --threads 1,2,4
+    python -m benchmarks.embedding --model itserr/LaBERTa-W_VULG-S_VL-Synt --dtypes float32,bfloat16 --output laberta.json
+
+Backends are "default" (PyTorch picks the attention kernel), "math", "flash" and
+"efficient" (scaled dot product attention restricted to that kernel) and "compile"
+(the encoder wrapped in torch.compile). Combinations a machine does not support are
+reported as errors and the sweep goes on.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+import torch
+from transformers.modeling_outputs import BaseModelOutputWithPooling
+from app.services.retriever import SentenceTransformerAdapter, pool_bert_output
+from benchmarks.tiny_model import load_tiny_encoder
+
+TARGETS = ["adapter", "model", "pooling"]
+BACKENDS = ["default", "math", "flash", "efficient", "compile"]
+DTYPES = {"float32": torch.float32, "bfloat16": torch.bfloat16, "float16": torch.float16}
+POOLING_STRATEGIES = ["cls", "cls_tanh", "mean", "l2norm_sum"]
+WORDS = [
+    "in", "principio", "erat", "verbum", "et", "apud", "deum", "lux", "tenebris", "lucet",
+    "ἐν", "ἀρχῇ", "ἦν", "ὁ", "λόγος", "καὶ", "πρὸς", "τὸν", "θεόν", "φῶς",
+]
+
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+class MemorySampler:
+    # Peak resident memory while measuring, from /proc, as allocations by torch are not seen by tracemalloc
+    def __init__(self, device: str, interval: float = 0.005):
+        self.device = device
+        self.interval = interval
+        self.peak = 0
+        self.baseline = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def rss() -> Optional[int]:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return None
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, self.rss() or 0)
+
+    def __enter__(self):
+        if self.device.startswith("cuda"):
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            self.baseline = torch.cuda.memory_allocated()
+        else:
+            self.baseline = self.peak = self.rss() or 0
+            self.thread = threading.Thread(target=self.sample, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.thread:
+            self.stopped.set()
+            self.thread.join()
+            self.peak = max(self.peak, self.rss() or 0)
+        else:
+            self.peak = torch.cuda.max_memory_allocated()
+
+    def result(self) -> Optional[dict]:
+        if not self.baseline and not self.peak:
+            return None
+        return {"peak_mb": self.peak / 2**20, "increase_mb": max(0, self.peak - self.baseline) / 2**20}
+
+
+def make_texts(tokenizer, batch_size: int, seq_length: int, rng: random.Random) -> list[str]:
+    # Texts cut to seq_length tokens, counting the special tokens added by the tokenizer
+    texts = []
+    for _ in range(batch_size):
+        ids = tokenizer(" ".join(rng.choices(WORDS, k=seq_length)), add_special_tokens=False)["input_ids"]
+        texts.append(tokenizer.decode(ids[:max(1, seq_length - 2)]))
+    return texts
+
+
+def attention_context(backend: str):
+    if backend in ("default", "compile"):
+        return contextlib.nullcontext()
+    from torch.nn.attention import SDPBackend, sdpa_kernel
+    kernels = {"math": SDPBackend.MATH, "flash": SDPBackend.FLASH_ATTENTION, "efficient": SDPBackend.EFFICIENT_ATTENTION}
+    return sdpa_kernel(kernels[backend])
+
+
+def synchronize(device: str):
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def measure(call: Callable, args) -> tuple[list[float], Optional[dict]]:
+    for _ in range(args.warmup):
+        call()
+    synchronize(args.device)
+    latencies = []
+    with MemorySampler(args.device) as memory:
+        start = time.perf_counter()
+        while len(latencies) < args.iterations or time.perf_counter() - start < args.min_time:
+            began = time.perf_counter()
+            call()
+            synchronize(args.device)
+            latencies.append((time.perf_counter() - began) * 1000)
+    return latencies, memory.result()
+
+
+def summarize(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    def percentile(q: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+    return {
+        "mean": statistics.mean(samples),
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": samples[-1],
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_adapter(args, dtype: torch.dtype) -> SentenceTransformerAdapter:
+    if args.model == "tiny":
+        adapter = load_tiny_encoder(args.tiny_model_dir, args.device)
+    else:
+        adapter = SentenceTransformerAdapter(args.model, args.device)
+    adapter.model.to(dtype)
+    return adapter
+
+
+def build_call(target: str, adapter: SentenceTransformerAdapter, texts: list[str], inputs: dict, pooling: str):
+    model = adapter.model
+    if target == "adapter":
+        return lambda: adapter.encode(texts)
+    if target == "model":
+        def call():
+            with torch.inference_mode():
+                model.get_embeddings(**inputs)
+        return call
+    # The encoder output is computed once, so only the pooling itself is timed
+    with torch.inference_mode():
+        outputs = model.embedding_model_forward(**inputs)
+    mask = inputs["attention_mask"]
+    def call():
+        with torch.inference_mode():
+            pool_bert_output(pooling, BaseModelOutputWithPooling(
+                last_hidden_state=outputs.last_hidden_state, pooler_output=outputs.pooler_output,
+            ), mask)
+    return call
+
+
+def run_config(target: str, adapter: SentenceTransformerAdapter, texts: list[str], pooling: str, args) -> dict:
+    inputs = adapter.tokenizer(texts, padding=True, truncation=True, return_tensors="pt", max_length=512)
+    tokens = int(inputs["attention_mask"].sum())
+    inputs = {key: value.to(args.device) for key, value in inputs.items()}
+    adapter.model.set_pooling_strategy(pooling)
+    latencies, memory = measure(build_call(target, adapter, texts, inputs, pooling), args)
+    elapsed = sum(latencies) / 1000
+    return {
+        "iterations": len(latencies),
+        "tokens": tokens,
+        "sequences_per_second": len(latencies) * len(texts) / elapsed,
+        "tokens_per_second": len(latencies) * tokens / elapsed,
+        "latency_ms": summarize(latencies),
+        "memory": memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="tiny", help="'tiny' or the path or name of a retriever model")
+    parser.add_argument("--tiny-model-dir", default="cache/benchmarks/tiny-retriever")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--targets", default=",".join(TARGETS), help=f"Comma separated, of {', '.join(TARGETS)}")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--seq-lengths", default="16,64,256")
+    parser.add_argument("--pooling", default="cls,mean", help=f"Comma separated, of {', '.join(POOLING_STRATEGIES)}")
+    parser.add_argument("--threads", default=str(torch.get_num_threads()), help="Comma separated torch thread counts")
+    parser.add_argument("--dtypes", default="float32", help=f"Comma separated, of {', '.join(DTYPES)}")
+    parser.add_argument("--backends", default="default", help=f"Comma separated, of {', '.join(BACKENDS)}")
+    parser.add_argument("--warmup", type=int, default=3, help="Calls before measuring each configuration")
+    parser.add_argument("--iterations", type=int, default=20, help="Minimum measured calls per configuration")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Minimum seconds measured per configuration")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    targets = parse_list(args.targets)
+    batch_sizes = parse_list(args.batch_sizes, int)
+    seq_lengths = parse_list(args.seq_lengths, int)
+    strategies = parse_list(args.pooling)
+    thread_counts = parse_list(args.threads, int)
+    dtypes = parse_list(args.dtypes)
+    backends = parse_list(args.backends)
+    for name, values, choices in (("targets", targets, TARGETS), ("pooling", strategies, POOLING_STRATEGIES), ("dtypes", dtypes, DTYPES), ("backends", backends, BACKENDS)):
+        unknown = [value for value in values if value not in choices]
+        if unknown:
+            parser.error(f"Unknown {name}: {', '.join(unknown)}")
+
+    rng = random.Random(args.seed)
+    results = []
+    print(f"{'target':>8} {'backend':>9} {'dtype':>8} {'thr':>3} {'pooling':>10} {'batch':>5} {'len':>4} {'seq/s':>9} {'tok/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak MB':>8}")
+    for dtype in dtypes:
+        adapter = load_adapter(args, DTYPES[dtype])
+        encoder = adapter.model.embedding_model
+        max_length = min(512, adapter.model.config.embedding_config.max_position_embeddings)
+        texts = {(batch_size, seq_length): make_texts(adapter.tokenizer, batch_size, seq_length, rng)
+                 for batch_size in batch_sizes for seq_length in seq_lengths if seq_length <= max_length}
+        for backend in backends:
+            adapter.model.embedding_model = torch.compile(encoder) if backend == "compile" else encoder
+            for threads, pooling, (batch_size, seq_length), target in itertools.product(thread_counts, strategies, texts, targets):
+                torch.set_num_threads(threads)
+                row = {
+                    "target": target, "backend": backend, "dtype": dtype, "threads": threads,
+                    "pooling": pooling, "batch_size": batch_size, "seq_length": seq_length,
+                }
+                try:
+                    with attention_context(backend):
+                        row.update(run_config(target, adapter, texts[(batch_size, seq_length)], pooling, args))
+                except Exception as e:
+                    row["error"] = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+                results.append(row)
+                prefix = f"{target:>8} {backend:>9} {dtype:>8} {threads:>3} {pooling:>10} {batch_size:>5} {seq_length:>4}"
+                if "error" in row:
+                    print(f"{prefix} {row['error']}")
+                else:
+                    latency, memory = row["latency_ms"], row["memory"]
+                    peak = f"{memory['peak_mb']:>8.0f}" if memory else f"{'-':>8}"
+                    print(f"{prefix} {row['sequences_per_second']:>9.1f} {row['tokens_per_second']:>10.0f} {latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f} {peak}")
+        adapter.model.embedding_model = encoder
+        del adapter
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "commit": git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "torch": torch.__version__,
+                "cpu_count": os.cpu_count(),
+                "config": vars(args),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
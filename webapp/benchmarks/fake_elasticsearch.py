@@ -0,0 +1,147 @@
+"""Deterministic in-process stand-in for Elasticsearch.
+
+FakeNode replaces the HTTP node of the Elasticsearch client, so the real client, its
+serialization and the bulk helpers run unchanged. Searches, multi-searches and bulk
+requests sleep for a modelled latency and answer with synthetic documents that depend
+only on the request, so the same query log gives the same responses on every run.
+"""
+import json
+import random
+import threading
+import time
+import zlib
+from typing import Optional
+from elastic_transport import ApiResponseMeta, BaseNode, HttpHeaders
+from elastic_transport._node import NodeApiResponse
+from elasticsearch import Elasticsearch
+
+WORDS = ["logos", "theos", "arche", "ouranos", "ge", "phos", "hemera", "nyx", "pneuma", "hydor", "anthropos", "kosmos"]
+BOOKS = ["Gen", "Exod", "Lev", "Num", "Deut", "Matt", "Mark", "Luke", "John", "Acts"]
+
+
+class LatencyModel:
+    # Log-normal latencies around the median, drawn from a seeded generator
+    def __init__(self, search_ms: float = 15.0, msearch_overhead_ms: float = 2.0, bulk_ms: float = 20.0, bulk_doc_ms: float = 0.05, sigma: float = 0.3, seed: int = 42):
+        self.search_ms = search_ms
+        self.msearch_overhead_ms = msearch_overhead_ms
+        self.bulk_ms = bulk_ms
+        self.bulk_doc_ms = bulk_doc_ms
+        self.sigma = sigma
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self, median_ms: float) -> float:
+        with self.lock:
+            return median_ms * self.rng.lognormvariate(0, self.sigma) if self.sigma else median_ms
+
+    def search(self) -> float:
+        return self.draw(self.search_ms)
+
+    def msearch(self, searches: int) -> float:
+        # Searches of a request run in parallel on the cluster, the slowest one dominates
+        return max((self.search() for _ in range(searches)), default=0.0) + self.msearch_overhead_ms * searches
+
+    def bulk(self, documents: int) -> float:
+        return self.draw(self.bulk_ms) + self.bulk_doc_ms * documents
+
+
+class FakeCluster:
+    def __init__(self, documents: int = 100000, latency: Optional[LatencyModel] = None):
+        self.documents = documents
+        self.latency = latency or LatencyModel()
+        self.indexed = 0
+        self.lock = threading.Lock()
+
+    def document(self, number: int) -> dict:
+        rng = random.Random(number)
+        book = BOOKS[number % len(BOOKS)]
+        return {
+            "id": f"{book}.{number // 1000 + 1}.{number % 1000 + 1}",
+            "type": "verse",
+            "source": "synthetic",
+            "book": book,
+            "chapter": number // 1000 + 1,
+            "verse": number % 1000 + 1,
+            "content": " ".join(rng.choices(WORDS, k=12)),
+            "variant": [{"source": "variant", "content": " ".join(rng.choices(WORDS, k=12))}],
+        }
+
+    def search_response(self, body: dict, took: float) -> dict:
+        size = int(body.get("size", 10))
+        key = zlib.crc32(json.dumps(body.get("query"), sort_keys=True).encode("utf-8"))
+        rng = random.Random(key)
+        numbers = rng.sample(range(self.documents), min(size, self.documents))
+        scores = sorted((rng.uniform(1, 30) for _ in numbers), reverse=True)
+        aggregations = {}
+        aggs = body.get("aggs") or {}
+        if "unfiltered" in aggs:
+            buckets = [{"key": book, "doc_count": self.documents // len(BOOKS)} for book in BOOKS]
+            aggregations["unfiltered"] = {
+                "doc_count": self.documents,
+                "by_source": {"buckets": [{"key": "synthetic", "doc_count": self.documents, "by_book": {"buckets": buckets}}]},
+                "by_book": {"buckets": buckets},
+            }
+        if "score_stats" in aggs:
+            aggregations["score_stats"] = {"count": len(scores), "min": min(scores, default=0), "max": max(scores, default=0), "avg": sum(scores) / len(scores) if scores else 0}
+        if "score_percentiles" in aggs:
+            aggregations["score_percentiles"] = {"values": {}}
+        return {
+            "took": int(took),
+            "timed_out": False,
+            "hits": {
+                "total": {"value": self.documents, "relation": "eq"},
+                "max_score": scores[0] if scores else None,
+                "hits": [
+                    {"_index": "fake", "_id": self.document(number)["id"], "_score": score, "_source": self.document(number)}
+                    for number, score in zip(numbers, scores)
+                ],
+            },
+            "aggregations": aggregations,
+        }
+
+    def handle(self, method: str, path: str, body: Optional[bytes]) -> tuple[int, dict]:
+        if path.endswith("/_msearch"):
+            lines = [json.loads(line) for line in (body or b"").splitlines() if line.strip()]
+            bodies = lines[1::2]
+            took = self.latency.msearch(len(bodies))
+            time.sleep(took / 1000)
+            return 200, {"took": int(took), "responses": [{**self.search_response(search, took), "status": 200} for search in bodies]}
+        if path.endswith("/_search"):
+            took = self.latency.search()
+            time.sleep(took / 1000)
+            return 200, self.search_response(json.loads(body) if body else {}, took)
+        if path.endswith("/_bulk"):
+            lines = [json.loads(line) for line in (body or b"").splitlines() if line.strip()]
+            actions = [line for line in lines if len(line) == 1 and next(iter(line)) in ("index", "create", "update", "delete")]
+            took = self.latency.bulk(len(actions))
+            time.sleep(took / 1000)
+            with self.lock:
+                self.indexed += len(actions)
+            items = [{action: {"_index": meta.get("_index"), "_id": meta.get("_id"), "status": 201, "result": "created"}} for line in actions for action, meta in line.items()]
+            return 200, {"took": int(took), "errors": False, "items": items}
+        if path in ("", "/"):
+            return 200, {"name": "fake", "cluster_name": "fake", "version": {"number": "8.18.0"}, "tagline": "You Know, for Search"}
+        # Index management calls are acknowledged without effect
+        return 200, {"acknowledged": True}
+
+
+class FakeNode(BaseNode):
+    _CLIENT_META_HTTP_CLIENT = ("fake", "1.0")
+    cluster: Optional[FakeCluster] = None
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None) -> NodeApiResponse:
+        start = time.perf_counter()
+        status, response = self.cluster.handle(method, target.split("?")[0], body)
+        meta = ApiResponseMeta(
+            status=status,
+            http_version="1.1",
+            headers=HttpHeaders({"content-type": "application/json", "x-elastic-product": "Elasticsearch"}),
+            duration=time.perf_counter() - start,
+            node=self.config,
+        )
+        return NodeApiResponse(meta, b"" if method == "HEAD" else json.dumps(response).encode("utf-8"))
+
+
+def fake_elasticsearch(cluster: FakeCluster) -> Elasticsearch:
+    node_class = type("BoundFakeNode", (FakeNode,), {"cluster": cluster})
+    return Elasticsearch("http://fake-elasticsearch:9200", node_class=node_class)
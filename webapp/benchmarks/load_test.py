@@ -0,0 +1,355 @@
+"""Throughput and latency of searches, indexing and collection runs, per stage.
+
+Replays a query log at a fixed concurrency (closed loop) or at a fixed rate (open
+loop, latencies include queueing) against a local Elasticsearch or the deterministic
+in-process fake of benchmarks.fake_elasticsearch, with the production embedding models
+or a tiny randomly initialized RetrieverModel that needs no download. Run from the
+webapp folder:
+
+    python -m benchmarks.load_test search --backend fake --model tiny --concurrency 8 --requests 2000
+    python -m benchmarks.load_test search --queries logs/webapp.log --qps 50 --duration 60 --output search.json
+    python -m benchmarks.load_test run --backend fake --model tiny --batch-size 50 --compare search.json
+
+Query logs are JSON lines with a "query" (or "content", "text", "title") and an optional
+"language", plain text lines, or webapp logs, whose "Incoming query" entries are replayed.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from benchmarks.fake_elasticsearch import WORDS, FakeCluster, LatencyModel, fake_elasticsearch
+
+incoming_re = re.compile(r"Incoming query for '(.*)' on '(\w+)'")
+QUERY_FIELDS = ("query", "content", "text", "title")
+SEARCH_WEIGHTS = {
+    "text_weight": 0.1, "shingle_weight": 0.1, "trigram_weight": 0.1,
+    "variant_text_weight": 0.25, "variant_shingle_weight": 0.25, "variant_trigram_weight": 0.25,
+    "semantic_weight": 0.9, "variant_semantic_weight": 0.45,
+}
+
+
+def parse_query_line(line: str, default_language: str) -> Optional[tuple[str, str]]:
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        entry = line
+    if isinstance(entry, dict):
+        match = incoming_re.search(str(entry.get("message", "")))
+        if match:
+            return match.group(1), match.group(2)
+        query = next((entry[field] for field in QUERY_FIELDS if isinstance(entry.get(field), str)), None)
+        return (query, entry.get("language") or default_language) if query else None
+    if isinstance(entry, str):
+        match = incoming_re.search(entry)
+        if match:
+            return match.group(1), match.group(2)
+        return None if entry.startswith("[") else (entry, default_language)
+    return None
+
+
+def load_queries(args) -> list[tuple[str, str]]:
+    if args.queries:
+        with open(args.queries, encoding="utf-8", errors="replace") as f:
+            queries = [query for query in (parse_query_line(line, args.language) for line in f) if query]
+        if args.only_language:
+            queries = [query for query in queries if query[1] == args.language]
+        if not queries:
+            sys.exit(f"No queries found in {args.queries}")
+        return queries
+    rng = random.Random(args.seed)
+    return [(" ".join(rng.choices(WORDS, k=rng.randint(2, 8))), args.language) for _ in range(1000)]
+
+
+def setup_backend(args) -> Optional[FakeCluster]:
+    from app.services import collection_runner, data_indexer, index_manager, result_store, search_engine
+    if args.backend != "fake":
+        return None
+    cluster = FakeCluster(args.fake_documents, LatencyModel(
+        search_ms=args.fake_search_ms, bulk_ms=args.fake_bulk_ms, sigma=args.fake_sigma, seed=args.seed,
+    ))
+    client = fake_elasticsearch(cluster)
+    for module in (collection_runner, data_indexer, index_manager, result_store, search_engine):
+        module.es = client
+    return cluster
+
+
+def setup_model(args, languages: set):
+    from app.services.embedder import embedding_models
+    if args.model != "tiny":
+        return
+    from benchmarks.tiny_model import load_tiny_encoder
+    encoder = load_tiny_encoder(args.tiny_model_dir)
+    for language in languages:
+        embedding_models.setdefault(language, {
+            "load": None, "index_prefix": "", "index_suffix": "", "query_prefix": "", "query_suffix": "",
+        })["encoder"] = encoder
+
+
+def search_operation(args) -> Callable:
+    if args.server:
+        return http_search_operation(args)
+    from app.services.search_engine import search
+
+    def operation(batch: list) -> dict:
+        query, language = batch[0]
+        result = search(language, query, size=args.size, **SEARCH_WEIGHTS)
+        if not result["results"] and "es" not in result["time"]:
+            raise RuntimeError("search failed")
+        return {stage: duration for stage, duration in result["time"].items() if stage != "total"}
+    return operation
+
+
+def http_search_operation(args) -> Callable:
+    import urllib.request
+
+    def operation(batch: list) -> dict:
+        query, language = batch[0]
+        request = urllib.request.Request(
+            f"{args.server.rstrip('/')}/api/search/{language}",
+            data=json.dumps({"query": query, "size": args.size, **SEARCH_WEIGHTS}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            timing = response.headers.get("Server-Timing", "")
+        stages = {}
+        for part in timing.split(","):
+            name, _, duration = part.strip().partition(";dur=")
+            if duration and name != "total":
+                stages[name] = float(duration)
+        return stages
+    return operation
+
+
+def index_operation(args, cluster: Optional[FakeCluster]) -> Callable:
+    from app.services.data_indexer import attach_embeddings, compute_embeddings, send_documents
+    source = cluster or FakeCluster()
+    counter = itertools.count()
+
+    def operation(batch: list) -> dict:
+        language = batch[0][1]
+        documents = [source.document(next(counter)) for _ in batch]
+        start = time.perf_counter()
+        entries = compute_embeddings(language, documents)
+        embedded = time.perf_counter()
+        documents = [attach_embeddings(document, entry) for document, entry in zip(documents, entries)]
+        report = send_documents(language, args.index or f"benchmark-{language}", documents)
+        if report["failed"]:
+            raise RuntimeError(f"{report['failed']} documents failed")
+        return {"embed": (embedded - start) * 1000, "bulk": (time.perf_counter() - embedded) * 1000}
+    return operation
+
+
+def run_operation(args) -> Callable:
+    from app.services.collection_runner import search_chunk
+    from app.services.embedder import query_embeddings
+
+    def operation(batch: list) -> dict:
+        language = batch[0][1]
+        cases = [(position, query, language, None) for position, (query, _) in enumerate(batch)]
+        start = time.perf_counter()
+        embeddings = query_embeddings(language, [case[1] for case in cases])
+        embedded = time.perf_counter()
+        results = search_chunk(language, cases, embeddings, {}, None, None)
+        if all(not result["results"] for result in results):
+            raise RuntimeError("msearch failed")
+        return {"embed": (embedded - start) * 1000, "msearch": (time.perf_counter() - embedded) * 1000}
+    return operation
+
+
+def make_batches(queries: list, batch_size: int, seed: int):
+    # Batches keep to one language, like the chunks of a collection run
+    rng = random.Random(seed)
+    while True:
+        language = rng.choice(queries)[1]
+        pool = [query for query in queries if query[1] == language]
+        yield [rng.choice(pool) for _ in range(batch_size)]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = 0
+        self.completed = 0
+        self.lock = threading.Lock()
+
+    def record(self, stages: dict, latency: float):
+        with self.lock:
+            self.completed += 1
+            for stage, duration in {**stages, "latency": latency}.items():
+                self.samples.setdefault(stage, []).append(duration)
+
+    def fail(self):
+        with self.lock:
+            self.errors += 1
+
+
+def execute(operation: Callable, batch: list, recorder: Recorder, scheduled: float):
+    try:
+        stages = operation(batch)
+    except Exception as e:
+        recorder.fail()
+        print(f"Request failed: {e}", file=sys.stderr)
+        return
+    recorder.record(stages, (time.perf_counter() - scheduled) * 1000)
+
+
+def run_closed_loop(operation: Callable, batches, args, recorder: Recorder):
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    remaining = itertools.count()
+
+    def worker():
+        while True:
+            with lock:
+                if deadline is None and next(remaining) >= args.requests or deadline and time.perf_counter() >= deadline:
+                    return
+                batch = next(batches)
+            execute(operation, batch, recorder, time.perf_counter())
+
+    threads = [threading.Thread(target=worker, name=f"load-{index}") for index in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open_loop(operation: Callable, batches, args, recorder: Recorder):
+    # Requests are sent on schedule whether or not earlier ones completed
+    total = int(args.qps * args.duration) if args.duration else args.requests
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="load") as executor:
+        start = time.perf_counter()
+        for index in range(total):
+            scheduled = start + index / args.qps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(execute, operation, next(batches), recorder, scheduled)
+
+
+def summarize(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    def percentile(q: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+    return {
+        "count": len(samples),
+        "mean": statistics.mean(samples),
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": samples[-1],
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"Compared with {baseline_path} ({baseline.get('commit') or 'unknown commit'}):")
+    print(f"{'throughput':>12}: {baseline['throughput']:.1f} -> {results['throughput']:.1f} req/s")
+    for stage, stats in results["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before:
+            change = (stats["p95"] / before["p95"] - 1) * 100 if before["p95"] else 0.0
+            print(f"{stage:>12}: p95 {before['p95']:.2f} -> {stats['p95']:.2f} ms ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("target", choices=["search", "index", "run"])
+    parser.add_argument("--backend", choices=["fake", "elastic"], default="fake", help="Fake in-process Elasticsearch or ELASTIC_URL")
+    parser.add_argument("--model", choices=["tiny", "real"], default="tiny", help="Tiny random RetrieverModel or the configured models")
+    parser.add_argument("--tiny-model-dir", default="cache/benchmarks/tiny-retriever")
+    parser.add_argument("--server", help="Send searches to a running webapp at this URL instead of calling the service")
+    parser.add_argument("--queries", help="Query log to replay")
+    parser.add_argument("--language", default="greek", help="Language of queries without one")
+    parser.add_argument("--only-language", action="store_true", help="Only replay queries of --language")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--qps", type=float, help="Open loop at this rate instead of a closed loop")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--duration", type=float, help="Seconds to run instead of a number of requests")
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent before measuring")
+    parser.add_argument("--batch-size", type=int, default=50, help="Documents or test cases per request for index and run")
+    parser.add_argument("--size", type=int, default=50)
+    parser.add_argument("--index", help="Index written by the index target (default benchmark-<language>)")
+    parser.add_argument("--fake-documents", type=int, default=100000)
+    parser.add_argument("--fake-search-ms", type=float, default=15.0)
+    parser.add_argument("--fake-bulk-ms", type=float, default=20.0)
+    parser.add_argument("--fake-sigma", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON of a previous run to compare with")
+    args = parser.parse_args()
+    if args.target == "index" and args.backend == "elastic" and not args.index:
+        parser.error("--index is required to index into a real Elasticsearch")
+
+    queries = load_queries(args)
+    cluster = None if args.server else setup_backend(args)
+    if not args.server:
+        setup_model(args, {language for _, language in queries})
+    if args.target == "search":
+        operation, batch_size = search_operation(args), 1
+    elif args.target == "index":
+        operation, batch_size = index_operation(args, cluster), args.batch_size
+    else:
+        operation, batch_size = run_operation(args), args.batch_size
+    batches = make_batches(queries, batch_size, args.seed)
+
+    print(f"Warming up with {args.warmup} requests")
+    for _ in range(args.warmup):
+        execute(operation, next(batches), Recorder(), time.perf_counter())
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    if args.qps:
+        run_open_loop(operation, batches, args, recorder)
+    else:
+        run_closed_loop(operation, batches, args, recorder)
+    elapsed = time.perf_counter() - start
+
+    results = {
+        "target": args.target,
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "elapsed": elapsed,
+        "completed": recorder.completed,
+        "errors": recorder.errors,
+        "throughput": recorder.completed / elapsed if elapsed else 0.0,
+        "items_per_second": recorder.completed * batch_size / elapsed if elapsed else 0.0,
+        "stages": {stage: summarize(samples) for stage, samples in recorder.samples.items()},
+    }
+    print(f"{recorder.completed} requests in {elapsed:.1f}s, {results['throughput']:.1f} req/s, {recorder.errors} errors")
+    for stage, stats in results["stages"].items():
+        print(f"{stage:>12}: p50 {stats['p50']:.2f} ms, p95 {stats['p95']:.2f} ms, p99 {stats['p99']:.2f} ms")
+    if args.compare:
+        compare(results, args.compare)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
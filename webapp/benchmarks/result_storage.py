@@ -0,0 +1,203 @@
+"""Latency of the listing and metrics queries on millions of synthetic result cases.
+
+Loads the schema into a scratch Postgres schema with primary keys only, fills it with
+synthetic test cases, runs and comments, then times the same queries three times:
+without secondary indexes, with the indexes of assets/postgres/schema.sql, and with
+result_case partitioned by result collection. Run from the webapp folder:
+
+    python -m benchmarks.result_storage --runs 400 --cases-per-run 5000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import time
+import psycopg2
+from app.services import migrations
+
+SCHEMA = "benchmark_result_storage"
+index_re = re.compile(r"^CREATE INDEX .*?;$", re.MULTILINE)
+
+QUERIES = {
+    "result case page": ("""
+        SELECT rc.id, rc.test_case_id, tc.source, tc.content, tc.language, tc.target, rc.rank_of_expected
+        FROM test_case tc JOIN result_case rc ON tc.id = rc.test_case_id
+        WHERE rc.result_collection_id = %(run)s AND (%(after)s::integer IS NULL OR rc.id > %(after)s)
+        ORDER BY rc.id LIMIT 101
+    """, False),
+    "result case deep page": ("""
+        SELECT rc.id, rc.test_case_id, tc.source, tc.content, tc.language, tc.target, rc.rank_of_expected
+        FROM test_case tc JOIN result_case rc ON tc.id = rc.test_case_id
+        WHERE rc.result_collection_id = %(run)s AND (%(after)s::integer IS NULL OR rc.id > %(after)s)
+        ORDER BY rc.id LIMIT 101
+    """, True),
+    "result case count": ("SELECT COUNT(*) FROM result_case WHERE result_collection_id = %(run)s", False),
+    "result case": ("""
+        SELECT tc.source, tc.content, rc.hit_ids, rc.hit_scores
+        FROM test_case tc JOIN result_case rc ON tc.id = rc.test_case_id
+        WHERE rc.id = %(case)s AND rc.result_collection_id = %(run)s
+    """, False),
+    "metrics histogram": ("""
+        SELECT result_collection_id, rank_of_expected, COUNT(*)
+        FROM result_case WHERE result_collection_id = ANY(ARRAY[%(run)s])
+        GROUP BY result_collection_id, rank_of_expected
+    """, False),
+    "runs of a collection": ("""
+        SELECT rc.id, rc.timestamp, m.total, m.mrr
+        FROM result_collection rc LEFT JOIN result_metrics m ON m.result_collection_id = rc.id
+        WHERE rc.test_collection_id = %(collection)s ORDER BY rc.timestamp DESC
+    """, False),
+    "collection members": ("SELECT test_case_id FROM test_collection_membership WHERE test_collection_id = %(collection)s", False),
+    "pending cases": ("""
+        SELECT tc.id FROM test_case tc
+        JOIN test_collection_membership tcm ON tc.id = tcm.test_case_id
+        WHERE tcm.test_collection_id = %(collection)s
+        AND NOT EXISTS (SELECT 1 FROM result_case r WHERE r.test_case_id = tc.id AND r.result_collection_id = %(run)s)
+    """, False),
+    "tag filter": ("SELECT id FROM test_case WHERE tags @> ARRAY[%(tag)s] ORDER BY id DESC LIMIT 101", False),
+    "case comments": ("SELECT * FROM comment WHERE result_case_id = %(case)s ORDER BY created_at", False),
+}
+
+
+def connect():
+    return psycopg2.connect(
+        dbname=os.getenv("POSTGRES_DB", "search-engine"),
+        user=os.getenv("POSTGRES_USER", "user"),
+        password=os.getenv("POSTGRES_PASSWORD", "password"),
+        host=os.getenv("POSTGRES_HOST", "localhost"),
+        port=os.getenv("POSTGRES_PORT", 5432),
+        options=f"-c search_path={SCHEMA}",
+    )
+
+
+def create_schema(cursor, path: str):
+    with open(path, encoding="utf-8") as f:
+        schema = f.read()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    cursor.execute(index_re.sub("", schema))
+    return index_re.findall(schema)
+
+
+def load(cursor, args):
+    test_cases = args.test_cases
+    cases = args.runs * args.cases_per_run
+    cursor.execute("SELECT setseed(%s)", (args.seed / 2 ** 31,))
+    cursor.execute("""
+        INSERT INTO test_case (source, content, context, language, target, tags)
+        SELECT 'Gen ' || i, 'query ' || i, NULL, 'greek', 'doc' || (i * 7 %% 100000),
+               ARRAY['tag' || (i %% 20), 'tag' || (20 + i %% 7)]
+        FROM generate_series(1, %s) i
+    """, (test_cases,))
+    cursor.execute("""
+        INSERT INTO test_collection (name, description, weights)
+        SELECT 'collection ' || i, NULL, '{}'::JSONB FROM generate_series(1, %s) i
+    """, (args.collections,))
+    cursor.execute("""
+        INSERT INTO test_collection_membership (test_case_id, test_collection_id)
+        SELECT i, 1 + i %% %s FROM generate_series(1, %s) i
+    """, (args.collections, test_cases))
+    cursor.execute("""
+        INSERT INTO result_collection (test_collection_id, weights, timestamp)
+        SELECT 1 + i %% %s, '{}'::JSONB, NOW() - (%s - i) * INTERVAL '1 hour' FROM generate_series(1, %s) i
+    """, (args.collections, args.runs, args.runs))
+    print(f"Loading {cases} result cases")
+    cursor.execute("""
+        INSERT INTO result_case (test_case_id, result_collection_id, rank_of_expected, hit_ids, hit_scores, hit_count, took, score_stats)
+        SELECT 1 + (g - 1) %% %s, 1 + (g - 1) / %s,
+               CASE WHEN random() < 0.2 THEN -1 ELSE 1 + floor(power(random(), 3) * 50)::INTEGER END,
+               ARRAY(SELECT 'doc' || (g + k) FROM generate_series(1, 10) k),
+               ARRAY(SELECT (1 - k / 20.0)::REAL FROM generate_series(1, 10) k),
+               1000, 12.5, '{}'::JSONB
+        FROM generate_series(1, %s) g
+    """, (test_cases, args.cases_per_run, cases))
+    cursor.execute("""
+        INSERT INTO comment (result_collection_id, result_case_id, content, author)
+        SELECT 1 + (g - 1) / %s, g, 'comment', 'benchmark'
+        FROM generate_series(1, %s, %s) g
+    """, (args.cases_per_run, cases, max(1, cases // args.comments)))
+
+
+def measure(cursor, args) -> dict:
+    results = {}
+    for label, (query, deep) in QUERIES.items():
+        rng = random.Random(args.seed)
+        latencies = []
+        for iteration in range(args.warmup + args.queries):
+            run = rng.randint(1, args.runs)
+            params = {
+                "run": run,
+                "after": (run - 1) * args.cases_per_run + args.cases_per_run // 2 if deep else None,
+                "case": (run - 1) * args.cases_per_run + rng.randint(1, args.cases_per_run),
+                "collection": 1 + run % args.collections,
+                "tag": f"tag{rng.randrange(27)}",
+            }
+            start = time.perf_counter()
+            cursor.execute(query, params)
+            cursor.fetchall()
+            elapsed = (time.perf_counter() - start) * 1000
+            if iteration >= args.warmup:
+                latencies.append(elapsed)
+        latencies.sort()
+        results[label] = {
+            "p50": statistics.median(latencies),
+            "p95": latencies[int(len(latencies) * 0.95) - 1],
+            "mean": statistics.mean(latencies),
+        }
+        print(f"{label:>24}: p50 {results[label]['p50']:.2f} ms, p95 {results[label]['p95']:.2f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schema", default=os.path.join(os.path.dirname(migrations.MIGRATIONS_DIR), "schema.sql"))
+    parser.add_argument("--runs", type=int, default=400)
+    parser.add_argument("--cases-per-run", type=int, default=5000)
+    parser.add_argument("--test-cases", type=int, default=20000)
+    parser.add_argument("--collections", type=int, default=20)
+    parser.add_argument("--comments", type=int, default=10000)
+    parser.add_argument("--partition-size", type=int, default=migrations.RESULT_CASE_PARTITION_SIZE)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark schema")
+    args = parser.parse_args()
+    migrations.RESULT_CASE_PARTITION_SIZE = args.partition_size
+
+    conn = connect()
+    conn.autocommit = True
+    results = {"config": vars(args), "results": {}}
+    try:
+        with conn.cursor() as cursor:
+            indexes = create_schema(cursor, args.schema)
+            load(cursor, args)
+            cursor.execute("VACUUM ANALYZE")
+
+            print("Primary keys only")
+            results["results"]["primary keys"] = measure(cursor, args)
+
+            print("With indexes")
+            for index in indexes:
+                cursor.execute(index)
+            cursor.execute("VACUUM ANALYZE")
+            results["results"]["indexes"] = measure(cursor, args)
+
+            print(f"Partitioned by blocks of {args.partition_size} result collections")
+            migrations.partition_result_case(cursor)
+            cursor.execute("VACUUM ANALYZE")
+            results["results"]["partitioned"] = measure(cursor, args)
+    finally:
+        if not args.keep:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
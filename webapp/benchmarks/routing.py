@@ -0,0 +1,131 @@
+"""Latency of book-filtered and unfiltered searches with and without custom routing.
+
+Creates two temporary multi-shard indices with the same synthetic documents, one
+routed by book and one with default routing, and times the same hybrid queries
+against both. Run from the webapp folder against a local Elasticsearch:
+
+    python -m benchmarks.routing --shards 8 --books 40 --docs-per-book 2000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from elasticsearch import Elasticsearch, helpers
+
+DIMENSIONS = 64
+WORDS = ["logos", "theos", "arche", "ouranos", "ge", "phos", "hemera", "nyx", "pneuma", "hydor", "anthropos", "kosmos"]
+
+
+def create_index(es: Elasticsearch, name: str, shards: int, routed: bool):
+    mappings = {
+        "properties": {
+            "book": {"type": "keyword"},
+            "content": {"type": "text"},
+            "embedding": {"type": "dense_vector", "dims": DIMENSIONS, "index": True, "similarity": "cosine"},
+        }
+    }
+    if routed:
+        mappings["_routing"] = {"required": True}
+    es.indices.delete(index=name, ignore_unavailable=True)
+    es.indices.create(index=name, mappings=mappings, settings={"number_of_shards": shards, "number_of_replicas": 0})
+
+
+def generate_documents(books: int, docs_per_book: int, seed: int):
+    rng = random.Random(seed)
+    for book in range(books):
+        for verse in range(docs_per_book):
+            yield {
+                "id": f"book{book}.{verse}",
+                "book": f"book{book}",
+                "content": " ".join(rng.choices(WORDS, k=12)),
+                "embedding": [rng.uniform(-1, 1) for _ in range(DIMENSIONS)],
+            }
+
+
+def load(es: Elasticsearch, name: str, routed: bool, args):
+    def actions():
+        for document in generate_documents(args.books, args.docs_per_book, args.seed):
+            action = {"_index": name, "_id": document["id"], "_source": document}
+            if routed:
+                action["_routing"] = document["book"]
+            yield action
+    helpers.bulk(es, actions(), chunk_size=1000)
+    es.indices.refresh(index=name)
+    es.indices.forcemerge(index=name, max_num_segments=1)
+
+
+def query(rng: random.Random, books: list[str]) -> dict:
+    filters = [{"terms": {"book": books}}] if books else []
+    vector = [rng.uniform(-1, 1) for _ in range(DIMENSIONS)]
+    return {
+        "query": {"bool": {"should": [{"match": {"content": " ".join(rng.choices(WORDS, k=4))}}], "filter": filters}},
+        "knn": {"field": "embedding", "query_vector": vector, "k": 11, "num_candidates": 1000, "filter": filters},
+        "size": 50,
+    }
+
+
+def measure(es: Elasticsearch, name: str, args, books_per_query: int, routed: bool) -> dict:
+    rng = random.Random(args.seed)
+    latencies = []
+    took = []
+    for iteration in range(args.warmup + args.queries):
+        books = [f"book{b}" for b in rng.sample(range(args.books), books_per_query)] if books_per_query else []
+        routing = ",".join(books) if routed and books else None
+        start = time.perf_counter()
+        response = es.search(index=name, routing=routing, request_cache=False, **query(rng, books))
+        elapsed = (time.perf_counter() - start) * 1000
+        if iteration >= args.warmup:
+            latencies.append(elapsed)
+            took.append(response["took"])
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "mean": statistics.mean(latencies),
+        "took_mean": statistics.mean(took),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("ELASTIC_URL", "http://localhost:9200"))
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--books", type=int, default=40)
+    parser.add_argument("--docs-per-book", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark indices")
+    args = parser.parse_args()
+
+    es = Elasticsearch(args.url, request_timeout=120)
+    indices = {"default": "benchmark-routing-default", "routed": "benchmark-routing-book"}
+    for kind, name in indices.items():
+        print(f"Loading {name}")
+        create_index(es, name, args.shards, kind == "routed")
+        load(es, name, kind == "routed", args)
+
+    results = {"config": vars(args), "results": {}}
+    for books_per_query in (0, 1, 3):
+        for kind, name in indices.items():
+            if kind == "routed" and not books_per_query:
+                continue
+            label = f"{kind}, {books_per_query or 'no'} book filter"
+            results["results"][label] = measure(es, name, args, books_per_query, kind == "routed")
+            stats = results["results"][label]
+            print(f"{label:>30}: p50 {stats['p50']:.1f} ms, p95 {stats['p95']:.1f} ms, p99 {stats['p99']:.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if not args.keep:
+        for name in indices.values():
+            es.indices.delete(index=name, ignore_unavailable=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Small randomly initialized RetrieverModel, saved locally so benchmarks download nothing."""
+import os
+import string
+from transformers import BertTokenizer
+from app.services.retriever import RetrieverConfig, RetrieverModel, SentenceTransformerAdapter
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+# Texts are lowercased and stripped of accents by the tokenizer, so single letters cover Greek and Latin
+LETTERS = list(string.ascii_lowercase) + [chr(code) for code in range(ord("α"), ord("ω") + 1)] + list(string.digits)
+
+
+def build_vocabulary() -> list[str]:
+    return SPECIAL_TOKENS + list(string.punctuation) + LETTERS + [f"##{letter}" for letter in LETTERS]
+
+
+def build_tiny_model(
+    path: str,
+    hidden_size: int = 64,
+    layers: int = 2,
+    heads: int = 2,
+    intermediate_size: int = 128,
+    max_length: int = 512,
+    pooling_strategy: str = "cls",
+    seed: int = 42,
+) -> str:
+    # Saved like a released model, so it is loaded through the same code paths
+    import torch
+    torch.manual_seed(seed)
+    os.makedirs(path, exist_ok=True)
+    vocabulary_path = os.path.join(path, "vocab.txt")
+    with open(vocabulary_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(build_vocabulary()) + "\n")
+    tokenizer = BertTokenizer(vocabulary_path, model_max_length=max_length)
+    tokenizer.save_pretrained(path)
+    config = RetrieverConfig(
+        pooling_strategy=pooling_strategy,
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        num_hidden_layers=layers,
+        num_attention_heads=heads,
+        intermediate_size=intermediate_size,
+        max_position_embeddings=max_length,
+    )
+    # A local BERT configuration is rebuilt as is on load, and its tokenizer is read from the model folder
+    config.embedding_config._is_latin_bert = True
+    config.embedding_config._name_or_path = path
+    RetrieverModel(config).save_pretrained(path)
+    return path
+
+
+def load_tiny_encoder(path: str, device: str = "cpu", **kwargs) -> SentenceTransformerAdapter:
+    if not os.path.exists(os.path.join(path, "config.json")):
+        build_tiny_model(path, **kwargs)
+    return SentenceTransformerAdapter(path, device)
@@ -0,0 +1,104 @@
+import json
+import pytest
+from app.services import data_indexer, index_manager
+from app.services.jobs import Job
+
+DOCUMENT_COUNT = 5
+
+
+class FakeIndices:
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def exists(self, index):
+        return index in self.cluster.documents
+
+    def refresh(self, index):
+        pass
+
+    def delete(self, index, ignore_unavailable=False):
+        self.cluster.deleted.append(index)
+        self.cluster.documents.pop(index, None)
+
+
+class FakeElasticsearch:
+    def __init__(self):
+        self.documents = {}
+        self.deleted = []
+        self.swaps = []
+        self.indices = FakeIndices(self)
+
+    def count(self, index):
+        return {"count": len(self.documents.get(index, {}))}
+
+
+def make_document(position: int) -> dict:
+    return {
+        "id": f"gottingen.genesis.1.{position}",
+        "type": "biblical-verse",
+        "source": "gottingen",
+        "book": "genesis",
+        "chapter": "1",
+        "verse": str(position),
+        "content": f"verse {position}",
+        "variant": [],
+    }
+
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dataset_dir = tmp_path / "assets" / "datasets" / "greek"
+    dataset_dir.mkdir(parents=True)
+    (dataset_dir / "gottingen.json").write_text(json.dumps([make_document(i) for i in range(DOCUMENT_COUNT)]), encoding="utf-8")
+
+    es = FakeElasticsearch()
+
+    def send_chunk(chunk):
+        for action in chunk:
+            es.documents.setdefault(action["_index"], {})[action["_id"]] = action["_source"]
+        return [(True, {}) for _ in chunk]
+
+    def iter_embedded_documents(language, dataset_name, documents, skip=0, job=None):
+        return (document for position, document in enumerate(documents) if position >= skip)
+
+    monkeypatch.setattr(data_indexer, "es", es)
+    monkeypatch.setattr(data_indexer, "send_chunk", send_chunk)
+    monkeypatch.setattr(data_indexer, "iter_embedded_documents", iter_embedded_documents)
+    monkeypatch.setattr(index_manager, "is_routing_enabled", lambda: False)
+    monkeypatch.setattr(index_manager, "get_alias_indices", lambda alias: [])
+    monkeypatch.setattr(index_manager, "swap_dataset_alias", lambda language, base, new_index: es.swaps.append(new_index))
+    monkeypatch.setattr(index_manager, "delete_old_versions", lambda base, keep: [])
+    return es
+
+
+def test_resumed_dataset_index_is_swapped(cluster):
+    # The job was interrupted after committing the first three documents to its new index
+    new_index = "greek__gottingen_v2"
+    cluster.documents[new_index] = {make_document(i)["id"]: make_document(i) for i in range(3)}
+    job = Job("index_dataset", "greek", {"dataset": "gottingen"})
+    job.checkpoint = {"gottingen:index": new_index, "gottingen": 3, "gottingen:indexed": 3}
+
+    result = data_indexer.replace_dataset_index("greek", "gottingen", job=job)
+
+    assert result["index"] == new_index
+    assert result["indexed"] == DOCUMENT_COUNT - 3
+    assert cluster.count(index=new_index)["count"] == DOCUMENT_COUNT
+    assert cluster.swaps == [new_index]
+    assert new_index not in cluster.deleted
+    assert job.checkpoint["gottingen"] is True
+    assert job.checkpoint["gottingen:indexed"] == DOCUMENT_COUNT
+
+
+def test_incomplete_dataset_index_is_not_swapped(cluster):
+    new_index = "greek__gottingen_v2"
+    cluster.documents[new_index] = {make_document(0)["id"]: make_document(0)}
+    job = Job("index_dataset", "greek", {"dataset": "gottingen"})
+    # The checkpoint claims more documents than the index actually holds
+    job.checkpoint = {"gottingen:index": new_index, "gottingen": 3, "gottingen:indexed": 3}
+
+    result = data_indexer.replace_dataset_index("greek", "gottingen", job=job)
+
+    assert not result["success"]
+    assert cluster.swaps == []
+    assert new_index in cluster.deleted